@@ -6,26 +6,110 @@ Contains:
 - RiskAssessmentAgent
 - AdvisoryAgent
 - EmergencyAgent
+- CombinedAgent: all three outputs from one LLM call (low-latency tier)
 
 Notes:
+- The agents are async-native: ahandle() / _acall_llm() / _astream_llm() run on the
+  shared AsyncOpenAI client (llm_client.py: concurrency limit, timeouts, retries, hedging,
+  tokens-per-minute budget). handle(), _call_llm() and _stream_llm() are blocking wrappers
+  for sync callers; they turn a failed call (LLMError) into the "LLM call failed." message.
+- _call_llm returns the whole reply; _stream_llm yields text chunks as they arrive.
+  Point OPENAI_BASE_URL at any OpenAI-compatible server (e.g. a local fake) to exercise
+  either path without the real API.
+- Both accept `cache_fields`: the structured inputs behind the prompt. Replies are cached
+  per (agent, canonical JSON of those fields) for as long as the weather data they were
+  built from stays fresh; set LLM_CACHE_SEMANTIC=1 to also match near-identical inputs by
+  embedding similarity. See llm_cache_stats().
+- RiskAssessmentAgent.handle is incremental: extraction, scoring and the LLM's JSON are
+  memoized by their inputs, so a rerun with the same trip (or only a new departure time)
+  skips the unchanged stages. INCREMENTAL_ENABLED=0 turns this off; see stage_cache_stats().
 - The autogen usage is deliberately minimal here so you can plug autogen v0.7 orchestration
   quickly. Replace the LLM wrapper calls with autogen integrations if you want detailed
   agent choreography from autogen.
 """
 
+import asyncio
 import os
 import time
-from typing import Dict, Any, List
+from datetime import date
+from typing import Dict, Any, List, AsyncIterator, Iterator, Callable, Optional
 from pydantic import BaseModel
 from dotenv import load_dotenv
 import openai
 
-from nlp import extract_locations, extract_time, extract_transport_mode
-from tools import fetch_weather_for_location, fetch_emergency_info_for_location
-from utils import compute_risk_score, summarize_text
+import tracing
+from llm_client import LLMError, get_llm_client
+from ner_service import extract_entities
+from planner import fetch_plan, plan_retrieval
+from tools import SERPER_CACHE_TTLS
+from cache import LLMResponseCache, StageCache
+from prompts import advisory_prompt, combined_prompt, count_tokens, emergency_prompt, risk_prompt
+from scoring import default_scorer
+from schemas import (
+    CombinedReport, EmergencyPlan, RiskAssessment,
+    parse_assessment, parse_combined, parse_emergency_plan, response_format,
+)
+from utils import summarize_text, JsonObjectScanner
 
 load_dotenv()
 openai.api_key = os.getenv("OPENAI_API_KEY")
+LLM_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+# ask for JSON matching the response schemas (falls back to plain text if rejected)
+LLM_STRUCTURED_OUTPUT = os.getenv("LLM_STRUCTURED_OUTPUT", "1") == "1"
+ASSESSMENT_RESPONSE_FORMAT = response_format(RiskAssessment)
+EMERGENCY_RESPONSE_FORMAT = response_format(EmergencyPlan)
+COMBINED_RESPONSE_FORMAT = response_format(CombinedReport)
+EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
+
+# ---------- LLM response cache ----------
+def _embed(text: str) -> List[float]:
+    return openai.embeddings.create(model=EMBEDDING_MODEL, input=text).data[0].embedding
+
+# Replies are only as fresh as the weather snapshot they were built from.
+_llm_cache = LLMResponseCache(
+    maxsize=int(os.getenv("LLM_CACHE_MAXSIZE", "256")),
+    default_ttl=SERPER_CACHE_TTLS["weather"],
+    embed=_embed if os.getenv("LLM_CACHE_SEMANTIC") == "1" else None,
+    similarity_threshold=float(os.getenv("LLM_CACHE_SIMILARITY", "0.95")),
+    enabled=os.getenv("LLM_CACHE_ENABLED", "1") == "1",
+)
+
+def llm_cache_stats() -> Dict[str, Any]:
+    return _llm_cache.stats()
+
+# Lookups hash the prompt fields and, with LLM_CACHE_SEMANTIC=1, make a blocking
+# embeddings request plus a cosine scan: keep them off the shared LLM event loop.
+async def _cache_get(agent: str, fields: Dict[str, Any]) -> Optional[str]:
+    return await asyncio.to_thread(_llm_cache.get, agent, fields)
+
+async def _cache_put(agent: str, fields: Dict[str, Any], text: str, **kwargs: Any) -> None:
+    await asyncio.to_thread(_llm_cache.put, agent, fields, text, **kwargs)
+
+# ---------- Incremental re-assessment ----------
+# Intermediate artifacts of RiskAssessmentAgent.handle (entities, score, LLM JSON) keyed by
+# their inputs; a rerun only recomputes the stages whose inputs changed. Entries live as
+# long as the LLM cache's (the weather freshness TTL), so a memoized assessment never
+# outlives the data it was built from.
+_stage_cache = StageCache(
+    maxsize=int(os.getenv("STAGE_CACHE_MAXSIZE", "256")),
+    enabled=os.getenv("INCREMENTAL_ENABLED", "1") == "1",
+    default_ttl=SERPER_CACHE_TTLS["weather"],
+)
+
+def stage_cache_stats() -> Dict[str, Any]:
+    return _stage_cache.stats()
+
+def _extract_inputs(user_text: str) -> Dict[str, Any]:
+    # relative times depend on today's date
+    return {"text": user_text, "date": date.today().isoformat()}
+
+def _unpack_entities(entities: Dict[str, Any]):
+    # fallback to at least one location
+    return entities["locations"] or ["unknown"], entities["time"], entities["transport"]
+
+def seed_extraction(user_text: str, entities: Dict[str, Any]) -> None:
+    """Memoize entities extracted ahead of time (batch.py), so handle() skips NER for this text."""
+    _stage_cache.put("extract", _extract_inputs(user_text), _unpack_entities(entities))
 
 # ---------- Generic Agent base ----------
 class AgentBase:
@@ -33,36 +117,153 @@ class AgentBase:
         self.name = name
         self.system_prompt = system_prompt
 
-    def _call_llm(self, prompt: str, temperature: float = 0.2, max_tokens: int = 400) -> str:
-        """
-        OpenAI chat completion wrapper for AgentBase.
-        Returns a string reply or a safe error message.
-        """
-        messages = [
+    def _messages(self, prompt: str) -> List[Dict[str, str]]:
+        return [
             {"role": "system", "content": self.system_prompt},
             {"role": "user", "content": prompt},
         ]
 
-        try:
-            resp = openai.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=messages,
+    def _format(self, response_format: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        return response_format if LLM_STRUCTURED_OUTPUT else None
+
+    async def _acall_llm(
+        self,
+        prompt: str,
+        temperature: float = 0.2,
+        max_tokens: int = 400,
+        cache_fields: Optional[Dict[str, Any]] = None,
+        response_format: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """
+        Async OpenAI chat completion through the shared client (llm_client).
+        Returns the reply text; raises LLMError when the call fails for good.
+        """
+        with tracing.span(
+            "llm.call", agent=self.name, prompt_chars=len(prompt), prompt_tokens_est=count_tokens(prompt)
+        ) as sp:
+            if cache_fields is not None:
+                cached = await _cache_get(self.name, cache_fields)
+                if cached is not None:
+                    sp.set(cached=True)
+                    return cached
+
+            resp = await get_llm_client().complete(
+                self._messages(prompt),
+                response_format=self._format(response_format),
+                model=LLM_MODEL,
                 max_tokens=max_tokens,
-                temperature=temperature
+                temperature=temperature,
             )
+            usage = getattr(resp, "usage", None)
+            prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+            completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+            sp.set(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
             # Safely get content
             if resp.choices and resp.choices[0].message and resp.choices[0].message.content:
-                return resp.choices[0].message.content.strip()
-            else:
-                return "No response from LLM."
-        except Exception as e:
+                text = resp.choices[0].message.content.strip()
+                if cache_fields is not None:
+                    await _cache_put(
+                        self.name, cache_fields, text,
+                        prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                    )
+                return text
+            return "No response from LLM."
+
+    async def _astream_llm(
+        self,
+        prompt: str,
+        temperature: float = 0.2,
+        max_tokens: int = 400,
+        cache_fields: Optional[Dict[str, Any]] = None,
+        response_format: Optional[Dict[str, Any]] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Streaming variant of _acall_llm: yields content chunks as the model produces them.
+        A cache hit is yielded as a single chunk. Raises LLMError on failure.
+        """
+        # a generator can't keep a `with` span open across yields, so end it by hand
+        sp = tracing.start_span(
+            "llm.stream", agent=self.name, prompt_chars=len(prompt), prompt_tokens_est=count_tokens(prompt)
+        )
+        try:
+            if cache_fields is not None:
+                cached = await _cache_get(self.name, cache_fields)
+                if cached is not None:
+                    sp.set(cached=True)
+                    yield cached
+                    return
+            chunks = []
+            usage = None
+            start = time.perf_counter()
+            async for chunk in get_llm_client().stream(
+                self._messages(prompt),
+                response_format=self._format(response_format),
+                model=LLM_MODEL,
+                max_tokens=max_tokens,
+                temperature=temperature,
+            ):
+                if getattr(chunk, "usage", None) is not None:
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta is not None and delta.content:
+                    if not chunks:
+                        sp.set(ttft_ms=round((time.perf_counter() - start) * 1000, 1))
+                    chunks.append(delta.content)
+                    yield delta.content
+            prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+            completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+            sp.set(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+            if not chunks:
+                yield "No response from LLM."
+                return
+            if cache_fields is not None:
+                await _cache_put(
+                    self.name, cache_fields, "".join(chunks).strip(),
+                    prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                )
+        except LLMError as e:
+            sp.set(error=str(e))
+            raise
+        finally:
+            sp.end()
+
+    # ---------- failures as the safe message (what handle() results carry) ----------
+    async def _areply(self, prompt: str, **kwargs) -> str:
+        try:
+            return await self._acall_llm(prompt, **kwargs)
+        except LLMError as e:
             print("LLM call failed:", e)
             return "LLM call failed."
 
+    async def _areply_stream(self, prompt: str, **kwargs) -> AsyncIterator[str]:
+        started = False
+        try:
+            async for chunk in self._astream_llm(prompt, **kwargs):
+                started = True
+                yield chunk
+        except LLMError as e:
+            print("LLM stream failed:", e)
+            if not started:
+                yield "LLM call failed."
+
+    # ---------- sync wrappers ----------
+    def _call_llm(self, prompt: str, **kwargs) -> str:
+        """Blocking _acall_llm. Returns a string reply or a safe error message."""
+        return get_llm_client().run(self._areply(prompt, **kwargs))
+
+    def _stream_llm(self, prompt: str, **kwargs) -> Iterator[str]:
+        """Blocking _astream_llm; yields the safe error message if the call fails before any output."""
+        return get_llm_client().iterate(self._areply_stream(prompt, **kwargs))
+
 
 # ---------- Risk Assessment Agent ----------
 class RiskAssessmentAgent(AgentBase):
-    def __init__(self):
+    def __init__(self, max_workers: int = None, retrieval_deadline: float = None):
+        # concurrency limit / total deadline for the retrieval stage (None -> tools defaults)
+        self.max_workers = max_workers
+        self.retrieval_deadline = retrieval_deadline
         super().__init__(
             name="risk_assessment_agent",
             system_prompt=(
@@ -72,59 +273,130 @@ class RiskAssessmentAgent(AgentBase):
             ),
         )
 
-    def handle(self, user_text: str) -> Dict[str, Any]:
-        # 1. NLP extraction
-        locations = extract_locations(user_text)
-        times = extract_time(user_text)
-        transport = extract_transport_mode(user_text)
-
-        # fallback to at least one location
-        if not locations:
-            locations = ["unknown"]
-
-        # 2. Call external retrieval (weather + emergency)
-        weather_data = {}
-        emergency_data = {}
-        for loc in locations:
-            weather_data[loc] = fetch_weather_for_location(loc)
-            emergency_data[loc] = fetch_emergency_info_for_location(loc)
-
-        # 3. Construct prompt for LLM to synthesize
-        prompt = (
-            f"User: {user_text}\n"
-            f"Extracted locations: {locations}\n"
-            f"Time: {times}\n"
-            f"Transport: {transport}\n"
-            f"Weather (raw): {weather_data}\n"
-            f"Emergency intel (raw): {emergency_data}\n\n"
-            "Produce:\n"
-            "1) JSON object with fields: locations, time, transport_mode, risk_score (0-100), "
-            "risk_level (Low/Medium/High/Critical), reasons (list), recommended_actions (list).\n"
-            "2) Short human summary (1-2 paragraphs).\n"
+    def handle(
+        self,
+        user_text: str,
+        on_assessment: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> Dict[str, Any]:
+        return get_llm_client().run(self.ahandle(user_text, on_assessment))
+
+    async def ahandle(
+        self,
+        user_text: str,
+        on_assessment: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> Dict[str, Any]:
+        """
+        on_assessment (optional) is called with the assessment as soon as the LLM's JSON
+        object is complete, before the trailing human summary has finished streaming.
+        """
+        # extraction / retrieval / scoring are blocking: off the event loop
+        locations, times, transport, weather_data, emergency_data, breakdown = await asyncio.to_thread(
+            self._gather, user_text
+        )
+
+        # 4. LLM synthesis; skipped entirely when none of its inputs changed since last run.
+        # The prompt carries only compact per-location snippets, and its fields double
+        # as the cache key.
+        prompt = risk_prompt(user_text, locations, times, transport, weather_data, emergency_data)
+        cache_fields = prompt.fields
+        found, memo = _stage_cache.get("assessment", cache_fields)
+        if found:
+            tracing.start_span("assessment.cached").end()
+            parsed = self._finalize(memo, breakdown, weather_data, emergency_data)
+            if on_assessment is not None:
+                on_assessment(dict(parsed))
+            return parsed
+
+        # structured output: the reply is a RiskAssessment JSON object. The scanner finds
+        # its closing brace as it streams (and skips any prose around it on servers
+        # without structured output); it is validated once, here.
+        scanner = JsonObjectScanner()
+        chunks = []
+        parsed = None
+        parse_ns = 0
+        async for chunk in self._areply_stream(
+            prompt.text, cache_fields=cache_fields, response_format=ASSESSMENT_RESPONSE_FORMAT,
+        ):
+            chunks.append(chunk)
+            if parsed is None:
+                t0 = time.perf_counter_ns()
+                done = scanner.feed(chunk) is not None
+                if done:
+                    validated, error = parse_assessment(scanner.result)
+                    if validated is not None:
+                        parsed = self._finalize(validated, breakdown, weather_data, emergency_data)
+                parse_ns += time.perf_counter_ns() - t0
+                if parsed is not None:
+                    tracing.start_span("parse.json", cpu_ms=round(parse_ns / 1e6, 3), found=True).end()
+                    if on_assessment is not None:
+                        on_assessment(dict(parsed))
+        llm_out = "".join(chunks).strip()
+
+        if parsed is None:
+            error = error if scanner.result is not None else "no JSON object in reply"
+            tracing.start_span("parse.json", cpu_ms=round(parse_ns / 1e6, 3), found=False, error=error).end()
+            parsed = self._finalize({"raw_text": llm_out, "parse_error": error}, breakdown, weather_data, emergency_data)
+            parsed["summary"] = summarize_text(llm_out, max_sentences=3)
+            return parsed
+
+        if not parsed.get("summary"):
+            # plain-text servers put the human summary after the JSON block
+            parsed["summary"] = validated["summary"] = summarize_text(
+                llm_out[llm_out.rfind("}") + 1:].strip().lstrip("`").strip(), max_sentences=3
+            )
+        # only well-formed replies are reused; failures always retry
+        _stage_cache.put("assessment", cache_fields, validated)
+        return parsed
+
+    def _gather(self, user_text: str):
+        """Stages 1-3: entities, retrieval and the deterministic score."""
+        # 1. NLP extraction (memoized per text; relative times depend on today's date)
+        with tracing.span("extract") as sp:
+            (locations, times, transport), cached = _stage_cache.run(
+                "extract", _extract_inputs(user_text), lambda: self._extract(user_text),
+            )
+            sp.set(cached=cached)
+
+        # 2. Call external retrieval (weather + emergency), all searches at once. The
+        # planner collapses duplicate / covering entities and shares regional searches;
+        # results are memoized, with TTLs, by the Serper cache.
+        plan = plan_retrieval(locations)
+        weather_data, emergency_data = fetch_plan(
+            plan, max_workers=self.max_workers, deadline=self.retrieval_deadline
         )
-        llm_out = self._call_llm(prompt)
-        # try to extract json inside output (best-effort)
-        try:
-            import json, re
-            # find first JSON-looking block
-            m = re.search(r"(\{.*\})", llm_out, re.S)
-            if m:
-                parsed = json.loads(m.group(1))
-            else:
-                parsed = {"raw_text": llm_out}
-        except Exception:
-            parsed = {"raw_text": llm_out}
-
-        # 4. Compute deterministic supplemental score (example)
-        supplemental_score = compute_risk_score(weather_data, emergency_data, transport)
+        locations = plan.locations
+        weather_raw = {loc.lower(): wd.get("raw") for loc, wd in weather_data.items()}
+        emergency_raw = {loc.lower(): ed.get("raw") for loc, ed in emergency_data.items()}
+
+        # 3. Compute deterministic supplemental score (example)
+        with tracing.span("score") as sp:
+            breakdown, cached = _stage_cache.run(
+                "score", {"weather": weather_raw, "emergency": emergency_raw, "transport": transport},
+                lambda: default_scorer().explain(weather_data, emergency_data, transport),
+            )
+            sp.set(cached=cached)
+        return locations, times, transport, weather_data, emergency_data, breakdown
+
+    def _extract(self, user_text: str):
+        # NER runs on the worker pool when NER_WORKERS > 0 (ner_service.py)
+        return _unpack_entities(extract_entities(user_text))
+
+    def _finalize(
+        self,
+        parsed: Dict[str, Any],
+        breakdown: Dict[str, Any],
+        weather_data: Dict[str, Any],
+        emergency_data: Dict[str, Any],
+    ) -> Dict[str, Any]:
+        supplemental_score = breakdown["score"]
         if "risk_score" in parsed and isinstance(parsed["risk_score"], (int, float)):
             parsed["risk_score_final"] = round((parsed["risk_score"] + supplemental_score) / 2)
         else:
             parsed["risk_score_final"] = supplemental_score
 
+        parsed["risk_score_breakdown"] = breakdown
         parsed["weather_data"] = weather_data
         parsed["emergency_data"] = emergency_data
-        parsed["summary"] = summarize_text(llm_out, max_sentences=3)
         parsed["agent"] = self.name
         return parsed
 
@@ -140,17 +412,26 @@ class AdvisoryAgent(AgentBase):
             ),
         )
 
-    def handle(self, assessment: Dict[str, Any]) -> Dict[str, Any]:
-        prompt = (
-            f"Risk assessment JSON:\n{assessment}\n\n"
-            "Produce:\n"
-            "1) A friendly advisory message (3-6 bullet points)\n"
-            "2) A short checklist of items to carry (e.g., medications, charger, documents)\n"
-            "3) Accessibility / special-needs considerations if any\n"
-        )
-        advice = self._call_llm(prompt)
+    def _result(self, assessment: Dict[str, Any], advice: str) -> Dict[str, Any]:
         return {"agent": self.name, "advice_text": advice, "original_assessment": assessment}
 
+    def handle(self, assessment: Dict[str, Any]) -> Dict[str, Any]:
+        return get_llm_client().run(self.ahandle(assessment))
+
+    async def ahandle(self, assessment: Dict[str, Any]) -> Dict[str, Any]:
+        prompt = advisory_prompt(assessment)
+        advice = await self._areply(prompt.text, cache_fields=prompt.fields)
+        return self._result(assessment, advice)
+
+    def stream(self, assessment: Dict[str, Any]) -> Iterator[str]:
+        """Yield advice text chunks as they are generated."""
+        prompt = advisory_prompt(assessment)
+        return self._stream_llm(prompt.text, cache_fields=prompt.fields)
+
+    def astream(self, assessment: Dict[str, Any]) -> AsyncIterator[str]:
+        prompt = advisory_prompt(assessment)
+        return self._areply_stream(prompt.text, cache_fields=prompt.fields)
+
 # ---------- Emergency Agent ----------
 class EmergencyAgent(AgentBase):
     def __init__(self):
@@ -164,19 +445,67 @@ class EmergencyAgent(AgentBase):
         )
 
     def handle(self, assessment: Dict[str, Any]) -> Dict[str, Any]:
+        return get_llm_client().run(self.ahandle(assessment))
+
+    async def ahandle(self, assessment: Dict[str, Any]) -> Dict[str, Any]:
         # For each location return emergency contacts and next steps
-        prompt = (
-            f"Assessment:\n{assessment}\n\n"
-            "Return in JSON: locations -> list of {location, emergency_contacts, next_steps, 3-min response checklist}\n"
+        prompt = emergency_prompt(assessment)
+        resp = await self._areply(
+            prompt.text, cache_fields=prompt.fields, response_format=EMERGENCY_RESPONSE_FORMAT,
         )
-        resp = self._call_llm(prompt)
-        try:
-            import json, re
-            m = re.search(r"(\{.*\})", resp, re.S)
-            if m:
-                parsed = json.loads(m.group(1))
-            else:
-                parsed = {"raw_text": resp}
-        except Exception:
-            parsed = {"raw_text": resp}
-        return {"agent": self.name, "emergency_plan": parsed, "raw": resp}
+        with tracing.span("parse.json", agent=self.name) as sp:
+            plan, error = parse_emergency_plan(resp)
+            if error:
+                sp.set(error=error)
+        if plan is None:
+            return {"agent": self.name, "emergency_plan": {"raw_text": resp}, "parse_error": error, "raw": resp}
+        return {"agent": self.name, "emergency_plan": plan, "raw": resp}
+
+# ---------- Combined (single-call) Agent ----------
+class CombinedAgent(RiskAssessmentAgent):
+    """
+    Same extraction / retrieval / scoring as RiskAssessmentAgent, then one structured LLM
+    call for the assessment, advice and emergency plan. Returns {"assessment",
+    "advisory", "emergency"} in the same shapes the three separate agents produce.
+    """
+
+    def __init__(self, max_workers: int = None, retrieval_deadline: float = None, max_tokens: int = 1000):
+        super().__init__(max_workers=max_workers, retrieval_deadline=retrieval_deadline)
+        self.name = "combined_agent"
+        self.max_tokens = max_tokens
+        self.system_prompt = (
+            "You are Trip Safety Agent. From the trip and the retrieved weather and emergency intel, "
+            "assess the travel risk, give practical advice, and prepare an emergency plan with local "
+            "contacts and next steps for each location."
+        )
+
+    async def ahandle(self, user_text: str, on_assessment=None) -> Dict[str, Any]:
+        locations, times, transport, weather_data, emergency_data, breakdown = await asyncio.to_thread(
+            self._gather, user_text
+        )
+        prompt = combined_prompt(user_text, locations, times, transport, weather_data, emergency_data)
+        resp = await self._areply(
+            prompt.text, max_tokens=self.max_tokens, cache_fields=prompt.fields,
+            response_format=COMBINED_RESPONSE_FORMAT,
+        )
+        with tracing.span("parse.json", agent=self.name) as sp:
+            report, error = parse_combined(resp)
+            if error:
+                sp.set(error=error)
+
+        if report is None:
+            assessment = self._finalize(
+                {"raw_text": resp, "parse_error": error}, breakdown, weather_data, emergency_data
+            )
+            assessment["summary"] = summarize_text(resp, max_sentences=3)
+            advice, plan = "", {"raw_text": resp}
+        else:
+            assessment = self._finalize(report["assessment"], breakdown, weather_data, emergency_data)
+            advice, plan = report["advice"], report["emergency"]
+        if on_assessment is not None:
+            on_assessment(dict(assessment))
+        return {
+            "assessment": assessment,
+            "advisory": {"agent": self.name, "advice_text": advice, "original_assessment": assessment},
+            "emergency": {"agent": self.name, "emergency_plan": plan, "raw": resp},
+        }
@@ -1,17 +1,23 @@
 # app.py
-import json, re
+import time
+
 import streamlit as st
 from dotenv import load_dotenv
 
 # Agents
-from agents import RiskAssessmentAgent, AdvisoryAgent, EmergencyAgent
+from orchestrator import resolve_mode, stream_trip
+from service_client import get_service_client
+from schemas import RISK_LEVELS
+from store import get_assessment_store
+from warmup import warmup
 from security import sanitize_user_text
+import tracing
 
 # UI
 from ui_components import (
     header, metric_cards, risk_gauge,
     reasons_list, actions_checklist,
-    emergency_cards, raw_blocks, navigation_bar
+    emergency_cards, raw_blocks, navigation_bar, trace_waterfall
 )
 
 # ----------------- Setup -----------------
@@ -26,52 +32,197 @@ if 'page' not in st.session_state:
     st.session_state.page = "home"
 
 load_dotenv()
+
+@st.cache_resource(show_spinner="Warming up models…")
+def warm_resources():
+    # once per process: spaCy model, agents and HTTP clients (never downloads).
+    # With TRIP_SAFETY_API_URL set the agents run in the API service instead.
+    if get_service_client() is not None:
+        return {"ready": True, "cold_start_ms": 0.0, "errors": {}, "remote": True}
+    return warmup()
+
+readiness = warm_resources()
 navigation_bar()
+with st.sidebar:
+    if readiness.get("remote"):
+        st.caption("🟢 Using the Trip Safety API service")
+    elif readiness["ready"]:
+        st.caption(f"🟢 Ready · cold start {readiness['cold_start_ms']:.0f} ms")
+    else:
+        st.caption("🟠 Degraded: " + "; ".join(f"{k}: {v}" for k, v in readiness["errors"].items()))
+
+# ----------------- Result helpers -----------------
+# Agents validate their replies (schemas.py), so results arrive here as plain dicts
+# whether they ran in-process or in the API service.
+def emergency_locations(result):
+    """Per-location plans from an EmergencyAgent result ([] if it couldn't be parsed)."""
+    if not isinstance(result, dict):
+        return []
+    plan = result.get("emergency_plan") or {}
+    return plan.get("locations") or [] if isinstance(plan, dict) else []
+
+def load_history(location=None, risk_level=None, limit=20):
+    """Recent recorded trips from the API service or the local assessment store (None if disabled)."""
+    client = get_service_client()
+    if client is not None:
+        try:
+            return client.recent_assessments(location or None, risk_level or None, limit=limit)
+        except Exception:
+            return None
+    store = get_assessment_store()
+    return store.recent(location or None, risk_level or None, limit=limit) if store is not None else None
+
+def render_overview(view):
+    """Metric cards + gauge + route for an assessment-shaped dict."""
+    score = int(view.get("risk_score_final", view.get("risk_score", 0)) or 0)
+    level = view.get("risk_level", "Medium")
+    locations = view.get("locations", [])
+    with st.container(border=True):
+        metric_cards(score, level, view.get("transport_mode", ""), view.get("time", ""))
+        risk_gauge(score, level)
+        st.markdown(f"**Locations:** {' → '.join(locations) if locations else '—'}")
+
+def render_details(assessment, key_prefix):
+    with st.container(border=True):
+        reasons_list(assessment.get("reasons") or [])
+        actions_checklist(assessment.get("recommended_actions") or [], key_prefix=key_prefix)
+
+def render_emergency(merged_emergency):
+    if merged_emergency:
+        emergency_cards(merged_emergency)
+    else:
+        st.write("No emergency plan available")
+
+def render_raw(trip):
+    assessment = trip["assessment"]
+    summary = {k: v for k, v in assessment.items() if k not in ("weather_data", "emergency_data")}
+    raw_blocks(summary, assessment.get("weather_data") or {}, trip["emergency"])
+
+def run_assessment(user_input, show_raw=False, mode=None):
+    """
+    Full pipeline for one trip, rendering each section as soon as it is ready.
+    The finished view is kept in st.session_state.trip; later reruns (sidebar toggles,
+    the history panel) redraw it with render_trip() instead of calling the agents again.
+    """
+    run_id = st.session_state.get("trip_runs", 0) + 1
+    st.session_state.trip_runs = run_id
+    # fresh checklist keys per run, stable across reruns of the same run
+    key_prefix = f"trip{run_id}_action"
+
+    # Overview renders as soon as the assessment JSON has streamed in.
+    overview_slot = st.empty()
+    overview_shown = []
+
+    def show_overview(early):
+        with tracing.span("ui.overview"):
+            with overview_slot.container():
+                render_overview(early)
+        overview_shown.append(True)
+
+    # same event stream whether the agents run here or in the API service
+    client = get_service_client()
+    events = client.stream_trip(user_input, mode) if client is not None else stream_trip(user_input, mode)
+
+    assessment = {}
+    with st.spinner("🔍 Running risk assessment…"):
+        with tracing.span("agent.risk"):
+            for name, payload in events:
+                if name == "assessment_early":
+                    show_overview(payload)
+                elif name == "assessment":
+                    assessment = payload
+                    break
+
+    emergency_data_from_risk = assessment.get("emergency_data") or {}
+
+    with tracing.span("ui.details"):
+        if not overview_shown:
+            with overview_slot.container():
+                render_overview(assessment)
+        render_details(assessment, key_prefix)
+
+    # Advisory + emergency run in parallel; each section fills in as its result arrives
+    # and the advisory text streams in chunk by chunk.
+    st.subheader("💡 Advisory")
+    advisory_slot = st.empty()
+    advisory_slot.info("💡 Preparing advice…")
+
+    st.subheader("🚑 Emergency Plan")
+    emergency_slot = st.empty()
+    emergency_slot.info("🚑 Preparing emergency plan…")
+
+    trip = {
+        "key_prefix": key_prefix,
+        "assessment": assessment,
+        "advice": "",
+        "advice_error": None,
+        "emergency": emergency_data_from_risk,
+    }
+    with tracing.span("agents.followups"):
+        for name, result in events:
+            if name == "advisory_delta":
+                trip["advice"] += result
+                advisory_slot.markdown(trip["advice"] + "▌")
+            elif name == "advisory":
+                if isinstance(result, Exception):
+                    trip["advice_error"] = f"Advisory failed: {result}"
+                    advisory_slot.error(trip["advice_error"])
+                    continue
+                trip["advice"] = str(result.get("advice_text") or trip["advice"])
+                advisory_slot.markdown(trip["advice"])
+            else:
+                with tracing.span("ui.emergency"), emergency_slot.container():
+                    if not isinstance(result, Exception):
+                        trip["emergency"] = emergency_locations(result) or emergency_data_from_risk
+                    render_emergency(trip["emergency"])
+
+    st.session_state.trip = trip
+    if show_raw:
+        render_raw(trip)
+
+def render_trip(trip, show_raw=False):
+    """Redraw a finished trip from session state (no agent calls)."""
+    assessment = trip["assessment"]
+    render_overview(assessment)
+    render_details(assessment, trip["key_prefix"])
+    st.subheader("💡 Advisory")
+    if trip["advice_error"]:
+        st.error(trip["advice_error"])
+    else:
+        st.markdown(trip["advice"])
+    st.subheader("🚑 Emergency Plan")
+    render_emergency(trip["emergency"])
+    if show_raw:
+        render_raw(trip)
+
+@st.fragment
+def recent_assessments_panel():
+    # a fragment: filtering the history reruns only this panel
+    with st.expander("🕘 Recent assessments"):
+        col_loc, col_level = st.columns([3, 1])
+        history_location = col_loc.text_input("Location", placeholder="e.g. Kandy", key="history_location")
+        history_level = col_level.selectbox("Risk level", ["", *RISK_LEVELS], key="history_level")
+        history = load_history(history_location.strip(), history_level)
+        if history is None:
+            st.caption("Assessment history is disabled.")
+        elif not history:
+            st.caption("No recorded assessments match.")
+        else:
+            st.dataframe(
+                [
+                    {
+                        "When": time.strftime("%Y-%m-%d %H:%M", time.localtime(row["created_at"])),
+                        "Locations": ", ".join(row.get("locations") or []),
+                        "Risk": row.get("risk_level"),
+                        "Score": row.get("risk_score_final"),
+                        "Summary": row.get("summary"),
+                    }
+                    for row in history
+                ],
+                use_container_width=True, hide_index=True,
+            )
+
 
-# ----------------- JSON helpers -----------------
-_JSON_OBJECT_OR_ARRAY_RE = re.compile(r"(\{.*\}|\[.*\])", re.S)
-_JSON_OBJECT_RE = re.compile(r"\{.*\}", re.S)
-
-def coerce_to_dict(obj):
-    if isinstance(obj, dict): return obj
-    if not isinstance(obj, str): return {}
-    m = _JSON_OBJECT_RE.search(obj)
-    if m:
-        try: return json.loads(m.group(0))
-        except: return {}
-    try: return json.loads(obj)
-    except: return {}
-
-def coerce_json_any(obj):
-    if isinstance(obj, (dict, list)):
-        return obj
-    if not isinstance(obj, str):
-        return {}
-    s = obj.strip()
-    try:
-        return json.loads(s)
-    except:
-        m = _JSON_OBJECT_OR_ARRAY_RE.search(s)
-        if m:
-            try:
-                return json.loads(m.group(1))
-            except:
-                return {}
-        return {}
-
-def normalize_emergency(obj):
-    data = coerce_json_any(obj)
-    if isinstance(data, dict):
-        for k in ("emergency_plan", "raw_text", "raw"):
-            v = data.get(k)
-            if v is not None:
-                data = coerce_json_any(v)
-        if isinstance(data, dict) and isinstance(data.get("locations"), list):
-            return data["locations"]
-        return data
-    if isinstance(data, list):
-        return data
-    return []
 # ----------------- Header -----------------
 col1, col2 = st.columns([1, 8])
 
@@ -225,7 +376,11 @@ elif st.session_state.page == "contact":
 
 elif st.session_state.page == "risk":
     with st.sidebar:
+        fast_mode = st.toggle("⚡ Fast mode (single AI call)", value=resolve_mode() == "combined",
+                              help="One combined call for assessment, advice and emergency plan.")
         show_raw = st.toggle("Developer: show raw data", value=False)
+        show_timing = st.toggle("Developer: show stage timings", value=False)
+        timing_panel = st.empty()
 
     st.markdown("### 📝 Enter Trip Details")
     user_input = st.text_area("✍️ Describe your trip", height=120)
@@ -237,58 +392,15 @@ elif st.session_state.page == "risk":
             st.error("⚠️ Please enter a trip description.")
             st.stop()
 
-        with st.spinner("🔍 Running risk assessment…"):
-            risk_agent = RiskAssessmentAgent()
-            assessment = risk_agent.handle(user_input)
-
-        assessment_dict = coerce_to_dict(assessment)
-        summary = coerce_to_dict(assessment_dict.get("summary", assessment_dict))
-
-        weather_data = coerce_to_dict(
-            assessment_dict.get("weather_data") or assessment_dict.get("weather") or {}
-        )
-        emergency_data_from_risk = normalize_emergency(
-            assessment_dict.get("emergency_data") or {}
-        )
-
-        locations = summary.get("locations", [])
-        time_text = summary.get("time", "")
-        transport = summary.get("transport_mode", "")
-        score = int(summary.get("risk_score_final", summary.get("risk_score", 0)) or 0)
-        level = summary.get("risk_level", "Medium")
-        reasons = summary.get("reasons", [])
-        if isinstance(reasons, str): reasons = [reasons]
-        actions = summary.get("recommended_actions", [])
-        if isinstance(actions, str): actions = [actions]
-
-        with st.container(border=True):
-            metric_cards(score, level, transport, time_text)
-            risk_gauge(score, level)
-            st.markdown(f"**Locations:** {' → '.join(locations) if locations else '—'}")
-
-        with st.container(border=True):
-            reasons_list(reasons)
-            actions_checklist(actions)
-
-        st.subheader("💡 Advisory")
-        advisory_agent = AdvisoryAgent()
-        advice = coerce_to_dict(advisory_agent.handle(summary))
-        st.markdown(str(advice.get("advice_text") or advice.get("advice") or advice))
-
-        st.subheader("🚑 Emergency Plan")
-        emergency_agent = EmergencyAgent()
-        emergency_result = emergency_agent.handle(summary)
-        merged_emergency = normalize_emergency(emergency_result)
-
-        if not merged_emergency:
-            merged_emergency = emergency_data_from_risk
-
-        if merged_emergency:
-            emergency_cards(merged_emergency)
-        else:
-            st.write("No emergency plan available")
+        with tracing.start_trace("assess_trip", chars=len(user_input)) as run_trace:
+            run_assessment(user_input, show_raw, mode="combined" if fast_mode else "agents")
+        st.session_state.last_trace = run_trace.to_dict()
+        st.success("✅ Done!")
+    elif "trip" in st.session_state:
+        render_trip(st.session_state.trip, show_raw)
 
-        if show_raw:
-            raw_blocks(summary, weather_data, merged_emergency)
+    recent_assessments_panel()
 
-        st.success("✅ Done!")
+    if show_timing:
+        with timing_panel.container():
+            trace_waterfall(st.session_state.get("last_trace"))
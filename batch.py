@@ -0,0 +1,195 @@
+"""
+batch.py
+
+Headless batch mode: runs RiskAssessment -> Advisory + Emergency for many trips.
+
+Input is JSONL (a file path or "-" for stdin). Each line is either a JSON object with
+an id ("id" / "request_id" / "booking_id") and a trip description ("text" / "trip" /
+"description" / "body"), or a plain line of text. Lines without an id get a stable
+one derived from their text, so resumes line up.
+
+Usage:
+    python batch.py trips.jsonl -o reports.jsonl --concurrency 8
+    cat trips.jsonl | python batch.py - -o reports.jsonl
+
+Notes:
+- Results are streamed to the output as JSONL in completion order.
+- Every finished id is appended to a checkpoint file (default: <output>.ckpt); a rerun
+  with the same output skips those ids and appends to the existing report.
+- Before any trip runs, the locations of the whole batch are extracted (one nlp.pipe
+  pass, or micro-batches on the NER worker pool with NER_WORKERS > 0) and fetched once each, so trips sharing a city reuse the cached Serper results.
+  The extracted entities seed the risk agent's "extract" stage, so NER runs once per trip
+  (while the stage cache holds them: INCREMENTAL_ENABLED, STAGE_CACHE_MAXSIZE).
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set
+
+from agents import seed_extraction
+from ner_service import extract_entities_many
+from orchestrator import AGENT_MODES, run_trip
+from security import sanitize_user_text
+from planner import plan_retrieval
+from tools import run_lookups
+from warmup import warmup
+
+ID_KEYS = ("id", "request_id", "booking_id")
+TEXT_KEYS = ("text", "trip", "description", "body")
+
+
+def _stable_id(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+
+
+def read_trips(lines: Iterable[str]) -> Iterator[Dict[str, str]]:
+    """Yield {"id", "text"} for every non-empty input line."""
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        record: Dict[str, Any] = {}
+        if line.startswith("{"):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = {}
+        text = next((str(record[k]) for k in TEXT_KEYS if record.get(k)), None) if record else line
+        if not text:
+            print(f"skipping line without trip text: {line[:80]}", file=sys.stderr)
+            continue
+        trip_id = next((str(record[k]) for k in ID_KEYS if record.get(k)), None) or _stable_id(text)
+        yield {"id": trip_id, "text": text}
+
+
+def load_checkpoint(path: str) -> Set[str]:
+    if not os.path.exists(path):
+        return set()
+    with open(path, "r", encoding="utf-8") as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+def prefetch_locations(trips: List[Dict[str, str]], max_workers: int, deadline: float) -> int:
+    """Run every distinct search the batch's retrieval plans need, once; returns how many."""
+    lookups = []
+    for trip, entities in zip(trips, extract_entities_many([t["text"] for t in trips])):
+        # the risk agent reuses these instead of running NER on the trip again
+        seed_extraction(trip["text"], entities)
+        plan = plan_retrieval(entities["locations"] or ["unknown"])
+        lookups.extend((l.kind, l.query) for l in plan.lookups)
+    lookups = list(dict.fromkeys(lookups))
+    if lookups:
+        run_lookups(lookups, max_workers=max_workers, deadline=deadline)
+    return len(lookups)
+
+
+def assess_trip(trip: Dict[str, str], mode: Optional[str] = None) -> Dict[str, Any]:
+    start = time.perf_counter()
+    results = run_trip(trip["text"], mode)
+    out: Dict[str, Any] = {"id": trip["id"], "assessment": results["assessment"]}
+    for name in ("advisory", "emergency"):
+        result = results.get(name)
+        if isinstance(result, Exception):
+            out[name] = {"error": str(result)}
+        else:
+            result = dict(result or {})
+            result.pop("original_assessment", None)
+            out[name] = result
+    out["elapsed_s"] = round(time.perf_counter() - start, 3)
+    return out
+
+
+def run_batch(
+    trips: List[Dict[str, str]],
+    output,
+    checkpoint_path: Optional[str] = None,
+    concurrency: int = 4,
+    prefetch: bool = True,
+    prefetch_deadline: float = 120.0,
+    mode: Optional[str] = None,
+) -> Dict[str, Any]:
+    done = load_checkpoint(checkpoint_path) if checkpoint_path else set()
+    todo = [t for t in trips if t["id"] not in done]
+    # the same id twice in one input only runs once
+    seen: Set[str] = set()
+    todo = [t for t in todo if not (t["id"] in seen or seen.add(t["id"]))]
+
+    stats = {"total": len(trips), "skipped": len(trips) - len(todo), "ok": 0, "failed": 0, "searches_prefetched": 0}
+    if not todo:
+        return stats
+    if prefetch:
+        stats["searches_prefetched"] = prefetch_locations(todo, max_workers=concurrency * 2, deadline=prefetch_deadline)
+
+    lock = threading.Lock()
+    ckpt = open(checkpoint_path, "a", encoding="utf-8") if checkpoint_path else None
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch") as pool:
+            futures = {pool.submit(assess_trip, t, mode): t for t in todo}
+            for fut in as_completed(futures):
+                trip = futures[fut]
+                try:
+                    record = fut.result()
+                    stats["ok"] += 1
+                except Exception as e:
+                    record = {"id": trip["id"], "error": str(e)}
+                    stats["failed"] += 1
+                with lock:
+                    output.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+                    output.flush()
+                    # failed trips stay out of the checkpoint so a resume retries them
+                    if ckpt is not None and "error" not in record:
+                        ckpt.write(trip["id"] + "\n")
+                        ckpt.flush()
+    finally:
+        if ckpt is not None:
+            ckpt.close()
+    stats["elapsed_s"] = round(time.perf_counter() - start, 3)
+    return stats
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Batch trip safety assessment over JSONL.")
+    ap.add_argument("input", help="JSONL file of trips, or - for stdin")
+    ap.add_argument("-o", "--output", default="-", help="output JSONL (default: stdout)")
+    ap.add_argument("--checkpoint", help="checkpoint file (default: <output>.ckpt; none for stdout)")
+    ap.add_argument("-c", "--concurrency", type=int, default=4, help="trips processed at once")
+    ap.add_argument("--no-prefetch", action="store_true", help="skip the shared location prefetch")
+    ap.add_argument("--prefetch-deadline", type=float, default=120.0, help="seconds allowed for the prefetch")
+    ap.add_argument("--mode", choices=AGENT_MODES, help="three agents or one combined call (default: AGENT_MODE)")
+    args = ap.parse_args(argv)
+
+    if args.input == "-":
+        raw_trips = list(read_trips(sys.stdin))
+    else:
+        with open(args.input, "r", encoding="utf-8") as f:
+            raw_trips = list(read_trips(f))
+    trips = [{"id": t["id"], "text": sanitize_user_text(t["text"])} for t in raw_trips]
+    warmup()
+
+    checkpoint = args.checkpoint or (f"{args.output}.ckpt" if args.output != "-" else None)
+    output = sys.stdout if args.output == "-" else open(args.output, "a", encoding="utf-8")
+    try:
+        stats = run_batch(
+            trips, output,
+            checkpoint_path=checkpoint,
+            concurrency=max(1, args.concurrency),
+            prefetch=not args.no_prefetch,
+            prefetch_deadline=args.prefetch_deadline,
+            mode=args.mode,
+        )
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    print(json.dumps(stats), file=sys.stderr)
+    return 0 if stats["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
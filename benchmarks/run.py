@@ -0,0 +1,256 @@
+"""
+run.py
+
+Reproducible offline benchmark for the assessment pipeline.
+
+Starts the local Serper/OpenAI stubs (stub_servers.py), points the app at them via
+SERPER_SEARCH_URL / OPENAI_BASE_URL, and drives each scenario over the trip corpus
+(fixtures/trips.txt) with N concurrent simulated users.
+
+Scenarios:
+- nlp:       extract_locations + extract_time + extract_transport_mode per trip
+- risk:      RiskAssessmentAgent.handle
+- followups: AdvisoryAgent + EmergencyAgent in parallel (orchestrator.run_followups)
+- pipeline:  risk followed by the follow-ups, as the UI runs it
+- combined:  the same trip through CombinedAgent (one LLM call) - compare with pipeline
+
+Reference, pipeline vs combined (defaults: 20 trips x 2 iterations, concurrency 4, stub
+LLM 600 ms / TTFT 150 ms, Serper 150 ms; all caches and the stage memo off):
+- p50 ~1395 ms vs ~773 ms, p95 ~1490 ms vs ~815 ms
+- LLM calls 120 vs 40 (3 vs 1 per trip; pipeline may show one or two hedged extras)
+- tokens per trip ~1410 vs ~922
+
+Usage:
+    python -m benchmarks.run
+    python -m benchmarks.run --concurrency 8 --iterations 3 --save benchmarks/baseline.json
+    python -m benchmarks.run --compare benchmarks/baseline.json   # exit 1 on regression
+
+Notes:
+- Caches are off by default so every run measures cold lookups: the Serper and LLM
+  response caches and the incremental stage memo (INCREMENTAL_ENABLED), which would
+  otherwise replay memoized risk assessments. --with-cache turns all three back on.
+- Reported per scenario: p50/p95/p99 latency, throughput, error count and peak traced
+  Python memory (tracemalloc) plus process max RSS, and LLM calls / tokens per scenario.
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmarks.stub_servers import FIXTURES_DIR, OpenAIStub, SerperStub
+
+SCENARIOS = ("nlp", "risk", "followups", "pipeline", "combined")
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def load_corpus(path: str) -> List[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def run_load(fn: Callable[[Any], Any], inputs: List[Any], concurrency: int, iterations: int, trace_memory: bool) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+
+    def one(item):
+        start = time.perf_counter()
+        try:
+            fn(item)
+            return (time.perf_counter() - start) * 1000, None
+        except Exception as e:
+            return (time.perf_counter() - start) * 1000, e
+
+    work = inputs * iterations
+    if trace_memory:
+        tracemalloc.start()
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for elapsed, err in pool.map(one, work):
+            latencies.append(elapsed)
+            errors += err is not None
+    wall = time.perf_counter() - wall_start
+    peak_mb = None
+    if trace_memory:
+        peak_mb = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 2)
+        tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "requests": len(work),
+        "errors": errors,
+        "concurrency": concurrency,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "mean_ms": round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+        "throughput_rps": round(len(work) / wall, 2) if wall else 0.0,
+        "wall_s": round(wall, 3),
+        "peak_traced_mb": peak_mb,
+    }
+
+
+def build_scenarios() -> Dict[str, Callable[[str], Any]]:
+    # imported late: the modules read SERPER_SEARCH_URL / OPENAI_BASE_URL at import time
+    from nlp import extract_locations, extract_time, extract_transport_mode
+    from orchestrator import run_followups
+    from utils import parse_first_json_object
+    from warmup import get_agent, warmup
+
+    warmup()
+    with open(os.path.join(FIXTURES_DIR, "chat_completions.json"), "r", encoding="utf-8") as f:
+        summary = parse_first_json_object(json.load(f)["risk_assessment_agent"])
+
+    def nlp_case(text):
+        return extract_locations(text), extract_time(text), extract_transport_mode(text)
+
+    def risk_case(text):
+        return get_agent("risk").handle(text)
+
+    def followups_case(text):
+        return run_followups(dict(summary, user_text=text))
+
+    def pipeline_case(text):
+        return run_followups(get_agent("risk").handle(text))
+
+    def combined_case(text):
+        return get_agent("combined").handle(text)
+
+    return {
+        "nlp": nlp_case, "risk": risk_case, "followups": followups_case,
+        "pipeline": pipeline_case, "combined": combined_case,
+    }
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Scenarios whose p95 grew or throughput fell by more than `tolerance` (fraction)."""
+    regressions = []
+    for name, cur in results["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            continue
+        if base["p95_ms"] and cur["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {base['p95_ms']} -> {cur['p95_ms']} ms")
+        if base["throughput_rps"] and cur["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {base['throughput_rps']} -> {cur['throughput_rps']} rps")
+    return regressions
+
+
+def print_report(results: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> None:
+    header = (f"{'scenario':<10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'rps':>8} {'err':>4} "
+              f"{'peak MB':>8} {'LLM':>5} {'tok/req':>8}")
+    print(header)
+    print("-" * len(header))
+    for name, r in results["scenarios"].items():
+        line = (f"{name:<10} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f} "
+                f"{r['throughput_rps']:>8.2f} {r['errors']:>4} {r['peak_traced_mb'] or 0:>8.2f} "
+                f"{r.get('llm_requests', 0):>5} {r.get('llm_tokens_per_request', 0):>8.0f}")
+        base = (baseline or {}).get("scenarios", {}).get(name)
+        if base and base["p95_ms"]:
+            line += f"   p95 {100 * (r['p95_ms'] / base['p95_ms'] - 1):+.1f}% vs baseline"
+        print(line)
+    print(f"max RSS {results['max_rss_mb']} MB · LLM tokens {results['llm_tokens']}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Offline benchmark with stubbed Serper/OpenAI servers.")
+    ap.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated subset of " + ", ".join(SCENARIOS))
+    ap.add_argument("--corpus", default=os.path.join(FIXTURES_DIR, "trips.txt"))
+    ap.add_argument("-c", "--concurrency", type=int, default=4, help="simulated concurrent users")
+    ap.add_argument("-n", "--iterations", type=int, default=2, help="passes over the corpus per scenario")
+    ap.add_argument("--serper-latency-ms", type=float, default=150.0)
+    ap.add_argument("--llm-latency-ms", type=float, default=600.0)
+    ap.add_argument("--llm-ttft-ms", type=float, default=150.0)
+    ap.add_argument("--jitter-ms", type=float, default=0.0, help="uniform +/- jitter on stub latency")
+    ap.add_argument("--with-cache", action="store_true", help="keep the Serper/LLM response caches and the stage memo enabled")
+    ap.add_argument("--no-tracemalloc", action="store_true", help="skip peak-memory tracing (lower overhead)")
+    ap.add_argument("--save", help="write results JSON here (e.g. benchmarks/baseline.json)")
+    ap.add_argument("--compare", help="baseline JSON to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.10, help="allowed regression fraction for --compare")
+    args = ap.parse_args(argv)
+
+    names = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        ap.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    serper = SerperStub(latency_ms=args.serper_latency_ms, jitter_ms=args.jitter_ms).start()
+    llm = OpenAIStub(latency_ms=args.llm_latency_ms, jitter_ms=args.jitter_ms, ttft_ms=args.llm_ttft_ms).start()
+    os.environ.update({
+        "SERPER_SEARCH_URL": serper.url,
+        "SERPER_API_KEY": "bench",
+        "OPENAI_BASE_URL": llm.base_url,
+        "OPENAI_API_KEY": "bench",
+        "SERPER_CACHE_PATH": "",
+        "SERPER_CACHE_ENABLED": "1" if args.with_cache else "0",
+        "LLM_CACHE_ENABLED": "1" if args.with_cache else "0",
+        "INCREMENTAL_ENABLED": "1" if args.with_cache else "0",
+    })
+
+    try:
+        corpus = load_corpus(args.corpus)
+        cases = build_scenarios()
+        results: Dict[str, Any] = {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "config": {
+                "corpus_size": len(corpus), "concurrency": args.concurrency, "iterations": args.iterations,
+                "serper_latency_ms": args.serper_latency_ms, "llm_latency_ms": args.llm_latency_ms,
+                "llm_ttft_ms": args.llm_ttft_ms, "jitter_ms": args.jitter_ms, "with_cache": args.with_cache,
+            },
+            "env": {"python": platform.python_version(), "platform": platform.platform()},
+            "scenarios": {},
+        }
+        for name in names:
+            serper_before, llm_before = serper.requests, llm.requests
+            tokens_before = llm.prompt_tokens + llm.completion_tokens
+            results["scenarios"][name] = run_load(
+                cases[name], corpus, args.concurrency, args.iterations, trace_memory=not args.no_tracemalloc
+            )
+            results["scenarios"][name]["serper_requests"] = serper.requests - serper_before
+            results["scenarios"][name]["llm_requests"] = llm.requests - llm_before
+            tokens = llm.prompt_tokens + llm.completion_tokens - tokens_before
+            results["scenarios"][name]["llm_tokens"] = tokens
+            results["scenarios"][name]["llm_tokens_per_request"] = round(tokens / max(1, len(corpus) * args.iterations), 1)
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        results["max_rss_mb"] = round(rss / (2 ** 20 if sys.platform == "darwin" else 2 ** 10), 1)
+        results["llm_tokens"] = {"prompt": llm.prompt_tokens, "completion": llm.completion_tokens}
+    finally:
+        serper.stop()
+        llm.stop()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"saved {args.save}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        for r in regressions:
+            print("REGRESSION", r)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
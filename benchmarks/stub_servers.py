@@ -0,0 +1,229 @@
+"""
+stub_servers.py
+
+Local stand-ins for the Serper and OpenAI HTTP APIs, for offline benchmarks.
+
+Contains:
+- SerperStub: POST /search replays fixtures/serper_{weather,emergency}.json with the
+  queried location substituted in.
+- OpenAIStub: POST /v1/chat/completions (plain and `stream=True` SSE) replays
+  fixtures/chat_completions.json, picking the reply by agent from the system prompt;
+  POST /v1/embeddings returns a deterministic vector.
+
+Notes:
+- Latency is configurable per stub (`latency_ms` +/- `jitter_ms`); the OpenAI stub waits
+  `ttft_ms` before the first chunk and spreads the rest of `latency_ms` over the stream.
+- Both run on 127.0.0.1 with an ephemeral port; use .url after start().
+"""
+
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# system prompt marker -> fixture key
+AGENT_MARKERS = {
+    "Risk Assessment Agent": "risk_assessment_agent",
+    "Advisory Agent": "advisory_agent",
+    "Emergency Agent": "emergency_agent",
+    "Trip Safety Agent": "combined_agent",
+}
+
+
+def _load_fixture(name: str) -> Any:
+    with open(os.path.join(FIXTURES_DIR, name), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _approx_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class _StubServer:
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def _delay(self, ms: Optional[float] = None) -> None:
+        ms = self.latency_ms if ms is None else ms
+        if self.jitter_ms:
+            ms += random.uniform(-self.jitter_ms, self.jitter_ms)
+        if ms > 0:
+            time.sleep(ms / 1000)
+
+    def _count(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def _handler(self):
+        raise NotImplementedError
+
+    def start(self) -> "_StubServer":
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+
+class _JSONHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    stub: Any = None
+
+    def _body(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            return json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return {}
+
+    def _send_json(self, payload: Any, status: int = 200) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+class SerperStub(_StubServer):
+    def __init__(self, latency_ms: float = 150.0, jitter_ms: float = 30.0):
+        super().__init__(latency_ms, jitter_ms)
+        self.weather = json.dumps(_load_fixture("serper_weather.json"))
+        self.emergency = json.dumps(_load_fixture("serper_emergency.json"))
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/search"
+
+    def reply_for(self, query: str) -> Dict[str, Any]:
+        m = re.search(r"\bin (.+?)(?: next 24 hours| helpline|,|$)", query)
+        location = (m.group(1) if m else query).strip()
+        template = self.weather if query.lower().startswith("weather") else self.emergency
+        return json.loads(template.replace("{location}", location.replace('"', "")))
+
+    def _handler(self):
+        stub = self
+
+        class Handler(_JSONHandler):
+            def do_POST(self):
+                body = self._body()
+                stub._count()
+                stub._delay()
+                self._send_json(stub.reply_for(str(body.get("q", ""))))
+
+        return Handler
+
+
+class OpenAIStub(_StubServer):
+    def __init__(
+        self,
+        latency_ms: float = 600.0,
+        jitter_ms: float = 100.0,
+        ttft_ms: float = 150.0,
+        chunk_chars: int = 16,
+    ):
+        super().__init__(latency_ms, jitter_ms)
+        self.ttft_ms = ttft_ms
+        self.chunk_chars = chunk_chars
+        self.replies = _load_fixture("chat_completions.json")
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    def reply_for(self, messages) -> str:
+        system = " ".join(m.get("content", "") for m in messages if m.get("role") == "system")
+        for marker, key in AGENT_MARKERS.items():
+            if marker in system:
+                return self.replies[key]
+        return self.replies["default"]
+
+    def _usage(self, messages, reply: str) -> Dict[str, int]:
+        prompt = _approx_tokens("".join(m.get("content", "") for m in messages))
+        completion = _approx_tokens(reply)
+        with self._lock:
+            self.prompt_tokens += prompt
+            self.completion_tokens += completion
+        return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+    def _handler(self):
+        stub = self
+
+        class Handler(_JSONHandler):
+            def do_POST(self):
+                body = self._body()
+                stub._count()
+                if self.path.endswith("/embeddings"):
+                    return self._embeddings(body)
+                messages = body.get("messages") or []
+                reply = stub.reply_for(messages)
+                usage = stub._usage(messages, reply)
+                if body.get("stream"):
+                    return self._stream(body, reply, usage)
+                stub._delay()
+                self._send_json({
+                    "id": "chatcmpl-stub", "object": "chat.completion", "created": int(time.time()),
+                    "model": body.get("model", "stub"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+                    "usage": usage,
+                })
+
+            def _stream(self, body, reply, usage):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                stub._delay(stub.ttft_ms)
+                pieces = [reply[i:i + stub.chunk_chars] for i in range(0, len(reply), stub.chunk_chars)]
+                per_chunk = max(0.0, stub.latency_ms - stub.ttft_ms) / max(1, len(pieces)) / 1000
+                base = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                        "model": body.get("model", "stub")}
+                for piece in pieces:
+                    chunk = dict(base, choices=[{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    if per_chunk:
+                        time.sleep(per_chunk)
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    chunk = dict(base, choices=[], usage=usage)
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+            def _embeddings(self, body):
+                text = body.get("input") or ""
+                text = text if isinstance(text, str) else " ".join(text)
+                digest = hashlib.sha256(text.encode("utf-8")).digest()
+                vector = [(b - 128) / 128 for b in digest]
+                self._send_json({
+                    "object": "list", "model": body.get("model", "stub"),
+                    "data": [{"object": "embedding", "index": 0, "embedding": vector}],
+                    "usage": {"prompt_tokens": _approx_tokens(text), "total_tokens": _approx_tokens(text)},
+                })
+
+        return Handler
@@ -0,0 +1,465 @@
+"""
+cache.py
+
+Small caching toolkit used around the external lookups.
+
+Contains:
+- LRUCache: thread-safe in-process LRU tier.
+- SQLiteCache: persistent on-disk tier (survives Streamlit restarts).
+- TwoTierCache: LRU in front of SQLite with per-kind TTLs, stale-while-revalidate,
+  request coalescing (concurrent identical keys share one fetch) and hit/miss counters.
+- LLMResponseCache: LRU + TTL cache for LLM replies keyed on canonical JSON of the
+  prompt's input fields, with an optional embedding-similarity fallback.
+- StageCache: input-hash memo for pipeline stages (incremental re-assessment).
+
+Notes:
+- Values must be JSON-serializable (they are stored as JSON on disk).
+- Errors are never cached: pass `should_cache` to reject error payloads.
+"""
+
+import copy
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# (value, expires_at, stale_until)
+Entry = Tuple[Any, float, float]
+
+
+# ---------- In-process tier ----------
+class LRUCache:
+    def __init__(self, maxsize: int = 512):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Entry]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+            return entry
+
+    def set(self, key: str, entry: Entry) -> None:
+        with self._lock:
+            self._data[key] = entry
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+# ---------- On-disk tier ----------
+class SQLiteCache:
+    def __init__(self, path: str, table: str = "cache"):
+        self.path = path
+        self.table = table
+        self._lock = threading.Lock()
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, stale_until REAL NOT NULL)"
+            )
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_stale ON {table}(stale_until)")
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[Entry]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, expires_at, stale_until FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        try:
+            return json.loads(row[0]), row[1], row[2]
+        except ValueError:
+            return None
+
+    def set(self, key: str, entry: Entry) -> None:
+        value, expires_at, stale_until = entry
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, stale_until) "
+                "VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), expires_at, stale_until),
+            )
+            self._conn.commit()
+
+    def purge_expired(self, now: Optional[float] = None) -> int:
+        """Delete entries past stale_until (no longer servable at all); returns how many."""
+        now = time.time() if now is None else now
+        with self._lock:
+            cur = self._conn.execute(f"DELETE FROM {self.table} WHERE stale_until < ?", (now,))
+            self._conn.commit()
+            return cur.rowcount
+
+
+# ---------- Two-tier cache ----------
+class TwoTierCache:
+    """
+    get_or_fetch(key, kind, fetch) resolves a key through memory -> disk -> fetch.
+
+    - fresh entry (now < expires_at): returned directly (hit).
+    - stale entry (expires_at <= now < stale_until): returned directly (stale hit) and
+      refreshed in the background.
+    - missing / too old: fetched; concurrent callers for the same key wait on the one
+      in-flight fetch instead of issuing their own (coalesced).
+
+    The disk tier is purged of entries past stale_until when the cache opens and then
+    every `purge_every` disk writes (on the background pool), so it doesn't keep every
+    query ever made.
+    """
+
+    def __init__(
+        self,
+        ttls: Dict[str, float],
+        stale_grace: Dict[str, float],
+        path: Optional[str] = None,
+        maxsize: int = 512,
+        should_cache: Callable[[Any], bool] = lambda value: True,
+        enabled: bool = True,
+        purge_every: int = 500,
+    ):
+        self.enabled = enabled
+        self.purge_every = max(1, purge_every)
+        self._writes = 0
+        self.ttls = ttls
+        self.stale_grace = stale_grace
+        self.should_cache = should_cache
+        self.memory = LRUCache(maxsize)
+        self.disk = SQLiteCache(path) if path else None
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cache-refresh")
+        self._stats = {
+            "hits": 0, "disk_hits": 0, "stale_hits": 0, "misses": 0,
+            "coalesced": 0, "refreshes": 0, "fetch_errors": 0, "purged": 0,
+        }
+        if self.disk is not None:
+            self._purge()
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def _lookup(self, key: str) -> Optional[Entry]:
+        entry = self.memory.get(key)
+        if entry is not None:
+            return entry
+        if self.disk is None:
+            return None
+        try:
+            entry = self.disk.get(key)
+        except sqlite3.Error:
+            return None
+        if entry is not None:
+            self._count("disk_hits")
+            self.memory.set(key, entry)
+        return entry
+
+    def _store(self, key: str, kind: str, value: Any) -> None:
+        now = time.time()
+        ttl = self.ttls.get(kind, self.ttls.get("default", 0))
+        grace = self.stale_grace.get(kind, self.stale_grace.get("default", 0))
+        entry = (value, now + ttl, now + ttl + grace)
+        self.memory.set(key, entry)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, entry)
+            except sqlite3.Error as e:
+                print("cache write failed:", e)
+                return
+            with self._lock:
+                self._writes += 1
+                purge = self._writes % self.purge_every == 0
+            if purge:
+                self._refresher.submit(self._purge)
+
+    def _purge(self) -> None:
+        try:
+            purged = self.disk.purge_expired()
+        except sqlite3.Error as e:
+            print("cache purge failed:", e)
+            return
+        with self._lock:
+            self._stats["purged"] += purged
+
+    def _fetch_coalesced(self, key: str, kind: str, fetch: Callable[[], Any]) -> Tuple[Future, bool]:
+        """Return (future, is_leader). Only the leader runs `fetch`."""
+        with self._lock:
+            fut = self._inflight.get(key)
+            if fut is not None:
+                return fut, False
+            fut = Future()
+            self._inflight[key] = fut
+        try:
+            value = fetch()
+            if self.should_cache(value):
+                self._store(key, kind, value)
+            else:
+                self._count("fetch_errors")
+            fut.set_result(value)
+        except BaseException as e:
+            self._count("fetch_errors")
+            fut.set_exception(e)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+        return fut, True
+
+    def _refresh(self, key: str, kind: str, fetch: Callable[[], Any]) -> None:
+        with self._lock:
+            if key in self._inflight:
+                return
+        self._count("refreshes")
+        self._refresher.submit(self._fetch_coalesced, key, kind, fetch)
+
+    def get_or_fetch(self, key: str, kind: str, fetch: Callable[[], Any]) -> Any:
+        if not self.enabled:
+            return fetch()
+        now = time.time()
+        entry = self._lookup(key)
+        if entry is not None:
+            value, expires_at, stale_until = entry
+            if now < expires_at:
+                self._count("hits")
+                return value
+            if now < stale_until:
+                self._count("stale_hits")
+                self._refresh(key, kind, fetch)
+                return value
+
+        fut, leader = self._fetch_coalesced(key, kind, fetch)
+        self._count("misses" if leader else "coalesced")
+        return fut.result()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._stats)
+        served = out["hits"] + out["stale_hits"] + out["coalesced"]
+        total = served + out["misses"]
+        out["hit_ratio"] = round(served / total, 3) if total else 0.0
+        out["memory_entries"] = len(self.memory)
+        return out
+
+
+# ---------- LLM response cache ----------
+def canonical_json(obj: Any) -> str:
+    """Stable JSON: sorted keys, no whitespace, non-JSON values stringified."""
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    na = math.sqrt(sum(x * x for x in a))
+    nb = math.sqrt(sum(y * y for y in b))
+    return dot / (na * nb) if na and nb else 0.0
+
+
+class LLMResponseCache:
+    """
+    Caches LLM replies per (agent, canonical input fields).
+
+    - exact lookups hash canonical_json(fields), so dict ordering / reprs don't matter
+    - entries expire after their TTL (callers tie it to the freshness of the inputs)
+    - with `embed` set, a miss falls back to the most similar cached entry of the same
+      agent whose cosine similarity is >= `similarity_threshold`
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 256,
+        default_ttl: float = 900.0,
+        embed: Optional[Callable[[str], List[float]]] = None,
+        similarity_threshold: float = 0.95,
+        enabled: bool = True,
+    ):
+        self.enabled = enabled
+        self.default_ttl = default_ttl
+        self.embed = embed
+        self.similarity_threshold = similarity_threshold
+        self._entries = LRUCache(maxsize)
+        # key -> (agent, embedding); only populated when `embed` is set
+        self._vectors: Dict[str, Tuple[str, List[float]]] = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "lookups": 0, "hits": 0, "semantic_hits": 0, "misses": 0, "stores": 0,
+            "saved_prompt_tokens": 0, "saved_completion_tokens": 0,
+        }
+
+    @staticmethod
+    def make_key(agent: str, fields: Dict[str, Any]) -> Tuple[str, str]:
+        """Returns (key, canonical_text)."""
+        text = canonical_json({"agent": agent, "fields": fields})
+        return hashlib.sha256(text.encode("utf-8")).hexdigest(), text
+
+    def _live(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at, _ = entry
+        if now >= expires_at:
+            self._entries.delete(key)
+            with self._lock:
+                self._vectors.pop(key, None)
+            return None
+        return value
+
+    def _embed(self, text: str) -> Optional[List[float]]:
+        try:
+            return self.embed(text)
+        except Exception as e:
+            print("embedding failed:", e)
+            return None
+
+    def get(self, agent: str, fields: Dict[str, Any]) -> Optional[str]:
+        if not self.enabled:
+            return None
+        now = time.time()
+        key, text = self.make_key(agent, fields)
+        with self._lock:
+            self._stats["lookups"] += 1
+
+        value = self._live(key, now)
+        stat = "hits"
+        if value is None and self.embed is not None:
+            vector = self._embed(text)
+            if vector is not None:
+                with self._lock:
+                    candidates = [(k, v) for k, (a, v) in self._vectors.items() if a == agent]
+                best_key, best_sim = None, self.similarity_threshold
+                for k, v in candidates:
+                    sim = _cosine(vector, v)
+                    if sim >= best_sim:
+                        best_key, best_sim = k, sim
+                if best_key is not None:
+                    value = self._live(best_key, now)
+                    stat = "semantic_hits"
+
+        with self._lock:
+            if value is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats[stat] += 1
+            self._stats["saved_prompt_tokens"] += value.get("prompt_tokens", 0)
+            self._stats["saved_completion_tokens"] += value.get("completion_tokens", 0)
+        return value["text"]
+
+    def put(
+        self,
+        agent: str,
+        fields: Dict[str, Any],
+        text: str,
+        ttl: Optional[float] = None,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+    ) -> None:
+        if not self.enabled:
+            return
+        key, canonical = self.make_key(agent, fields)
+        expires_at = time.time() + (self.default_ttl if ttl is None else ttl)
+        value = {"text": text, "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens}
+        self._entries.set(key, (value, expires_at, expires_at))
+        if self.embed is not None:
+            vector = self._embed(canonical)
+            if vector is not None:
+                with self._lock:
+                    self._vectors[key] = (agent, vector)
+                    # drop vectors whose entries the LRU has already evicted
+                    if len(self._vectors) > self._entries.maxsize:
+                        for k in [k for k in self._vectors if self._entries.get(k) is None]:
+                            self._vectors.pop(k, None)
+        with self._lock:
+            self._stats["stores"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._stats)
+        hits = out["hits"] + out["semantic_hits"]
+        out["hit_ratio"] = round(hits / out["lookups"], 3) if out["lookups"] else 0.0
+        out["saved_tokens"] = out["saved_prompt_tokens"] + out["saved_completion_tokens"]
+        out["entries"] = len(self._entries)
+        return out
+
+
+# ---------- Pipeline stage memo ----------
+class StageCache:
+    """
+    Memoizes pipeline stages by a hash of their inputs, so a rerun only recomputes the
+    stages whose inputs changed. Values are deep-copied in and out (callers mutate them).
+    Entries expire after `default_ttl` (or a per-put ttl): a memoized LLM stage is only
+    as fresh as the retrieval data and LLM replies it was built from.
+    """
+
+    def __init__(self, maxsize: int = 256, enabled: bool = True, default_ttl: float = math.inf):
+        self.enabled = enabled
+        self.default_ttl = default_ttl
+        self._entries = LRUCache(maxsize)
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    @staticmethod
+    def make_key(stage: str, inputs: Any) -> str:
+        return hashlib.sha256(canonical_json({"stage": stage, "inputs": inputs}).encode("utf-8")).hexdigest()
+
+    def _count(self, stage: str, name: str) -> None:
+        with self._lock:
+            counters = self._stats.setdefault(stage, {"hits": 0, "misses": 0})
+            counters[name] += 1
+
+    def get(self, stage: str, inputs: Any) -> Tuple[bool, Any]:
+        """(found, value)."""
+        if not self.enabled:
+            return False, None
+        key = self.make_key(stage, inputs)
+        entry = self._entries.get(key)
+        if entry is not None and time.time() >= entry[1]:
+            self._entries.delete(key)
+            entry = None
+        if entry is None:
+            self._count(stage, "misses")
+            return False, None
+        self._count(stage, "hits")
+        return True, copy.deepcopy(entry[0])
+
+    def put(self, stage: str, inputs: Any, value: Any, ttl: Optional[float] = None) -> None:
+        if self.enabled:
+            expires_at = time.time() + (self.default_ttl if ttl is None else ttl)
+            self._entries.set(self.make_key(stage, inputs), (copy.deepcopy(value), expires_at, expires_at))
+
+    def run(self, stage: str, inputs: Any, fn: Callable[[], Any], ttl: Optional[float] = None) -> Tuple[Any, bool]:
+        """(value, cached): fn() only runs when `inputs` weren't seen before (or expired)."""
+        found, value = self.get(stage, inputs)
+        if found:
+            return value, True
+        value = fn()
+        self.put(stage, inputs, value, ttl)
+        return copy.deepcopy(value) if self.enabled else value, False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = {stage: dict(c) for stage, c in self._stats.items()}
+        for counters in out.values():
+            total = counters["hits"] + counters["misses"]
+            counters["hit_ratio"] = round(counters["hits"] / total, 3) if total else 0.0
+        out["entries"] = len(self._entries)
+        return out
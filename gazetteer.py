@@ -0,0 +1,294 @@
+"""
+gazetteer.py
+
+Offline gazetteer: deterministic location resolution without a network call.
+
+Contains:
+- normalize_name(name): lowercase, accents stripped, punctuation dropped, trailing
+  "city"/"town" removed ("Kandy City" / "kandy" / "KANDY." -> "kandy").
+- Place: (id, name, admin, country, lat, lon) for one canonical place.
+- Gazetteer: exact / prefix / fuzzy lookup over a sorted, memory-mapped key index.
+  - resolve(name, fuzzy): Place for a name or alias; fuzzy (bounded edit distance) is
+    for typed input only (autocomplete / confirm), never for NER output, where it would
+    turn real places outside the gazetteer into near-homonyms ("Colombia" -> Colombo).
+  - find_in_text(text): places named by capitalized 1-3 word spans of free text.
+  - complete(prefix): places whose names start with `prefix` (autocomplete).
+  - areas(): the admin regions and countries the places belong to.
+- get_gazetteer(): the shared instance built from GAZETTEER_PATH (None if unavailable).
+
+Notes:
+- The source is a TSV (data/gazetteer.tsv): id, name, aliases (|-separated), admin
+  region, country, lat, lon. Lines starting with "#" are comments.
+- It is compiled once into GAZETTEER_INDEX_DIR/gazetteer.idx: one sorted line per
+  normalized name/alias carrying the place record. The file is mmap'd read-only, so
+  start-up is an open() and every process (Streamlit, service workers, scheduler)
+  shares the same pages; lookups are a binary search over the mapped bytes.
+- The index is rebuilt (atomically, via os.replace) when the TSV is newer.
+"""
+
+import mmap
+import os
+import re
+import threading
+import unicodedata
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import tracing
+
+GAZETTEER_PATH = os.getenv(
+    "GAZETTEER_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "gazetteer.tsv")
+)
+GAZETTEER_INDEX_DIR = os.getenv("GAZETTEER_INDEX_DIR", os.path.join(".cache", "gazetteer"))
+# candidates scanned per fuzzy lookup (keys sharing the first letter)
+GAZETTEER_FUZZY_SCAN = int(os.getenv("GAZETTEER_FUZZY_SCAN", "5000"))
+
+_SUFFIXES = (" city", " town")
+_NON_WORD = re.compile(r"[^\w\s]")
+_SPACES = re.compile(r"\s+")
+# capitalized words (allowing "Nuwara-Eliya", "Adam's") for the free-text scan
+_CAPITALIZED = re.compile(r"[A-Z][\w'’-]*")
+_MAX_NGRAM = 3
+# aliases that are also common words: not taken as a place when they open a sentence
+# ("Male traveller, ...", "Fort closed?") and stand alone
+COMMON_WORD_ALIASES = frozenset({"male", "fort"})
+_SENTENCE_END = ".!?:;\n"
+
+
+class Place(NamedTuple):
+    id: str
+    name: str
+    admin: str
+    country: str
+    lat: float
+    lon: float
+
+    @property
+    def label(self) -> str:
+        """Search-friendly name, e.g. "Kandy, Sri Lanka"."""
+        return f"{self.name}, {self.country}" if self.country and self.country != self.name else self.name
+
+
+def normalize_name(name: str) -> str:
+    text = unicodedata.normalize("NFKD", str(name or ""))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    text = _SPACES.sub(" ", _NON_WORD.sub(" ", text.replace("'", "").replace("’", ""))).strip()
+    for suffix in _SUFFIXES:
+        if text.endswith(suffix) and len(text) > len(suffix):
+            text = text[: -len(suffix)]
+    return text
+
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance, giving up (returning limit + 1) once it must exceed `limit`."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        if min(cur) > limit:
+            return limit + 1
+        prev = cur
+    return prev[-1]
+
+
+def _fuzzy_limit(key: str) -> int:
+    return 0 if len(key) < 4 else 1 if len(key) < 8 else 2
+
+
+def _sentence_initial(text: str, start: int) -> bool:
+    before = text[:start].rstrip(" \t\"'“‘(")
+    return not before or before[-1] in _SENTENCE_END
+
+
+# ---------- index build ----------
+def _read_source(path: str) -> List[Tuple[str, str]]:
+    """(normalized key, place record) pairs from the TSV."""
+    rows = []
+    with open(path, "r", encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            if not line.strip() or line.startswith("#"):
+                continue
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) != 7:
+                print(f"gazetteer: {path}:{lineno}: expected 7 columns, got {len(cols)}; skipped")
+                continue
+            place_id, name, aliases, admin, country, lat, lon = (c.strip() for c in cols)
+            try:
+                float(lat), float(lon)
+            except ValueError:
+                print(f"gazetteer: {path}:{lineno}: bad coordinates; skipped")
+                continue
+            record = "\t".join((place_id, name, admin, country, lat, lon))
+            for alias in [name, *aliases.split("|")]:
+                key = normalize_name(alias)
+                if key:
+                    rows.append((key, record))
+    return rows
+
+
+def build_index(source: str, index_path: str) -> int:
+    """Compile `source` into the sorted key index at `index_path`; returns the key count."""
+    rows = sorted(set(_read_source(source)), key=lambda r: (r[0].encode("utf-8"), r[1]))
+    os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+    tmp = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        for key, record in rows:
+            f.write(f"{key}\t{record}\n".encode("utf-8"))
+    os.replace(tmp, index_path)
+    return len(rows)
+
+
+# ---------- lookup ----------
+class Gazetteer:
+    def __init__(self, source: str = GAZETTEER_PATH, index_dir: str = GAZETTEER_INDEX_DIR):
+        self.source = source
+        self.index_path = os.path.join(index_dir, "gazetteer.idx")
+        if not os.path.exists(self.index_path) or os.path.getmtime(self.index_path) < os.path.getmtime(source):
+            with tracing.span("gazetteer.build", source=source) as sp:
+                sp.set(keys=build_index(source, self.index_path))
+        self._areas: Optional[Dict[str, Tuple[str, str]]] = None
+        self._file = open(self.index_path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def close(self) -> None:
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+        self._file.close()
+
+    # ---------- raw index access ----------
+    def _lower_bound(self, key: bytes) -> int:
+        """Offset of the first line whose key is >= `key`."""
+        mm = self._mm
+        lo, hi = 0, len(mm)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = mm.rfind(b"\n", 0, mid) + 1
+            end = mm.find(b"\n", start)
+            if mm[start:mm.find(b"\t", start, end)] < key:
+                lo = end + 1
+            else:
+                hi = start
+        return lo
+
+    def _scan(self, prefix: str) -> Iterator[Tuple[str, Place]]:
+        """(key, place) for every key starting with `prefix`, in key order."""
+        mm = self._mm
+        needle = prefix.encode("utf-8")
+        pos = self._lower_bound(needle)
+        while pos < len(mm):
+            end = mm.find(b"\n", pos)
+            end = len(mm) if end < 0 else end
+            line = mm[pos:end].decode("utf-8")
+            pos = end + 1
+            key, place_id, name, admin, country, lat, lon = line.split("\t")
+            if not key.startswith(prefix):
+                return
+            yield key, Place(place_id, name, admin, country, float(lat), float(lon))
+
+    # ---------- public lookups ----------
+    def exact(self, name: str) -> Optional[Place]:
+        key = normalize_name(name)
+        if not key:
+            return None
+        for found, place in self._scan(key):
+            return place if found == key else None
+        return None
+
+    def fuzzy(self, name: str, max_distance: Optional[int] = None) -> Optional[Place]:
+        """Closest key within the edit-distance limit (ties: first in key order)."""
+        key = normalize_name(name)
+        limit = _fuzzy_limit(key) if max_distance is None else max_distance
+        if not key or limit <= 0:
+            return None
+        best: Optional[Tuple[int, Place]] = None
+        for n, (candidate, place) in enumerate(self._scan(key[0])):
+            if n >= GAZETTEER_FUZZY_SCAN:
+                break
+            d = _edit_distance(key, candidate, limit if best is None else best[0] - 1)
+            if d <= limit and (best is None or d < best[0]):
+                best = (d, place)
+                if d == 1:
+                    break
+        return best[1] if best else None
+
+    def resolve(self, name: str, fuzzy: bool = False) -> Optional[Place]:
+        """Exact name/alias match; fuzzy=True also tries fuzzy() (typed input only)."""
+        return self.exact(name) or (self.fuzzy(name) if fuzzy else None)
+
+    def complete(self, prefix: str, limit: int = 10) -> List[Place]:
+        out: List[Place] = []
+        seen = set()
+        key = normalize_name(prefix)
+        if not key:
+            return out
+        for _, place in self._scan(key):
+            if place.id not in seen:
+                seen.add(place.id)
+                out.append(place)
+                if len(out) >= limit:
+                    break
+        return out
+
+    def areas(self) -> Dict[str, Tuple[str, str]]:
+        """normalized admin-region / country name -> ("admin" | "country", name as written)."""
+        if self._areas is None:
+            areas: Dict[str, Tuple[str, str]] = {}
+            for _, place in self._scan(""):
+                for kind, name in (("country", place.country), ("admin", place.admin)):
+                    areas.setdefault(normalize_name(name), (kind, name))
+            areas.pop("", None)
+            self._areas = areas
+        return self._areas
+
+    def find_in_text(self, text: str) -> List[Place]:
+        """
+        Places named in `text`, longest match first, in order of appearance.
+        Only capitalized spans are tried, so "male" / "ella" in running text don't match;
+        matching is exact (no fuzzy), which keeps junk like "Please" / "Check" out. A single
+        word in COMMON_WORD_ALIASES opening a sentence ("Male traveller") is skipped too.
+        """
+        words = [(m.group(0), m.start(), m.end()) for m in _CAPITALIZED.finditer(text or "")]
+        out: List[Place] = []
+        seen = set()
+        i = 0
+        while i < len(words):
+            for n in range(min(_MAX_NGRAM, len(words) - i), 0, -1):
+                group = words[i:i + n]
+                # only contiguous words (separated by whitespace) form a name
+                if any(text[a[2]:b[1]].strip() for a, b in zip(group, group[1:])):
+                    continue
+                span = text[group[0][1]:group[-1][2]]
+                if n == 1 and _sentence_initial(text, group[0][1]) and normalize_name(span) in COMMON_WORD_ALIASES:
+                    continue
+                place = self.exact(span)
+                if place is not None:
+                    if place.id not in seen:
+                        seen.add(place.id)
+                        out.append(place)
+                    i += n
+                    break
+            else:
+                i += 1
+        return out
+
+
+_default: Optional[Gazetteer] = None
+_default_error: Optional[str] = None
+_default_lock = threading.Lock()
+
+
+def get_gazetteer() -> Optional[Gazetteer]:
+    """Shared gazetteer, or None when GAZETTEER_PATH can't be read (callers fall back)."""
+    global _default, _default_error
+    if _default is None and _default_error is None:
+        with _default_lock:
+            if _default is None and _default_error is None:
+                try:
+                    _default = Gazetteer()
+                except OSError as e:
+                    _default_error = str(e)
+                    print("gazetteer unavailable:", _default_error)
+    return _default
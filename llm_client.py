@@ -0,0 +1,545 @@
+"""
+llm_client.py
+
+Shared async OpenAI client for the agents.
+
+Contains:
+- AsyncLLMClient: one AsyncOpenAI client on a background event loop, with
+  - at most `max_concurrency` calls in flight per process (callers queue for a slot)
+  - a per-call timeout (for streams: to the first token, then between chunks)
+  - retries with full-jitter backoff on timeouts, 429, 5xx and connection errors
+    (a Retry-After header overrides the computed delay)
+  - hedging: a call still running after the recent p95 latency (LLM_HEDGE_AFTER_S until
+    there is enough history) gets an identical second request raced against it; the
+    first to answer wins and the other is cancelled
+  - a tokens-per-minute budget shared by every call: the estimated prompt + max_tokens
+    is reserved up front and the unused part refunded from the reported usage
+  - structured output (response_format) with a plain-text retry when the server rejects
+    it; a backend (base URL + model) that rejected it is sent plain text from then on
+  - complete(...) / stream(...) coroutines and metrics()
+- LLMError: the call failed for good (retries exhausted, or a non-retryable error).
+- get_llm_client() / llm_client_metrics(): the process-wide instance.
+
+Sync callers drive the coroutines with client.run(coro), client.submit(coro) (a
+concurrent.futures.Future) or client.iterate(async_gen); that is what the agents' sync
+handle() wrappers do. Code on another event loop awaits asyncio.wrap_future(submit(coro))
+or reads client.aiterate(async_gen).
+
+Notes:
+- The loop runs in one daemon thread per process. The caller's contextvars (the tracing
+  context) are carried onto the loop.
+- Never call run()/iterate() from code already running on the loop (it would deadlock);
+  async code awaits the coroutines directly.
+- A hedge takes its own concurrency slot (only if one is free right now, never queueing)
+  and counts as in flight, so requests on the wire never exceed max_concurrency; it also
+  needs room in the TPM budget, so hedges never add load when the provider is already
+  the bottleneck.
+- The TPM budget is charged once per logical call (not per attempt), before the call
+  queues for a concurrency slot. Whatever it did not use goes back when it ends: by the
+  reported usage; for a stream cut short (stall, error, cancellation, consumer gone) by
+  the prompt plus what was streamed; in full when it failed or was cancelled before
+  producing anything.
+"""
+
+import asyncio
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+import openai
+
+from prompts import count_tokens
+from utils import TokenBucket
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE", "1") == "1"
+LLM_HEDGE_AFTER_S = float(os.getenv("LLM_HEDGE_AFTER_S", "5"))
+# latency samples needed before the hedge delay follows the observed p95
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+# tokens per minute for this process (0 = unlimited)
+LLM_TPM = int(os.getenv("LLM_TPM", "200000"))
+
+RETRYABLE_ERRORS = (
+    asyncio.TimeoutError,
+    openai.APIConnectionError,  # includes APITimeoutError
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+_END = object()
+
+
+class LLMError(Exception):
+    """An LLM call that failed after retries (or with a non-retryable error)."""
+
+
+def _has_content(chunk: Any) -> bool:
+    return bool(chunk.choices) and chunk.choices[0].delta is not None and bool(chunk.choices[0].delta.content)
+
+
+async def _anext(it: AsyncIterator) -> Any:
+    try:
+        return await it.__anext__()
+    except StopAsyncIteration:
+        return _END
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return max(0.0, float(value)) if value else None
+    except ValueError:
+        return None
+
+
+class AsyncLLMClient:
+    def __init__(
+        self,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        timeout: float = LLM_TIMEOUT_S,
+        max_retries: int = LLM_MAX_RETRIES,
+        hedge: bool = LLM_HEDGE_ENABLED,
+        hedge_after: float = LLM_HEDGE_AFTER_S,
+        tpm: int = LLM_TPM,
+        backoff_base: float = 0.5,
+        backoff_cap: float = 8.0,
+        max_wait: float = 30.0,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.hedge = hedge
+        self.hedge_after = hedge_after
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.max_wait = max_wait
+        self._bucket = TokenBucket(tpm / 60.0, tpm) if tpm > 0 else None
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._client: Optional[openai.AsyncOpenAI] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        # (base URL, model) pairs that rejected response_format; only touched on the loop
+        self._plain_text_backends: Set[Tuple[str, Optional[str]]] = set()
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        # seconds to the full reply ("complete") / to the first token ("stream")
+        self._latencies = {"complete": deque(maxlen=512), "stream": deque(maxlen=512)}
+        self._metrics = {
+            "calls": 0, "requests": 0, "retries": 0, "hedges": 0, "hedge_wins": 0,
+            "timeouts": 0, "errors": 0, "tpm_waits": 0, "tpm_wait_s": 0.0, "max_in_flight": 0,
+            "structured_disabled": 0,
+        }
+
+    # ---------- event loop ----------
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    self._thread = threading.Thread(target=loop.run_forever, name="llm-loop", daemon=True)
+                    self._thread.start()
+                    self._loop = loop
+        return self._loop
+
+    def submit(self, coro: Awaitable) -> Future:
+        """Schedule `coro` on the client's loop (with the caller's context); returns a Future."""
+        loop = self.loop
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("called from the LLM loop thread; await the coroutine instead")
+        return asyncio.run_coroutine_threadsafe(coro, loop)
+
+    def run(self, coro: Awaitable, timeout: Optional[float] = None) -> Any:
+        """Blocking: the result of `coro`, run on the client's loop."""
+        return self.submit(coro).result(timeout)
+
+    def iterate(self, agen: AsyncIterator) -> Iterator:
+        """Blocking iterator over an async generator that runs on the client's loop."""
+        items: "queue.Queue" = queue.Queue()
+
+        async def pump():
+            try:
+                async for item in agen:
+                    items.put((True, item))
+            except Exception as e:
+                items.put((False, e))
+            else:
+                items.put((False, None))
+            finally:
+                await agen.aclose()
+
+        fut = self.submit(pump())
+        try:
+            while True:
+                ok, value = items.get()
+                if not ok:
+                    if value is not None:
+                        raise value
+                    return
+                yield value
+        finally:
+            # consumer stopped early: cancel the call instead of letting it run on
+            fut.cancel()
+
+    async def aiterate(self, agen: AsyncIterator) -> AsyncIterator:
+        """
+        Async iterator, for another event loop (e.g. the HTTP server's), over an async
+        generator that runs on the client's loop. Items cross over through an
+        asyncio.Queue on the caller's loop; no thread waits on the stream.
+        """
+        caller = asyncio.get_running_loop()
+        items: "asyncio.Queue" = asyncio.Queue()
+
+        def put(item) -> None:
+            caller.call_soon_threadsafe(items.put_nowait, item)
+
+        async def pump():
+            try:
+                async for item in agen:
+                    put((True, item))
+            except Exception as e:
+                put((False, e))
+            else:
+                put((False, None))
+            finally:
+                await agen.aclose()
+
+        fut = asyncio.wrap_future(self.submit(pump()))
+        try:
+            while True:
+                ok, value = await items.get()
+                if not ok:
+                    if value is not None:
+                        raise value
+                    return
+                yield value
+        finally:
+            # consumer went away (client disconnected): cancel the work on the LLM loop
+            fut.cancel()
+
+    def start(self) -> None:
+        """Start the loop and build the AsyncOpenAI client now (warm-up) rather than on the first call."""
+
+        async def build():
+            try:
+                self._get_client()
+            except openai.OpenAIError as e:
+                print("LLM client not ready:", e)
+
+        self.run(build())
+
+    # ---------- bookkeeping ----------
+    def _count(self, **deltas: float) -> None:
+        with self._lock:
+            for key, value in deltas.items():
+                self._metrics[key] += value
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        return self._slots
+
+    def _occupy(self, delta: int) -> None:
+        with self._lock:
+            self._in_flight += delta
+            self._metrics["max_in_flight"] = max(self._metrics["max_in_flight"], self._in_flight)
+
+    @asynccontextmanager
+    async def _slot(self):
+        async with self._semaphore():
+            self._occupy(1)
+            try:
+                yield
+            finally:
+                self._occupy(-1)
+
+    async def _try_slot(self) -> bool:
+        """Take a slot only if one is free right now, without queueing (hedges)."""
+        slots = self._semaphore()
+        if slots.locked():
+            return False
+        await slots.acquire()  # free slot: returns without suspending
+        self._occupy(1)
+        return True
+
+    def _release_slot(self) -> None:
+        self._occupy(-1)
+        self._semaphore().release()
+
+    def _backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        if retry_after is not None:
+            return min(retry_after, self.max_wait)
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    def _hedge_delay(self, kind: str) -> Optional[float]:
+        if not self.hedge:
+            return None
+        with self._lock:
+            lat = sorted(self._latencies[kind])
+        if len(lat) < LLM_HEDGE_MIN_SAMPLES:
+            return min(self.hedge_after, self.timeout)
+        return min(lat[min(len(lat) - 1, int(len(lat) * 0.95))], self.timeout)
+
+    # ---------- tokens-per-minute budget ----------
+    @staticmethod
+    def _estimate(messages: List[Dict[str, str]], max_tokens: Optional[int]) -> int:
+        return sum(count_tokens(m.get("content") or "") for m in messages) + (max_tokens or 0)
+
+    async def _charge(self, tokens: int) -> None:
+        if self._bucket is None:
+            return
+        wait_s = self._bucket.reserve(tokens)
+        if wait_s > 0:
+            self._count(tpm_waits=1, tpm_wait_s=wait_s)
+            await asyncio.sleep(wait_s)
+
+    async def _take_hedge(self, tokens: int) -> bool:
+        """A concurrency slot and TPM budget for a hedge, if both are free right now."""
+        if not await self._try_slot():
+            return False
+        if self._bucket is not None and self._bucket.reserve(tokens) > 0:
+            self._bucket.release(tokens)
+            self._release_slot()
+            return False
+        return True
+
+    def _refund(self, estimate: int, usage: Any, used: Optional[int] = None) -> None:
+        """
+        Give back the unused part of a reservation: measured by the reported usage, else
+        by `used` (a local count, 0 for calls that got nothing); no refund without either.
+        """
+        total = getattr(usage, "total_tokens", None) if usage is not None else None
+        if not total:
+            total = used
+        if self._bucket is not None and total is not None:
+            self._bucket.release(max(0, estimate - total))
+
+    # ---------- requests ----------
+    def _get_client(self) -> openai.AsyncOpenAI:
+        # only touched from the loop thread; max_retries=0 because retries happen here
+        if self._client is None:
+            self._client = openai.AsyncOpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"), max_retries=0, timeout=self.timeout
+            )
+        return self._client
+
+    async def _create(self, kwargs: Dict[str, Any], response_format: Optional[Dict[str, Any]]):
+        """
+        chat.completions.create; retried once as plain text if the server rejects
+        response_format. Once a plain retry works, that (base URL, model) is sent plain text
+        from then on instead of paying a failed 400 round trip per call.
+        """
+        self._count(requests=1)
+        client = self._get_client()
+        backend = (str(client.base_url), kwargs.get("model"))
+        rejected = False
+        if response_format is not None and backend not in self._plain_text_backends:
+            try:
+                return await client.chat.completions.create(response_format=response_format, **kwargs)
+            except openai.BadRequestError as e:
+                print("structured output rejected, retrying as plain text:", e)
+                rejected = True
+        resp = await client.chat.completions.create(**kwargs)
+        if rejected and backend not in self._plain_text_backends:
+            # only now: a 400 that plain text also fails is not about response_format
+            self._plain_text_backends.add(backend)
+            self._count(structured_disabled=1)
+            print(f"structured output disabled for {backend[1]} at {backend[0]}")
+        return resp
+
+    async def _hedged(
+        self,
+        kind: str,
+        attempt: Callable[[], Awaitable[Any]],
+        estimate: int,
+        discard: Optional[Callable[[Any], None]] = None,
+    ) -> Any:
+        first = asyncio.ensure_future(attempt())
+        delay = self._hedge_delay(kind)
+        if delay is None:
+            return await first
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done or not await self._take_hedge(estimate):
+            return await first
+
+        # slow tail: race an identical request against the first one
+        self._count(hedges=1)
+        second = asyncio.ensure_future(attempt())
+        pending = {first, second}
+        winner = None
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and winner is None:
+                        winner = task
+                    elif task.exception() is not None:
+                        error = task.exception()
+                if winner is not None:
+                    if winner is second:
+                        self._count(hedge_wins=1)
+                    return winner.result()
+            raise error
+        finally:
+            for task in (first, second):
+                if not task.done():
+                    task.cancel()
+                elif task is not winner and discard is not None and not task.cancelled() and task.exception() is None:
+                    discard(task.result())
+            # one request survives the race; it runs on the caller's slot
+            self._release_slot()
+
+    async def _with_retries(
+        self,
+        kind: str,
+        attempt: Callable[[], Awaitable[Any]],
+        estimate: int,
+        discard: Optional[Callable[[Any], None]] = None,
+    ) -> Any:
+        error: Optional[BaseException] = None
+        for n in range(self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                result = await self._hedged(kind, attempt, estimate, discard)
+            except RETRYABLE_ERRORS as e:
+                error = e
+                if isinstance(e, (asyncio.TimeoutError, openai.APITimeoutError)):
+                    self._count(timeouts=1)
+                if n < self.max_retries:
+                    self._count(retries=1)
+                    await asyncio.sleep(self._backoff(n, _retry_after(e)))
+                continue
+            except openai.OpenAIError as e:
+                error = e
+                break
+            with self._lock:
+                self._latencies[kind].append(time.perf_counter() - start)
+            return result
+        self._count(errors=1)
+        raise LLMError(f"{type(error).__name__}: {error}") from error
+
+    async def complete(
+        self, messages: List[Dict[str, str]], response_format: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> Any:
+        """The chat completion response; raises LLMError."""
+        kwargs = dict(kwargs, messages=messages)
+        estimate = self._estimate(messages, kwargs.get("max_tokens"))
+        self._count(calls=1)
+
+        async def attempt():
+            return await asyncio.wait_for(self._create(kwargs, response_format), self.timeout)
+
+        # charged once per logical call, before queueing for a slot (a call waiting on
+        # the budget holds none); a call that fails or is cancelled gets it all back
+        resp = None
+        try:
+            await self._charge(estimate)
+            async with self._slot():
+                resp = await self._with_retries("complete", attempt, estimate)
+        finally:
+            self._refund(estimate, getattr(resp, "usage", None), used=0 if resp is None else None)
+        return resp
+
+    async def stream(
+        self, messages: List[Dict[str, str]], response_format: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> AsyncIterator[Any]:
+        """
+        Chunks of a streamed chat completion (the last one carries usage); raises LLMError.
+        Retries and hedging cover the time to the first token; after that a stall longer
+        than the timeout ends the stream with LLMError.
+        """
+        kwargs = dict(kwargs, messages=messages, stream=True, stream_options={"include_usage": True})
+        estimate = self._estimate(messages, kwargs.get("max_tokens"))
+        self._count(calls=1)
+
+        async def attempt():
+            stream = await asyncio.wait_for(self._create(kwargs, response_format), self.timeout)
+            try:
+                it = stream.__aiter__()
+                head = []
+                while not head or not _has_content(head[-1]):
+                    chunk = await asyncio.wait_for(_anext(it), self.timeout)
+                    if chunk is _END:
+                        break
+                    head.append(chunk)
+                return stream, it, head
+            except BaseException:
+                await stream.close()
+                raise
+
+        def discard(result):
+            asyncio.ensure_future(result[0].close())
+
+        usage = None
+        # without a usage chunk (stall, error, cancellation, consumer gone) the refund
+        # counts the prompt plus what was streamed; nothing streamed -> all of it
+        used: Optional[int] = None
+        text: List[str] = []
+        try:
+            await self._charge(estimate)
+            async with self._slot():
+                stream, it, head = await self._with_retries("stream", attempt, estimate, discard)
+                used = estimate - (kwargs.get("max_tokens") or 0)
+                try:
+                    for chunk in head:
+                        usage = getattr(chunk, "usage", None) or usage
+                        if _has_content(chunk):
+                            text.append(chunk.choices[0].delta.content)
+                        yield chunk
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(_anext(it), self.timeout)
+                        except asyncio.TimeoutError as e:
+                            self._count(timeouts=1, errors=1)
+                            raise LLMError(f"stream stalled for {self.timeout}s") from e
+                        except openai.OpenAIError as e:
+                            self._count(errors=1)
+                            raise LLMError(f"{type(e).__name__}: {e}") from e
+                        if chunk is _END:
+                            break
+                        usage = getattr(chunk, "usage", None) or usage
+                        if _has_content(chunk):
+                            text.append(chunk.choices[0].delta.content)
+                        yield chunk
+                finally:
+                    await stream.close()
+        finally:
+            self._refund(estimate, usage, used=0 if used is None else used + count_tokens("".join(text)))
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._metrics, in_flight=self._in_flight, max_concurrency=self.max_concurrency)
+            latencies = {kind: sorted(lat) for kind, lat in self._latencies.items()}
+        out["tpm_wait_s"] = round(out["tpm_wait_s"], 3)
+        for kind, lat in latencies.items():
+            if lat:
+                out[f"{kind}_latency_ms"] = {
+                    "p50": round(lat[len(lat) // 2] * 1000, 1),
+                    "p95": round(lat[min(len(lat) - 1, int(len(lat) * 0.95))] * 1000, 1),
+                    "max": round(lat[-1] * 1000, 1),
+                }
+            delay = self._hedge_delay(kind)
+            out[f"{kind}_hedge_after_ms"] = None if delay is None else round(delay * 1000, 1)
+        return out
+
+
+_llm_client = AsyncLLMClient()
+
+
+def get_llm_client() -> AsyncLLMClient:
+    return _llm_client
+
+
+def llm_client_metrics() -> Dict[str, Any]:
+    return _llm_client.metrics()
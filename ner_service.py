@@ -0,0 +1,225 @@
+"""
+ner_service.py
+
+NER on a pool of worker processes, shared by every session/request in the process.
+
+Contains:
+- NERService: spaCy loaded once per worker process (NER_WORKERS of them); callers
+  submit texts and get concurrent.futures.Futures back. A dispatcher thread
+  micro-batches whatever arrives within NER_BATCH_WAIT_MS (up to NER_MAX_BATCH texts)
+  into one nlp.pipe call on a worker; several batches run on different workers at once.
+- get_ner_service(): the shared service, or None when NER_WORKERS=0 (the default).
+- extract_entities(text) / extract_entities_many(texts) / extract_entities_async(text):
+  {"locations", "time", "transport"} per text, through the pool when it is enabled and
+  in-process (nlp.py) otherwise.
+- ner_service_stats(): requests / batches / mean batch size / fallbacks.
+
+Notes:
+- Memory is N model copies instead of one per serving process, and NER no longer holds
+  the GIL on the request thread, so other sessions keep running while it works.
+- Workers are started with "spawn" (safe next to the app's threads). The entry script
+  must therefore be importable without side effects (`if __name__ == "__main__"`);
+  `streamlit run` and uvicorn already are.
+- If the pool breaks (a worker dies), the affected requests and everything after it are
+  answered in-process, so extraction never fails because of the pool.
+"""
+
+import asyncio
+import atexit
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import nlp
+import tracing
+
+NER_WORKERS = int(os.getenv("NER_WORKERS", "0"))
+NER_MAX_BATCH = int(os.getenv("NER_MAX_BATCH", "64"))
+NER_BATCH_WAIT_MS = float(os.getenv("NER_BATCH_WAIT_MS", "5"))
+
+Entities = Dict[str, Any]
+
+
+# ---------- worker process ----------
+def _init_worker() -> None:
+    nlp._lazy_load_spacy()
+
+
+def _extract_batch(texts: List[str]) -> List[Entities]:
+    return nlp.extract_entities_batch(texts)
+
+
+def _extract_local(text: str) -> Entities:
+    # the in-process path, exactly as the agents ran it before the pool existed
+    locations = nlp.extract_locations(text)
+    with tracing.span("extract.time_transport"):
+        return {
+            "locations": locations,
+            "time": nlp.extract_time(text),
+            "transport": nlp.extract_transport_mode(text),
+        }
+
+
+# ---------- service ----------
+class NERService:
+    def __init__(self, workers: int = NER_WORKERS, max_batch: int = NER_MAX_BATCH, batch_wait_ms: float = NER_BATCH_WAIT_MS):
+        self.workers = max(1, workers)
+        self.max_batch = max(1, max_batch)
+        self.batch_wait = max(0.0, batch_wait_ms) / 1000
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+        self._broken = False
+        self._queue: "queue.Queue[Optional[Tuple[str, Future]]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "batches": 0, "texts": 0, "fallbacks": 0, "errors": 0}
+        self._dispatcher = threading.Thread(target=self._dispatch, name="ner-dispatch", daemon=True)
+        self._dispatcher.start()
+
+    def warm(self, timeout: Optional[float] = None) -> None:
+        """Start every worker and load its model now (one tiny batch per worker)."""
+        futures = [self._pool.submit(_extract_batch, ["warm up"]) for _ in range(self.workers)]
+        for fut in futures:
+            fut.result(timeout)
+
+    def submit(self, text: str) -> "Future[Entities]":
+        fut: "Future[Entities]" = Future()
+        with self._lock:
+            self._stats["requests"] += 1
+        self._queue.put((text, fut))
+        return fut
+
+    def submit_many(self, texts: List[str]) -> List["Future[Entities]"]:
+        return [self.submit(t) for t in texts]
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._stats, workers=self.workers, broken=self._broken)
+        out["mean_batch"] = round(out["texts"] / out["batches"], 2) if out["batches"] else 0.0
+        return out
+
+    # ---------- dispatcher ----------
+    def _next_batch(self, first: Tuple[str, Future]) -> List[Tuple[str, Future]]:
+        batch = [first]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _dispatch(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [(text, fut) for text, fut in self._next_batch(item) if fut.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            # identical texts in one batch are extracted once
+            texts = list(dict.fromkeys(text for text, _ in batch))
+            with self._lock:
+                self._stats["batches"] += 1
+                self._stats["texts"] += len(texts)
+            if self._broken:
+                self._answer_locally(batch)
+                continue
+            try:
+                pool_fut = self._pool.submit(_extract_batch, texts)
+            except Exception as e:
+                self._mark_broken(e)
+                self._answer_locally(batch)
+                continue
+            pool_fut.add_done_callback(lambda f, batch=batch, texts=texts: self._deliver(f, batch, texts))
+
+    def _deliver(self, pool_fut: Future, batch: List[Tuple[str, Future]], texts: List[str]) -> None:
+        try:
+            results = dict(zip(texts, pool_fut.result()))
+        except Exception as e:
+            self._mark_broken(e)
+            # off the pool's callback thread: in-process extraction can take a while
+            threading.Thread(target=self._answer_locally, args=(batch,), daemon=True).start()
+            return
+        for text, fut in batch:
+            fut.set_result(dict(results[text]))
+
+    def _mark_broken(self, error: BaseException) -> None:
+        with self._lock:
+            self._stats["errors"] += 1
+            if not self._broken:
+                print("NER worker pool failed, extracting in-process from now on:", error)
+            self._broken = True
+
+    def _answer_locally(self, batch: List[Tuple[str, Future]]) -> None:
+        with self._lock:
+            self._stats["fallbacks"] += len(batch)
+        try:
+            results = nlp.extract_entities_batch([text for text, _ in batch])
+        except Exception as e:
+            for _, fut in batch:
+                fut.set_exception(e)
+            return
+        for (_, fut), entities in zip(batch, results):
+            fut.set_result(entities)
+
+
+_service: Optional[NERService] = None
+_service_lock = threading.Lock()
+
+
+def get_ner_service() -> Optional[NERService]:
+    global _service
+    if NER_WORKERS <= 0:
+        return None
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = NERService()
+                atexit.register(_service.close)
+    return _service
+
+
+def ner_service_stats() -> Dict[str, Any]:
+    service = _service
+    return service.stats() if service is not None else {"workers": 0}
+
+
+# ---------- callers ----------
+def extract_entities(text: str) -> Entities:
+    service = get_ner_service()
+    if service is None:
+        return _extract_local(text)
+    with tracing.span("ner.extract", chars=len(text), workers=service.workers):
+        return service.submit(text).result()
+
+
+def extract_entities_many(texts: List[str]) -> List[Entities]:
+    service = get_ner_service()
+    if service is None:
+        return nlp.extract_entities_batch(texts)
+    with tracing.span("ner.batch", texts=len(texts), workers=service.workers):
+        return [fut.result() for fut in service.submit_many(list(texts))]
+
+
+async def extract_entities_async(text: str) -> Entities:
+    service = get_ner_service()
+    if service is None:
+        return await asyncio.to_thread(_extract_local, text)
+    with tracing.span("ner.extract", chars=len(text), workers=service.workers):
+        return await asyncio.wrap_future(service.submit(text))
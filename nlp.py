@@ -1,69 +1,221 @@
 """
 nlp.py
 spaCy-based NER and simple heuristics for transport & time.
+
+The spaCy pipeline is loaded with only what NER needs (see UNUSED_PIPES);
+extract_entities_batch runs many texts through nlp.pipe in one pass.
+
+The model is never downloaded at request time: install it at build time with
+`python warmup.py --download`. If it is missing, location extraction degrades to the
+gazetteer scan (known place names only) and spacy_load_error() says why.
+
+Locations are resolved to canonical names through the offline gazetteer
+(gazetteer.py), so "Kandy" and "kandy city" both come out as "Kandy". Resolution is
+exact (names and aliases only): fuzzy matching NER output would rewrite real places
+outside the gazetteer ("Colombia", "Mali") into a different, known place.
+
+Time and transport come from one precompiled, word-boundary-aware regex (built from a
+trie of surface forms), so "care"/"business" no longer match "car"/"bus".
 """
 
+import os
 import re  #Pattern search
-from typing import List, Optional
+from datetime import date, datetime, time as dt_time, timedelta
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
 import spacy
-from dateutil import parser as date_parser
+
+import tracing
+from gazetteer import get_gazetteer
 nlp = None
+_load_error = None
 
+SPACY_MODEL = os.getenv("SPACY_MODEL", "en_core_web_sm")
 LOC_ENT_LABELS = {"GPE", "LOC", "FAC", "NORP"}
+# Only ent.label_ is used, so skip everything that isn't NER (tok2vec stays for ner).
+UNUSED_PIPES = ["tagger", "parser", "attribute_ruler", "lemmatizer", "senter"]
 
 def _lazy_load_spacy():
-    global nlp
-    if nlp is None:
+    global nlp, _load_error
+    if nlp is None and _load_error is None:
         try:
-            nlp = spacy.load("en_core_web_sm")
-        except Exception:
-            # fallback: download if not present (note: requires internet at setup)
-            from spacy.cli import download
-            download("en_core_web_sm")
-            nlp = spacy.load("en_core_web_sm")
+            nlp = spacy.load(SPACY_MODEL, exclude=UNUSED_PIPES)
+        except Exception as e:
+            # no download here: this can run inside a user request
+            _load_error = f"{SPACY_MODEL} not loadable ({e}); run `python warmup.py --download`"
+            print("spaCy load failed:", _load_error)
     return nlp
 
+def spacy_load_error() -> Optional[str]:
+    return _load_error
+
 def extract_locations(text: str) -> List[str]:
-    n = _lazy_load_spacy()
-    doc = n(text)
-    locs = [ent.text for ent in doc.ents if ent.label_ in LOC_ENT_LABELS]
-    # deduplicate & return
+    with tracing.span("ner.extract", chars=len(text)):
+        n = _lazy_load_spacy()
+        return _locations_from_doc(n(text) if n is not None else None, text)
+
+def extract_entities_batch(
+    texts: Iterable[str], batch_size: int = 64, n_process: int = 1
+) -> List[Dict[str, Any]]:
+    """
+    Locations, time and transport for many texts in one nlp.pipe pass.
+    Returns one {"locations", "time", "transport"} dict per input text, in order.
+    """
+    texts = list(texts)
+    with tracing.span("ner.batch", texts=len(texts), batch_size=batch_size, n_process=n_process):
+        n = _lazy_load_spacy()
+        docs = n.pipe(texts, batch_size=batch_size, n_process=n_process) if n is not None else [None] * len(texts)
+        out = []
+        for text, doc in zip(texts, docs):
+            out.append({
+                "locations": _locations_from_doc(doc, text),
+                "time": extract_time(text),
+                "transport": extract_transport_mode(text),
+            })
+        return out
+
+def _locations_from_doc(doc, text: str) -> List[str]:
+    """
+    NER locations resolved through the offline gazetteer to canonical names
+    ("kandy city" -> "Kandy"); unresolved NER entities are kept as written.
+    Without NER hits, only capitalized spans that name a known place are used, so
+    words like "Please" or "Check" at the start of a sentence are no longer locations.
+    """
+    locs = [ent.text for ent in doc.ents if ent.label_ in LOC_ENT_LABELS] if doc is not None else []
+    gaz = get_gazetteer()
+    # deduplicate (on the canonical place id when resolved) & return
     seen = set()
     out = []
     for l in locs:
         s = l.strip()
-        if s and s.lower() not in seen:
-            seen.add(s.lower())
-            out.append(s)
-    # heuristic: if none found, try capturing tokens like "Colombo", "Kandy" with capitals
-    if not out:
+        place = gaz.resolve(s, fuzzy=False) if gaz is not None and s else None
+        name, key = (place.name, place.id) if place else (s, s.lower())
+        if s and key not in seen:
+            seen.add(key)
+            out.append(name)
+    if not out and gaz is not None:
+        out = [p.name for p in gaz.find_in_text(text)]
+    elif not out:
+        # no gazetteer: capitalized-word heuristic ("Colombo", "Kandy")
         capitals = re.findall(r"\b([A-Z][a-z]{2,}(?:\s[A-Z][a-z]{2,})?)\b", text)
         out = capitals[:2]
     return out
 
+# ---------- Compiled time / transport engine ----------
+# canonical mode -> surface forms (matched on word boundaries, case-insensitive)
+TRANSPORT_SYNONYMS = {
+    "bus": ["bus", "buses", "coach", "coaches", "minibus"],
+    "train": ["train", "trains", "rail", "railway", "metro", "subway", "tram", "underground"],
+    "car": ["car", "cars", "taxi", "taxis", "cab", "cabs", "van", "jeep", "drive", "driving"],
+    "tuk-tuk": ["tuk-tuk", "tuk tuk", "tuktuk", "three-wheeler", "three wheeler", "rickshaw", "auto rickshaw"],
+    "motorbike": ["motorbike", "motorbikes", "motorcycle", "motorcycles", "scooter", "moped"],
+    "walk": ["walk", "walking", "on foot", "hike", "hiking", "trek", "trekking"],
+    "flight": ["flight", "flights", "fly", "flying"],
+    "plane": ["plane", "airplane", "aeroplane"],
+    "ferry": ["ferry", "ferries", "boat"],
+}
+# relative day phrase -> days from today
+RELATIVE_DAYS = {
+    "today": 0, "tonight": 0, "this morning": 0, "this afternoon": 0, "this evening": 0,
+    "tomorrow": 1, "tomorrow morning": 1, "tomorrow afternoon": 1, "tomorrow evening": 1,
+    "tomorrow night": 1, "day after tomorrow": 2, "the day after tomorrow": 2,
+}
+
+class ExtractedSpan(NamedTuple):
+    kind: str       # "transport" | "relative" | "clock"
+    value: str      # canonical mode / lowercased phrase / "HH:MM"
+    start: int
+    end: int
+    text: str
+
+def _trie_regex(words: Iterable[str]) -> str:
+    """Alternation built from a character trie, so shared prefixes are tested once."""
+    trie: Dict[str, Any] = {}
+    for w in words:
+        node = trie
+        for ch in w.lower():
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node: Dict[str, Any]) -> str:
+        end = "" in node
+        # a space in a surface form matches any run of whitespace ("tuk  tuk")
+        branches = [(r"\s+" if ch == " " else re.escape(ch)) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if end else body
+
+    return build(trie)
+
+_SURFACE_TO_MODE = {surface: mode for mode, surfaces in TRANSPORT_SYNONYMS.items() for surface in surfaces}
+_AMPM = r"[ap]\.?m\.?"
+# "at 9" / "@ 9:30pm" take a bare hour; "by" / "around" need am/pm or minutes
+# ("by 2 trains", "around 5 people" are not times)
+_CLOCK = (
+    r"(?<!\w)(?:"
+    rf"(?:at|@)\s*(?P<hour>\d{{1,2}})(?::(?P<minute>\d{{2}}))?(?:\s*(?P<ampm>{_AMPM}))?"
+    rf"|(?:by|around)\s*(?P<hour_approx>\d{{1,2}})"
+    rf"(?::(?P<minute_approx>\d{{2}})(?:\s*(?P<ampm_approx>{_AMPM}))?|\s*(?P<ampm_only>{_AMPM}))"
+    r")(?!\w)"
+)
+# a bare clock hour next to one of these is pm ("at 7 tonight" -> 19:00)
+_PM_HINT = re.compile(r"(?<!\w)(?:tonight|evening|night)(?!\w)", re.I)
+_ENGINE = re.compile(
+    r"(?<!\w)(?:"
+    rf"(?P<transport>{_trie_regex(_SURFACE_TO_MODE)})"
+    rf"|(?P<relative>{_trie_regex(RELATIVE_DAYS)})"
+    r")(?![\w-])"
+    rf"|(?P<clock>{_CLOCK})",
+    re.I,
+)
+_SPACES = re.compile(r"\s+")
+
+def extract_spans(text: str) -> List[ExtractedSpan]:
+    """Transport modes and time expressions, found in one left-to-right pass."""
+    spans = []
+    for m in _ENGINE.finditer(text or ""):
+        raw = m.group(0)
+        if m.group("transport"):
+            key = _SPACES.sub(" ", m.group("transport").lower())
+            spans.append(ExtractedSpan("transport", _SURFACE_TO_MODE[key], m.start(), m.end(), raw))
+        elif m.group("relative"):
+            key = _SPACES.sub(" ", m.group("relative").lower())
+            spans.append(ExtractedSpan("relative", key, m.start(), m.end(), raw))
+        else:
+            hour = int(m.group("hour") or m.group("hour_approx"))
+            minute = int(m.group("minute") or m.group("minute_approx") or 0)
+            ampm = (m.group("ampm") or m.group("ampm_approx") or m.group("ampm_only") or "").lower().replace(".", "")
+            if ampm and not 1 <= hour <= 12:
+                continue
+            if ampm == "pm" and hour < 12:
+                hour += 12
+            elif ampm == "am" and hour == 12:
+                hour = 0
+            if hour > 23 or minute > 59:
+                continue
+            spans.append(ExtractedSpan("clock", f"{hour:02d}:{minute:02d}", m.start(), m.end(), raw))
+    return spans
+
 def extract_time(text: str) -> Optional[str]:
-    # try to parse a date/time in text
-    maybe = None
-    try:
-        # crude: search for common phrases like 'tonight', 'tomorrow', 'at 9pm' etc.
-        m = re.search(r"(tonight|tomorrow|today|at\s+\d{1,2}(?::\d{2})?\s*(?:am|pm)?)", text, re.I)
-        if m:
-            maybe = m.group(0)
-            # try normalizing 'at 9pm' -> parseable
-            try:
-                dt = date_parser.parse(maybe, fuzzy=True)
-                return dt.isoformat()
-            except Exception:
-                return maybe
-    except Exception:
-        return None
-    return maybe
+    """
+    ISO datetime when a clock time is present ("at 9pm", "tomorrow at 8:30am"; a bare
+    hour with "tonight"/"evening" is pm), otherwise the relative phrase as written
+    ("tomorrow", "Tonight"), else None.
+    """
+    spans = extract_spans(text)
+    clock = next((s for s in spans if s.kind == "clock"), None)
+    relative = next((s for s in spans if s.kind == "relative"), None)
+    if clock is None:
+        return relative.text if relative else None
+    hour, minute = map(int, clock.value.split(":"))
+    if hour < 12 and not re.search(_AMPM, clock.text, re.I) and _PM_HINT.search(text):
+        hour += 12
+    day = date.today() + timedelta(days=RELATIVE_DAYS[relative.value] if relative else 0)
+    return datetime.combine(day, dt_time(hour, minute)).isoformat()
 
 def extract_transport_mode(text: str) -> Optional[str]:
-    modes = ["bus", "train", "car", "motorbike", "walk", "flight", "plane", "ferry"]
-    txt = text.lower()
-    for m in modes:
-        if m in txt:
-            return m
-    # fallback
+    # first transport mention in the text, canonicalized ("coach" -> "bus", "taxi" -> "car")
+    for s in extract_spans(text):
+        if s.kind == "transport":
+            return s.value
     return None
@@ -0,0 +1,222 @@
+"""
+orchestrator.py
+
+Runs the follow-up agents concurrently once the risk assessment is ready.
+
+AdvisoryAgent and EmergencyAgent both depend only on the assessment summary, so
+start_followups() submits both LLM calls at once and iter_completed() hands each
+result back as soon as it lands. The agents run as tasks on the shared LLM event loop
+(llm_client.py), so waiting on the model holds no thread. astream_followups() does the
+same but also forwards the advisory text chunk by chunk. UI code stays on the calling
+thread and renders each section in arrival order.
+
+astream_trip() is the whole pipeline for one trip as one async event stream (risk
+assessment first, then the follow-ups), run on the LLM loop. The HTTP service
+(service.py) relays it with client.aiterate(); the Streamlit app reads the blocking
+stream_trip() wrapper (client.iterate()). Neither parks a pool thread per stream.
+
+Finished trips are recorded in the assessment history (store.py) by run_trip() and
+astream_trip(); recording only enqueues, so it adds nothing to the response path.
+
+Modes (resolve_mode):
+- "agents":   RiskAssessment, then Advisory + Emergency in parallel (three LLM calls)
+- "combined": CombinedAgent, one structured LLM call; the default for the "primary" tier
+Both produce the same events and result shapes.
+"""
+
+import asyncio
+import os
+from concurrent.futures import Future, as_completed
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Tuple
+
+from agents import AdvisoryAgent, EmergencyAgent
+from llm_client import get_llm_client
+from store import get_assessment_store
+from warmup import get_agent
+
+AGENT_MODES = ("agents", "combined")
+DEFAULT_AGENT_MODE = os.getenv("AGENT_MODE", "agents")
+# service tiers that default to the single-call mode
+TIER_MODES = {"primary": "combined"}
+
+
+def start_followups(
+    summary: Dict[str, Any],
+    advisory_agent: Optional[AdvisoryAgent] = None,
+    emergency_agent: Optional[EmergencyAgent] = None,
+) -> Dict[str, Future]:
+    """Submit advisory + emergency calls in parallel. Returns {"advisory": fut, "emergency": fut}."""
+    advisory_agent = advisory_agent or get_agent("advisory")
+    emergency_agent = emergency_agent or get_agent("emergency")
+    return {
+        "advisory": get_llm_client().submit(advisory_agent.ahandle(summary)),
+        "emergency": get_llm_client().submit(emergency_agent.ahandle(summary)),
+    }
+
+
+def iter_completed(futures: Dict[str, Future], timeout: Optional[float] = None) -> Iterator[Tuple[str, Any]]:
+    """Yield (name, result) in completion order. Failed calls yield their exception."""
+    names = {fut: name for name, fut in futures.items()}
+    for fut in as_completed(names, timeout=timeout):
+        try:
+            yield names[fut], fut.result()
+        except Exception as e:
+            yield names[fut], e
+
+
+def stream_followups(
+    summary: Dict[str, Any],
+    advisory_agent: Optional[AdvisoryAgent] = None,
+    emergency_agent: Optional[EmergencyAgent] = None,
+) -> Iterator[Tuple[str, Any]]:
+    """Blocking iterator over astream_followups() (driven on the shared LLM loop)."""
+    # agents resolved here: a first get_agent() warms up, which must not run on the loop
+    advisory_agent = advisory_agent or get_agent("advisory")
+    emergency_agent = emergency_agent or get_agent("emergency")
+    return get_llm_client().iterate(astream_followups(summary, advisory_agent, emergency_agent))
+
+
+async def astream_followups(
+    summary: Dict[str, Any],
+    advisory_agent: Optional[AdvisoryAgent] = None,
+    emergency_agent: Optional[EmergencyAgent] = None,
+) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Run both follow-ups in parallel and yield events as they happen:
+    ("advisory_delta", text_chunk)*, ("advisory", result) and ("emergency", result),
+    with the two final events in completion order. Failures arrive as exceptions.
+    Runs on the LLM loop; closing the generator early cancels whatever is still running.
+    """
+    advisory_agent = advisory_agent or get_agent("advisory")
+    emergency_agent = emergency_agent or get_agent("emergency")
+    events: "asyncio.Queue[Tuple[str, Any]]" = asyncio.Queue()
+
+    async def advisory_job():
+        try:
+            chunks = []
+            async for chunk in advisory_agent.astream(summary):
+                chunks.append(chunk)
+                events.put_nowait(("advisory_delta", chunk))
+            events.put_nowait(("advisory", advisory_agent._result(summary, "".join(chunks).strip())))
+        except Exception as e:
+            events.put_nowait(("advisory", e))
+
+    async def emergency_job():
+        try:
+            events.put_nowait(("emergency", await emergency_agent.ahandle(summary)))
+        except Exception as e:
+            events.put_nowait(("emergency", e))
+
+    jobs = [asyncio.ensure_future(advisory_job()), asyncio.ensure_future(emergency_job())]
+    try:
+        pending = 2
+        while pending:
+            name, payload = await events.get()
+            if name != "advisory_delta":
+                pending -= 1
+            yield name, payload
+    finally:
+        for job in jobs:
+            job.cancel()
+
+
+def run_followups(summary: Dict[str, Any]) -> Dict[str, Any]:
+    """Blocking helper: both results once they are in (wall time ~ the slower call)."""
+    return dict(iter_completed(start_followups(summary)))
+
+
+def resolve_mode(mode: Optional[str] = None, tier: Optional[str] = None) -> str:
+    """An explicit mode wins, then the tier's default, then AGENT_MODE."""
+    if mode:
+        if mode not in AGENT_MODES:
+            raise ValueError(f"unknown mode {mode!r}; expected one of {', '.join(AGENT_MODES)}")
+        return mode
+    return TIER_MODES.get((tier or "").lower(), DEFAULT_AGENT_MODE)
+
+
+def record_trip(user_text: str, mode: str, results: Dict[str, Any]) -> Optional[str]:
+    """Queue a finished trip for the assessment history; returns its id (None if not stored)."""
+    store = get_assessment_store()
+    assessment = results.get("assessment")
+    if store is None or not isinstance(assessment, dict):
+        return None
+    return store.record(user_text, assessment, results.get("advisory"), results.get("emergency"), mode=mode)
+
+
+def run_trip(user_text: str, mode: Optional[str] = None) -> Dict[str, Any]:
+    """Blocking: {"assessment", "advisory", "emergency"}; follow-up failures are exceptions."""
+    mode = resolve_mode(mode)
+    if mode == "combined":
+        result = get_agent("combined").handle(user_text)
+    else:
+        assessment = get_agent("risk").handle(user_text)
+        result = dict(run_followups(assessment), assessment=assessment)
+    record_trip(user_text, mode, result)
+    return result
+
+
+def stream_trip(user_text: str, mode: Optional[str] = None) -> Iterator[Tuple[str, Any]]:
+    """Blocking iterator over astream_trip() (driven on the shared LLM loop)."""
+    return get_llm_client().iterate(astream_trip(user_text, mode))
+
+
+def astream_trip(user_text: str, mode: Optional[str] = None) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    RiskAssessment -> Advisory + Emergency as one async event stream, run on the LLM loop:
+    ("assessment_early", dict)? as soon as the assessment JSON has streamed in,
+    ("assessment", dict) once the risk agent is done, then the astream_followups() events.
+    A failed risk assessment raises; follow-up failures arrive as exceptions.
+    In "combined" mode the three results arrive together from one call.
+    The trip is recorded once the stream ends (or is closed after the assessment), with
+    whichever follow-ups had arrived.
+    The agents are resolved on the calling thread, so a first call's warm-up never runs
+    on the loop.
+    """
+    mode = resolve_mode(mode)
+    names = ("combined",) if mode == "combined" else ("risk", "advisory", "emergency")
+    return _recorded(user_text, mode, _trip_events(user_text, mode, {name: get_agent(name) for name in names}))
+
+
+async def _recorded(user_text: str, mode: str, events: AsyncIterator[Tuple[str, Any]]) -> AsyncIterator[Tuple[str, Any]]:
+    results: Dict[str, Any] = {}
+    try:
+        async for name, payload in events:
+            if name in ("assessment", "advisory", "emergency"):
+                results[name] = payload
+            yield name, payload
+    finally:
+        record_trip(user_text, mode, results)
+
+
+async def _trip_events(user_text: str, mode: str, agents: Dict[str, Any]) -> AsyncIterator[Tuple[str, Any]]:
+    if mode == "combined":
+        result = await agents["combined"].ahandle(user_text)
+        for name in ("assessment", "advisory", "emergency"):
+            yield name, result[name]
+        return
+
+    risk_agent = agents["risk"]
+    events: "asyncio.Queue[Tuple[str, Any]]" = asyncio.Queue()
+
+    async def risk_job():
+        try:
+            assessment = await risk_agent.ahandle(
+                user_text, on_assessment=lambda a: events.put_nowait(("assessment_early", a))
+            )
+            events.put_nowait(("assessment", assessment))
+        except Exception as e:
+            events.put_nowait(("error", e))
+
+    job = asyncio.ensure_future(risk_job())
+    try:
+        while True:
+            name, payload = await events.get()
+            if name == "error":
+                raise payload
+            yield name, payload
+            if name == "assessment":
+                break
+    finally:
+        job.cancel()
+    async for event in astream_followups(payload, agents["advisory"], agents["emergency"]):
+        yield event
@@ -0,0 +1,207 @@
+"""
+planner.py
+
+Retrieval planning: which searches a trip actually needs.
+
+Contains:
+- plan_retrieval(entities): RetrievalPlan for the locations NER returned.
+- fetch_plan(plan): runs the plan's searches (tools.run_lookups) and returns
+  (weather_data, emergency_data) keyed by the plan's locations, like
+  tools.fetch_locations_concurrently.
+- plan_results(plan, results): the same mapping for lookups run elsewhere (the
+  monitoring scheduler runs many trips' plans as one deduplicated batch).
+- planner_stats(): plans made, searches a naive per-entity loop would have issued, and
+  searches saved.
+
+Planning rules:
+1. Entities are normalized and resolved through the gazetteer; spellings of the same
+   place ("Kandy", "kandy city", "Kandy District") collapse into one location.
+2. Countries and admin regions ("Sri Lanka", "Sri Lankan", "Central Province") are
+   dropped when a place inside them is already part of the trip; on their own they
+   keep a lookup.
+3. Weather is searched per place. Emergency intel (helplines, closures) is regional:
+   places in the same admin region share one emergency search.
+4. With PLANNER_COMBINE_INTENTS=1, a place with its own emergency search gets a single
+   combined weather + emergency search instead of two.
+
+Notes:
+- Without the gazetteer only rule 1's exact-duplicate collapsing applies.
+- Each result keeps the query that produced it (source_query), so shared results are
+  visible as such in the assessment's weather_data / emergency_data.
+"""
+
+import os
+import re
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import tracing
+from gazetteer import Place, get_gazetteer, normalize_name
+from tools import QUERY_TEMPLATES, run_lookups
+
+PLANNER_COMBINE_INTENTS = os.getenv("PLANNER_COMBINE_INTENTS", "0") == "1"
+
+# "Kandy District" / "Galle Fort area" -> the place itself
+_ADMIN_SUFFIX = re.compile(r"\s+(?:district|province|region|area|division)$")
+
+
+class Lookup(NamedTuple):
+    kind: str                 # "weather" | "emergency" | "combined"
+    query: str
+    targets: Tuple[str, ...]  # plan locations that receive the result
+
+
+class RetrievalPlan(NamedTuple):
+    locations: List[str]      # kept locations, canonical names, in trip order
+    lookups: List[Lookup]
+    dropped: Dict[str, str]   # entity -> why it needs no lookup of its own
+    naive_queries: int        # weather + emergency per raw entity
+
+    @property
+    def queries_saved(self) -> int:
+        return self.naive_queries - len(self.lookups)
+
+
+class _Entity(NamedTuple):
+    name: str                 # display name used as the location key downstream
+    key: str                  # dedupe key
+    place: Optional[Place]
+    area: Optional[Tuple[str, str]]  # ("admin" | "country", name) for region-level entities
+
+
+def _classify(entity: str, gaz) -> _Entity:
+    norm = normalize_name(entity)
+    if gaz is None:
+        return _Entity(entity.strip(), norm or entity.strip().lower(), None, None)
+    place = gaz.exact(entity)
+    if place is None:
+        areas = gaz.areas()
+        # "Sri Lankan" (NORP) -> "Sri Lanka"
+        for candidate in (norm, norm[:-1], norm[:-2]):
+            if candidate in areas:
+                kind, name = areas[candidate]
+                return _Entity(name, f"{kind}:{candidate}", None, (kind, name))
+        place = gaz.resolve(_ADMIN_SUFFIX.sub("", norm), fuzzy=False)
+    if place is not None:
+        return _Entity(place.name, place.id, place, None)
+    return _Entity(entity.strip(), norm or entity.strip().lower(), None, None)
+
+
+def _covers(area: Tuple[str, str], place: Place) -> bool:
+    kind, name = area
+    return (place.country if kind == "country" else place.admin) == name
+
+
+def _label(entity: _Entity) -> str:
+    if entity.place is not None:
+        return entity.place.label
+    return entity.name
+
+
+# ---------- stats ----------
+_stats = {"plans": 0, "entities": 0, "naive_queries": 0, "queries": 0}
+_stats_lock = threading.Lock()
+
+
+def planner_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        out = dict(_stats)
+    out["queries_saved"] = out["naive_queries"] - out["queries"]
+    return out
+
+
+# ---------- planning ----------
+def plan_retrieval(entities: List[str], combine_intents: Optional[bool] = None) -> RetrievalPlan:
+    combine_intents = PLANNER_COMBINE_INTENTS if combine_intents is None else combine_intents
+    gaz = get_gazetteer()
+    dropped: Dict[str, str] = {}
+
+    # 1. normalize + collapse
+    kept: Dict[str, _Entity] = {}
+    for raw in entities:
+        if not str(raw or "").strip():
+            continue
+        entity = _classify(str(raw), gaz)
+        if entity.key in kept:
+            if raw != kept[entity.key].name:
+                dropped[raw] = f"same place as {kept[entity.key].name}"
+            continue
+        kept[entity.key] = entity
+
+    # 2. regions/countries already covered by a place in the trip
+    places = [e.place for e in kept.values() if e.place is not None]
+    for key, entity in list(kept.items()):
+        if entity.area is not None:
+            inside = next((p for p in places if _covers(entity.area, p)), None)
+            if inside is not None:
+                dropped[entity.name] = f"covered by {inside.name}"
+                del kept[key]
+
+    # 3. weather per location; emergency per admin region where places share one
+    regions: Dict[Tuple[str, str], List[_Entity]] = {}
+    for entity in kept.values():
+        if entity.place is not None and entity.place.admin:
+            regions.setdefault((entity.place.admin, entity.place.country), []).append(entity)
+    shared = {e.key: region for region, members in regions.items() if len(members) > 1 for e in members}
+
+    lookups: List[Lookup] = []
+    emitted = set()
+    for entity in kept.values():
+        region = shared.get(entity.key)
+        if region is None and combine_intents:
+            # 4. one search for both intents
+            lookups.append(Lookup("combined", QUERY_TEMPLATES["combined"].format(_label(entity)), (entity.name,)))
+            continue
+        lookups.append(Lookup("weather", QUERY_TEMPLATES["weather"].format(_label(entity)), (entity.name,)))
+        if region is None:
+            lookups.append(Lookup("emergency", QUERY_TEMPLATES["emergency"].format(_label(entity)), (entity.name,)))
+        elif region not in emitted:
+            emitted.add(region)
+            admin, country = region
+            label = f"{admin}, {country}" if country and country != admin else admin
+            targets = tuple(e.name for e in regions[region])
+            lookups.append(Lookup("emergency", QUERY_TEMPLATES["emergency"].format(label), targets))
+
+    plan = RetrievalPlan([e.name for e in kept.values()], lookups, dropped, 2 * len(entities))
+    with _stats_lock:
+        _stats["plans"] += 1
+        _stats["entities"] += len(entities)
+        _stats["naive_queries"] += plan.naive_queries
+        _stats["queries"] += len(plan.lookups)
+    return plan
+
+
+def fetch_plan(
+    plan: RetrievalPlan,
+    max_workers: Optional[int] = None,
+    deadline: Optional[float] = None,
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """(weather_data, emergency_data) for plan.locations, in order."""
+    with tracing.span(
+        "retrieval.plan", entities=plan.naive_queries // 2, locations=len(plan.locations),
+        queries=len(plan.lookups), queries_saved=plan.queries_saved,
+    ):
+        results = run_lookups([(l.kind, l.query) for l in plan.lookups], max_workers, deadline)
+    return plan_results(plan, results)
+
+
+def plan_results(
+    plan: RetrievalPlan, results: Dict[Tuple[str, str], Dict[str, Any]]
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Spread {(kind, query): result} over plan.locations -> (weather_data, emergency_data).
+    Raises KeyError when a lookup of the plan has no result.
+    """
+    weather_data: Dict[str, Any] = {}
+    emergency_data: Dict[str, Any] = {}
+    for lookup in plan.lookups:
+        result = results[(lookup.kind, lookup.query)]
+        for loc in lookup.targets:
+            if lookup.kind in ("weather", "combined"):
+                weather_data[loc] = result
+            if lookup.kind in ("emergency", "combined"):
+                emergency_data[loc] = result
+    return (
+        {loc: weather_data[loc] for loc in plan.locations},
+        {loc: emergency_data[loc] for loc in plan.locations},
+    )
@@ -0,0 +1,242 @@
+"""
+prompts.py
+
+Prompt building for the agents: only the fields each agent needs, as compact
+canonical JSON.
+
+Contains:
+- count_tokens(text): tiktoken count when installed, else a ~4 chars/token estimate.
+- compact_snippets(raw, budget): whitespace-normalized, de-duplicated snippets that fit
+  a token budget.
+- retrieval_context(weather_data, emergency_data): per-location snippets (no
+  source_query strings, no Python reprs) within PROMPT_RETRIEVAL_BUDGET tokens.
+- risk_prompt / advisory_prompt / emergency_prompt / combined_prompt:
+  Prompt(text, fields, tokens).
+  `fields` is exactly the data serialized into the prompt (the risk / combined prompts
+  include the normalized trip request itself), so it doubles as the LLM cache key and
+  the stage-memo key.
+- prompt_token_stats(): per-agent prompt count / total / max tokens.
+
+Notes:
+- Canonical JSON (sorted keys, no whitespace) keeps identical inputs byte-identical,
+  which is what makes the response caches hit.
+"""
+
+import os
+import re
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from cache import canonical_json
+
+try:
+    import tiktoken
+except ImportError:  # optional: exact counts only when installed
+    tiktoken = None
+
+PROMPT_RETRIEVAL_BUDGET = int(os.getenv("PROMPT_RETRIEVAL_BUDGET", "600"))
+PROMPT_SNIPPET_MAX_TOKENS = int(os.getenv("PROMPT_SNIPPET_MAX_TOKENS", "80"))
+
+# what the follow-up agents get from an assessment
+ADVISORY_FIELDS = (
+    "locations", "time", "transport_mode", "risk_score_final", "risk_level",
+    "reasons", "recommended_actions",
+)
+EMERGENCY_FIELDS = ADVISORY_FIELDS
+
+_WS = re.compile(r"\s+")
+_encoding = None
+
+
+class Prompt(NamedTuple):
+    text: str
+    fields: Dict[str, Any]
+    tokens: int
+
+
+def count_tokens(text: str) -> int:
+    global _encoding
+    if not text:
+        return 0
+    if tiktoken is not None:
+        if _encoding is None:
+            _encoding = tiktoken.get_encoding("o200k_base")
+        return len(_encoding.encode(text))
+    return max(1, (len(text) + 3) // 4)
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    if count_tokens(text) <= max_tokens:
+        return text
+    # cut on a word boundary at the approximate character budget
+    cut = text[: max_tokens * 4].rsplit(" ", 1)[0]
+    return cut.rstrip(" ,;:") + "…"
+
+
+def compact_snippets(raw: Optional[str], budget: int, seen: Optional[set] = None) -> List[str]:
+    """Snippets of `raw` (one per line), de-duplicated (also against `seen`), within `budget` tokens."""
+    seen = set() if seen is None else seen
+    out: List[str] = []
+    for line in str(raw or "").splitlines():
+        snippet = _WS.sub(" ", line).strip()
+        key = snippet.lower()
+        if not snippet or key in seen:
+            continue
+        snippet = _truncate(snippet, min(PROMPT_SNIPPET_MAX_TOKENS, budget))
+        cost = count_tokens(snippet)
+        if cost > budget:
+            break
+        seen.add(key)
+        out.append(snippet)
+        budget -= cost
+    return out
+
+
+def retrieval_context(
+    weather_data: Dict[str, Any],
+    emergency_data: Dict[str, Any],
+    budget: int = PROMPT_RETRIEVAL_BUDGET,
+) -> Dict[str, Dict[str, Any]]:
+    """{location: {"weather": [...], "emergency": [...]}} with the budget split evenly."""
+    locations = list(dict.fromkeys(list(weather_data or {}) + list(emergency_data or {})))
+    if not locations:
+        return {}
+    share = max(1, budget // (2 * len(locations)))
+    seen: set = set()
+    out: Dict[str, Dict[str, Any]] = {}
+    for loc in locations:
+        entry: Dict[str, Any] = {}
+        for name, data in (("weather", weather_data), ("emergency", emergency_data)):
+            item = (data or {}).get(loc)
+            item = item if isinstance(item, dict) else {}
+            if item.get("error"):
+                entry[name + "_error"] = item["error"]
+            entry[name] = compact_snippets(item.get("raw"), share, seen)
+        out[loc] = entry
+    return out
+
+
+# ---------- token accounting ----------
+_stats: Dict[str, Dict[str, int]] = {}
+_stats_lock = threading.Lock()
+
+
+def _record(agent: str, tokens: int) -> None:
+    with _stats_lock:
+        s = _stats.setdefault(agent, {"prompts": 0, "total_tokens": 0, "max_tokens": 0})
+        s["prompts"] += 1
+        s["total_tokens"] += tokens
+        s["max_tokens"] = max(s["max_tokens"], tokens)
+
+
+def prompt_token_stats() -> Dict[str, Dict[str, Any]]:
+    with _stats_lock:
+        out = {agent: dict(s) for agent, s in _stats.items()}
+    for s in out.values():
+        s["mean_tokens"] = round(s["total_tokens"] / s["prompts"], 1) if s["prompts"] else 0.0
+    return out
+
+
+def _prompt(agent: str, header: str, fields: Dict[str, Any], instructions: str) -> Prompt:
+    text = f"{header}\n{canonical_json(fields)}\n\n{instructions}"
+    tokens = count_tokens(text)
+    _record(agent, tokens)
+    return Prompt(text, fields, tokens)
+
+
+def _request_text(user_text: str) -> str:
+    # the user's own words go into `fields` (not just the header), so the cache key
+    # covers "with a toddler" / "avoiding the flooded A1"; whitespace alone doesn't count
+    return _WS.sub(" ", user_text or "").strip()
+
+
+# ---------- per-agent prompts ----------
+def risk_prompt(
+    user_text: str,
+    locations: List[str],
+    time: Optional[str],
+    transport: Optional[str],
+    weather_data: Dict[str, Any],
+    emergency_data: Dict[str, Any],
+) -> Prompt:
+    fields = {
+        "request": _request_text(user_text),
+        "locations": locations,
+        "time": time,
+        "transport": transport,
+        "intel": retrieval_context(weather_data, emergency_data),
+    }
+    return _prompt(
+        "risk_assessment_agent",
+        "Trip request and data (JSON):",
+        fields,
+        "Return one JSON object with fields: locations, time, transport_mode, risk_score (0-100), "
+        "risk_level (Low/Medium/High/Critical), reasons (list), recommended_actions (list), "
+        "summary (short human summary, 1-2 paragraphs).\n",
+    )
+
+
+def assessment_fields(assessment: Dict[str, Any], keys=ADVISORY_FIELDS) -> Dict[str, Any]:
+    fields = {k: assessment.get(k) for k in keys if assessment.get(k) not in (None, "", [])}
+    # older callers only carry risk_score
+    if "risk_score_final" in keys and "risk_score_final" not in fields and assessment.get("risk_score") is not None:
+        fields["risk_score_final"] = assessment["risk_score"]
+    return fields
+
+
+def advisory_prompt(assessment: Dict[str, Any]) -> Prompt:
+    return _prompt(
+        "advisory_agent",
+        "Risk assessment JSON:",
+        assessment_fields(assessment, ADVISORY_FIELDS),
+        "Produce:\n"
+        "1) A friendly advisory message (3-6 bullet points)\n"
+        "2) A short checklist of items to carry (e.g., medications, charger, documents)\n"
+        "3) Accessibility / special-needs considerations if any\n",
+    )
+
+
+def emergency_prompt(assessment: Dict[str, Any]) -> Prompt:
+    fields = assessment_fields(assessment, EMERGENCY_FIELDS)
+    # local helplines / incidents are what this agent works from
+    emergency_data = assessment.get("emergency_data") or {}
+    if isinstance(emergency_data, dict) and emergency_data:
+        fields["emergency_intel"] = {
+            loc: ctx["emergency"] for loc, ctx in retrieval_context({}, emergency_data).items()
+        }
+    return _prompt(
+        "emergency_agent",
+        "Assessment:",
+        fields,
+        "Return JSON: {\"locations\": [{location, emergency_contacts (service -> number), "
+        "next_steps (list), response_checklist (3-minute response checklist)}]}\n",
+    )
+
+
+def combined_prompt(
+    user_text: str,
+    locations: List[str],
+    time: Optional[str],
+    transport: Optional[str],
+    weather_data: Dict[str, Any],
+    emergency_data: Dict[str, Any],
+) -> Prompt:
+    fields = {
+        "request": _request_text(user_text),
+        "locations": locations,
+        "time": time,
+        "transport": transport,
+        "intel": retrieval_context(weather_data, emergency_data),
+    }
+    return _prompt(
+        "combined_agent",
+        "Trip request and data (JSON):",
+        fields,
+        "Return one JSON object with:\n"
+        "- assessment: {locations, time, transport_mode, risk_score (0-100), risk_level "
+        "(Low/Medium/High/Critical), reasons (list), recommended_actions (list), summary (1-2 paragraphs)}\n"
+        "- advice: markdown with 3-6 advisory bullet points, a short checklist of items to carry and "
+        "any accessibility considerations\n"
+        "- emergency: {locations: [{location, emergency_contacts (service -> number), next_steps (list), "
+        "response_checklist (3-minute response checklist)}]}\n",
+    )
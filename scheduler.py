@@ -0,0 +1,401 @@
+"""
+scheduler.py
+
+Background monitoring for saved upcoming trips.
+
+Contains:
+- TripStore: SQLite (WAL) table of monitored trips plus the alerts raised for them.
+- MonitorScheduler: every `interval_s` refreshes the weather/emergency data of all
+  active trips, re-scores them, and runs the LLM agents only for trips whose score
+  moved into a different risk band.
+- `python scheduler.py add|run|alerts`: small CLI around both.
+
+One cycle:
+1. load active trips (not yet departed) and plan each trip's searches the way the risk
+   agent does (planner.plan_retrieval: gazetteer-canonical places, shared regional
+   emergency searches); identical searches across trips are run once per cycle, so
+   "Kandy" and "kandy city" cost one weather search however many trips mention them;
+2. run the unique searches on a bounded pool, paced by a Serper token bucket;
+3. re-score every trip in one vectorized pass (scoring.RiskScorer);
+4. for trips whose score crossed a band in ALERT_THRESHOLDS, run RiskAssessment ->
+   Advisory + Emergency on a small pool paced by an LLM token bucket, store an alert
+   and call `on_alert`. At most `max_alerts_per_cycle` run; the rest keep their old
+   score and are picked up next cycle.
+
+Notes:
+- The first check of a trip only records its baseline score (no LLM calls).
+- A trip stops being monitored once it has departed. A relative time ("tomorrow",
+  "tonight") is resolved at insert to the end of that day; trips with no time at all
+  are dropped MONITOR_MAX_AGE_S after they were saved.
+- Fetches go through the Serper cache, so a cycle shorter than the weather TTL is cheap.
+- A trip whose searches did not all succeed (Serper down, HTTP errors) keeps its
+  previous score for the cycle: an outage never moves trips across bands or fires alerts.
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time as dt_time, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from ner_service import extract_entities_many
+from nlp import RELATIVE_DAYS
+from orchestrator import run_followups
+from planner import RetrievalPlan, plan_results, plan_retrieval
+from scoring import default_scorer
+from security import sanitize_user_text
+from tools import fetch_lookup, location_key
+from utils import TokenBucket
+from warmup import get_agent
+
+MONITOR_DB_PATH = os.getenv("MONITOR_DB_PATH", os.path.join(".cache", "monitor.sqlite3"))
+MONITOR_INTERVAL_S = float(os.getenv("MONITOR_INTERVAL_S", "900"))
+# score bands: crossing any of these (either direction) triggers the agents
+ALERT_THRESHOLDS = tuple(int(x) for x in os.getenv("MONITOR_ALERT_THRESHOLDS", "40,60,80").split(",") if x.strip())
+MONITOR_FETCH_WORKERS = int(os.getenv("MONITOR_FETCH_WORKERS", "8"))
+MONITOR_LLM_WORKERS = int(os.getenv("MONITOR_LLM_WORKERS", "2"))
+# Serper requests per second / LLM calls per minute the scheduler may spend
+MONITOR_SERPER_RPS = float(os.getenv("MONITOR_SERPER_RPS", "5"))
+MONITOR_LLM_RPM = float(os.getenv("MONITOR_LLM_RPM", "30"))
+MONITOR_MAX_ALERTS = int(os.getenv("MONITOR_MAX_ALERTS_PER_CYCLE", "50"))
+# trips without any departure time stop being monitored this long after they were saved
+MONITOR_MAX_AGE_S = float(os.getenv("MONITOR_MAX_AGE_S", str(7 * 86400)))
+
+LLM_CALLS_PER_ALERT = 3  # risk assessment + advisory + emergency
+
+
+def risk_band(score: Optional[int], thresholds: Sequence[int] = ALERT_THRESHOLDS) -> Optional[int]:
+    return None if score is None else bisect_right(sorted(thresholds), score)
+
+
+def _parse_departure(value: Optional[str]) -> Optional[float]:
+    """
+    Epoch seconds for an ISO datetime (as extract_time returns). A relative day
+    ("tomorrow", "tonight") runs until the end of that day. None when there is no time.
+    """
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        pass
+    days = RELATIVE_DAYS.get(" ".join(value.lower().split()))
+    if days is None:
+        return None
+    return datetime.combine(date.today() + timedelta(days=days + 1), dt_time()).timestamp()
+
+
+# ---------- Storage ----------
+class TripStore:
+    def __init__(self, path: str = MONITOR_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(
+                "CREATE TABLE IF NOT EXISTS trips ("
+                " id TEXT PRIMARY KEY, user_text TEXT NOT NULL, locations TEXT NOT NULL,"
+                " transport TEXT, time TEXT, depart_at REAL, active INTEGER NOT NULL DEFAULT 1,"
+                " last_score INTEGER, last_checked REAL, created_at REAL NOT NULL);"
+                "CREATE INDEX IF NOT EXISTS trips_active ON trips(active, depart_at);"
+                "CREATE TABLE IF NOT EXISTS alerts ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, trip_id TEXT NOT NULL, created_at REAL NOT NULL,"
+                " old_score INTEGER, new_score INTEGER, payload TEXT NOT NULL);"
+                "CREATE INDEX IF NOT EXISTS alerts_trip ON alerts(trip_id, created_at);"
+            )
+            self._conn.commit()
+
+    def add_trips(self, trips: List[Dict[str, Any]]) -> None:
+        """trips: {"id", "user_text", "locations", "transport", "time", "depart_at"}."""
+        now = time.time()
+        rows = [
+            (t["id"], t["user_text"], json.dumps(t["locations"]), t.get("transport"), t.get("time"),
+             t.get("depart_at"), now)
+            for t in trips
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO trips (id, user_text, locations, transport, time, depart_at, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)", rows,
+            )
+            self._conn.commit()
+
+    def deactivate_departed(self, now: float, max_age_s: float = MONITOR_MAX_AGE_S) -> int:
+        """Departed trips, and trips without a departure time saved over max_age_s ago."""
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE trips SET active = 0 WHERE active = 1 AND ("
+                " (depart_at IS NOT NULL AND depart_at < ?) OR (depart_at IS NULL AND created_at < ?))",
+                (now, now - max_age_s),
+            )
+            self._conn.commit()
+            return cur.rowcount
+
+    def active_trips(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, user_text, locations, transport, time, last_score FROM trips WHERE active = 1"
+            ).fetchall()
+        out = []
+        for r in rows:
+            trip = dict(r)
+            trip["locations"] = json.loads(trip["locations"])
+            out.append(trip)
+        return out
+
+    def update_scores(self, scores: List[Tuple[int, float, str]]) -> None:
+        """scores: (score, checked_at, trip_id)."""
+        with self._lock:
+            self._conn.executemany("UPDATE trips SET last_score = ?, last_checked = ? WHERE id = ?", scores)
+            self._conn.commit()
+
+    def add_alert(self, trip_id: str, old_score: Optional[int], new_score: int, payload: Dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO alerts (trip_id, created_at, old_score, new_score, payload) VALUES (?, ?, ?, ?, ?)",
+                (trip_id, time.time(), old_score, new_score, json.dumps(payload, ensure_ascii=False, default=str)),
+            )
+            self._conn.commit()
+
+    def alerts(self, trip_id: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        query = "SELECT * FROM alerts"
+        params: Tuple[Any, ...] = ()
+        if trip_id:
+            query += " WHERE trip_id = ?"
+            params = (trip_id,)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        with self._lock:
+            rows = self._conn.execute(query, params + (limit,)).fetchall()
+        return [dict(r, payload=json.loads(r["payload"])) for r in rows]
+
+
+# ---------- Scheduler ----------
+class MonitorScheduler:
+    def __init__(
+        self,
+        store: Optional[TripStore] = None,
+        interval_s: float = MONITOR_INTERVAL_S,
+        thresholds: Sequence[int] = ALERT_THRESHOLDS,
+        fetch_workers: int = MONITOR_FETCH_WORKERS,
+        llm_workers: int = MONITOR_LLM_WORKERS,
+        serper_rps: float = MONITOR_SERPER_RPS,
+        llm_rpm: float = MONITOR_LLM_RPM,
+        max_alerts_per_cycle: int = MONITOR_MAX_ALERTS,
+        max_age_s: float = MONITOR_MAX_AGE_S,
+        on_alert: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ):
+        self.store = store or TripStore()
+        self.interval_s = interval_s
+        self.thresholds = tuple(sorted(thresholds))
+        self.fetch_workers = max(1, fetch_workers)
+        self.llm_workers = max(1, llm_workers)
+        self.max_alerts_per_cycle = max_alerts_per_cycle
+        self.max_age_s = max_age_s
+        self.on_alert = on_alert
+        # one token per Serper search
+        self._serper_bucket = TokenBucket(rate=serper_rps, capacity=max(2.0, serper_rps))
+        self._llm_bucket = TokenBucket(rate=llm_rpm / 60.0, capacity=max(LLM_CALLS_PER_ALERT, llm_rpm / 60.0))
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_cycle: Dict[str, Any] = {}
+
+    # ----- trips -----
+    def add_trips(self, items: List[Dict[str, Any]]) -> List[str]:
+        """items: {"text", optional "id", optional "depart_at" (ISO)}. Returns the trip ids."""
+        texts = [sanitize_user_text(str(item["text"])) for item in items]
+        trips = []
+        for item, text, entities in zip(items, texts, extract_entities_many(texts)):
+            trip_id = str(item.get("id") or f"trip-{time.time_ns()}-{len(trips)}")
+            depart = item.get("depart_at") or entities["time"]
+            trips.append({
+                "id": trip_id,
+                "user_text": text,
+                "locations": entities["locations"] or ["unknown"],
+                "transport": entities["transport"],
+                "time": entities["time"],
+                "depart_at": _parse_departure(depart),
+            })
+        self.store.add_trips(trips)
+        return [t["id"] for t in trips]
+
+    def add_trip(self, text: str, trip_id: Optional[str] = None, depart_at: Optional[str] = None) -> str:
+        return self.add_trips([{"text": text, "id": trip_id, "depart_at": depart_at}])[0]
+
+    # ----- one cycle -----
+    def _fetch_lookup(self, kind: str, query: str) -> Dict[str, Any]:
+        self._serper_bucket.acquire(1)
+        return fetch_lookup(kind, query)
+
+    def _fetch_all(self, lookups: List[Tuple[str, str]]) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        """
+        {(kind, query): result} for the distinct searches. Failed ones (an exception or
+        an "error" result) are left out, so their trips keep the previous score instead
+        of being re-scored on missing intel.
+        """
+        results: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        with ThreadPoolExecutor(max_workers=self.fetch_workers, thread_name_prefix="monitor-fetch") as pool:
+            futures = {lookup: pool.submit(self._fetch_lookup, *lookup) for lookup in dict.fromkeys(lookups)}
+            for lookup, fut in futures.items():
+                try:
+                    result = fut.result()
+                except Exception as e:
+                    print(f"monitor: fetch failed for {lookup[1]!r}: {e}")
+                    continue
+                if result.get("error"):
+                    print(f"monitor: fetch failed for {lookup[1]!r}: {result['error']}")
+                    continue
+                results[lookup] = result
+        return results
+
+    def _reassess(self, trip: Dict[str, Any], new_score: int) -> Dict[str, Any]:
+        self._llm_bucket.acquire(LLM_CALLS_PER_ALERT)
+        assessment = get_agent("risk").handle(trip["user_text"])
+        followups = run_followups(assessment)
+        alert: Dict[str, Any] = {
+            "trip_id": trip["id"],
+            "old_score": trip["last_score"],
+            "new_score": new_score,
+            "assessment": assessment,
+        }
+        for name in ("advisory", "emergency"):
+            result = followups.get(name)
+            if isinstance(result, Exception):
+                alert[name] = {"error": str(result)}
+            else:
+                result = dict(result or {})
+                result.pop("original_assessment", None)
+                alert[name] = result
+        return alert
+
+    def run_cycle(self) -> Dict[str, Any]:
+        start = time.perf_counter()
+        now = time.time()
+        departed = self.store.deactivate_departed(now, self.max_age_s)
+        trips = self.store.active_trips()
+
+        plans: List[RetrievalPlan] = [plan_retrieval(trip["locations"]) for trip in trips]
+        lookups = list(dict.fromkeys((l.kind, l.query) for plan in plans for l in plan.lookups))
+        fetched = self._fetch_all(lookups)
+
+        # trips with any search that failed to refresh keep their previous score
+        scorable, rows = [], []
+        for trip, plan in zip(trips, plans):
+            try:
+                weather, emergency = plan_results(plan, fetched)
+            except KeyError:
+                continue
+            scorable.append(trip)
+            rows.append((weather, emergency, trip["transport"]))
+        scores = default_scorer().score_batch(rows).tolist() if rows else []
+
+        crossed, updates = [], []
+        for trip, score in zip(scorable, scores):
+            old = trip["last_score"]
+            if old is not None and risk_band(old, self.thresholds) != risk_band(score, self.thresholds):
+                if len(crossed) < self.max_alerts_per_cycle:
+                    crossed.append((trip, score))
+                continue
+            updates.append((score, now, trip["id"]))
+
+        alerts = 0
+        with ThreadPoolExecutor(max_workers=self.llm_workers, thread_name_prefix="monitor-llm") as pool:
+            futures = [(trip, score, pool.submit(self._reassess, trip, score)) for trip, score in crossed]
+            for trip, score, fut in futures:
+                try:
+                    alert = fut.result()
+                except Exception as e:
+                    # leave the old score in place so the next cycle retries
+                    print(f"monitor: reassessment failed for {trip['id']}: {e}")
+                    continue
+                self.store.add_alert(trip["id"], trip["last_score"], score, alert)
+                updates.append((score, now, trip["id"]))
+                alerts += 1
+                if self.on_alert is not None:
+                    try:
+                        self.on_alert(alert)
+                    except Exception as e:
+                        print(f"monitor: on_alert failed: {e}")
+        self.store.update_scores(updates)
+
+        self.last_cycle = {
+            "trips": len(trips),
+            "departed": departed,
+            "locations": len({location_key(loc) for plan in plans for loc in plan.locations}),
+            "lookups": len(lookups),
+            "lookups_failed": len(lookups) - len(fetched),
+            "scored": len(scorable),
+            "crossed": len(crossed),
+            "alerts": alerts,
+            "elapsed_s": round(time.perf_counter() - start, 3),
+        }
+        return self.last_cycle
+
+    # ----- background loop -----
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                print("monitor cycle:", json.dumps(self.run_cycle()))
+            except Exception as e:
+                print("monitor cycle failed:", e)
+            self._stop.wait(self.interval_s)
+
+    def start(self) -> "MonitorScheduler":
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="monitor", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Monitor saved trips and alert when their risk changes.")
+    ap.add_argument("--db", default=MONITOR_DB_PATH, help="trip store (SQLite)")
+    sub = ap.add_subparsers(dest="command", required=True)
+    add = sub.add_parser("add", help="save a trip for monitoring")
+    add.add_argument("text", help="trip description")
+    add.add_argument("--id", help="trip id (default: generated)")
+    add.add_argument("--depart-at", help="ISO departure time or a day (\"tomorrow\"); monitoring stops after it")
+    run = sub.add_parser("run", help="run monitoring cycles")
+    run.add_argument("--once", action="store_true", help="run a single cycle and exit")
+    run.add_argument("--interval", type=float, default=MONITOR_INTERVAL_S, help="seconds between cycles")
+    alerts = sub.add_parser("alerts", help="print recent alerts")
+    alerts.add_argument("--trip", help="only this trip id")
+    alerts.add_argument("-n", "--limit", type=int, default=20)
+    args = ap.parse_args(argv)
+
+    scheduler = MonitorScheduler(store=TripStore(args.db), interval_s=getattr(args, "interval", MONITOR_INTERVAL_S))
+    if args.command == "add":
+        print(scheduler.add_trip(args.text, trip_id=args.id, depart_at=args.depart_at))
+    elif args.command == "alerts":
+        for alert in scheduler.store.alerts(args.trip, args.limit):
+            print(json.dumps(alert, ensure_ascii=False, default=str))
+    elif args.once:
+        print(json.dumps(scheduler.run_cycle()))
+    else:
+        scheduler.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            scheduler.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
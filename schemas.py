@@ -0,0 +1,210 @@
+"""
+schemas.py
+
+Typed LLM responses (pydantic) and the one place they are parsed.
+
+Contains:
+- RiskAssessment: the risk agent's JSON (locations, time, transport_mode, risk_score,
+  risk_level, reasons, recommended_actions, summary).
+- EmergencyPlan / LocationEmergencyPlan: the emergency agent's per-location plan.
+- CombinedReport: assessment + advice + emergency plan from the single-call mode.
+- response_format(model): OpenAI `response_format` asking for JSON matching the model's
+  schema (structured output).
+- parse_assessment / parse_emergency_plan / parse_combined: reply text (or an already-decoded dict) ->
+  validated plain dict, or (None, error).
+
+Notes:
+- With structured output the reply is the JSON object itself; servers without it still
+  work, because the first JSON object is found with the incremental scanner
+  (utils.JsonObjectScanner) instead of a greedy regex.
+- Common LLM drift is normalized before validation (numeric strings, a single string
+  where a list is expected, contact lists instead of a mapping, level casing), so
+  near-misses are kept and anything else is reported instead of silently dropped.
+- Works with pydantic v1 and v2.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel, Field, ValidationError
+
+from utils import parse_first_json_object
+
+RISK_LEVELS = ("Low", "Medium", "High", "Critical")
+_PYDANTIC_V2 = hasattr(BaseModel, "model_validate")
+
+
+class RiskAssessment(BaseModel):
+    locations: List[str] = Field(default_factory=list)
+    time: Optional[str] = None
+    transport_mode: Optional[str] = None
+    risk_score: Optional[int] = Field(None, ge=0, le=100)
+    risk_level: str = "Medium"
+    reasons: List[str] = Field(default_factory=list)
+    recommended_actions: List[str] = Field(default_factory=list)
+    summary: str = ""
+
+
+class LocationEmergencyPlan(BaseModel):
+    location: str
+    emergency_contacts: Dict[str, str] = Field(default_factory=dict)
+    next_steps: List[str] = Field(default_factory=list)
+    response_checklist: List[str] = Field(default_factory=list)
+
+
+class EmergencyPlan(BaseModel):
+    locations: List[LocationEmergencyPlan] = Field(default_factory=list)
+
+
+class CombinedReport(BaseModel):
+    """Single-call mode: all three agents' outputs in one reply."""
+    assessment: RiskAssessment
+    advice: str = ""
+    emergency: EmergencyPlan = Field(default_factory=EmergencyPlan)
+
+
+# ---------- pydantic v1/v2 ----------
+def _validate(model: Type[BaseModel], data: Dict[str, Any]) -> BaseModel:
+    return model.model_validate(data) if _PYDANTIC_V2 else model.parse_obj(data)
+
+
+def _dump(obj: BaseModel) -> Dict[str, Any]:
+    return obj.model_dump() if _PYDANTIC_V2 else obj.dict()
+
+
+def json_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    return model.model_json_schema() if _PYDANTIC_V2 else model.schema()
+
+
+def response_format(model: Type[BaseModel]) -> Dict[str, Any]:
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": model.__name__, "schema": json_schema(model), "strict": False},
+    }
+
+
+# ---------- normalization ----------
+def _as_list(value: Any) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value] if value.strip() else []
+    if isinstance(value, (list, tuple)):
+        return [v if isinstance(v, str) else str(v) for v in value if v not in (None, "")]
+    return [str(value)]
+
+
+def _as_score(value: Any) -> Optional[int]:
+    # an unusable score is dropped (the deterministic score stands in) rather than
+    # failing the whole assessment
+    if isinstance(value, str):
+        try:
+            value = float(value.strip().rstrip("%"))
+        except ValueError:
+            return None
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, float):
+        value = round(value)
+    if isinstance(value, int):
+        return max(0, min(100, value))
+    return None
+
+
+def _level_for(score: Any) -> str:
+    score = score if isinstance(score, int) else 50
+    return "Low" if score < 40 else "Medium" if score < 60 else "High" if score < 80 else "Critical"
+
+
+def _normalize_assessment(data: Dict[str, Any]) -> Dict[str, Any]:
+    out = dict(data)
+    out["locations"] = _as_list(out.get("locations"))
+    if "risk_score" in out:
+        out["risk_score"] = _as_score(out["risk_score"])
+    level = str(out.get("risk_level") or "").strip().title()
+    out["risk_level"] = level if level in RISK_LEVELS else _level_for(out.get("risk_score"))
+    out["reasons"] = _as_list(out.get("reasons"))
+    out["recommended_actions"] = _as_list(out.get("recommended_actions"))
+    for key in ("time", "transport_mode"):
+        if out.get(key) is not None and not isinstance(out[key], str):
+            out[key] = str(out[key])
+    if not isinstance(out.get("summary", ""), str):
+        out["summary"] = str(out["summary"])
+    return out
+
+
+def _contacts(value: Any) -> Dict[str, str]:
+    if isinstance(value, dict):
+        return {str(k): str(v) for k, v in value.items() if v not in (None, "")}
+    out: Dict[str, str] = {}
+    for i, item in enumerate(value or []):
+        if isinstance(item, dict):
+            label = item.get("name") or item.get("service") or item.get("label") or f"contact {i + 1}"
+            number = item.get("number") or item.get("phone") or item.get("contact") or ""
+            out[str(label)] = str(number)
+        elif item:
+            out[f"contact {i + 1}"] = str(item)
+    return out
+
+
+def _normalize_location_plan(plan: Any) -> Any:
+    if isinstance(plan, str):
+        plan = {"location": plan}
+    if not isinstance(plan, dict):
+        return plan
+    out = dict(plan)
+    out["location"] = str(out.get("location") or "Unknown Location")
+    out["emergency_contacts"] = _contacts(out.get("emergency_contacts"))
+    out["next_steps"] = _as_list(out.get("next_steps"))
+    checklist_key = next((k for k in out if "checklist" in k.lower()), None)
+    out["response_checklist"] = _as_list(out.pop(checklist_key, None) if checklist_key else None)
+    return out
+
+
+def _normalize_emergency(data: Dict[str, Any]) -> Dict[str, Any]:
+    plans = data.get("locations")
+    if plans is None:
+        plans = [data] if "location" in data else []
+    elif isinstance(plans, dict):
+        # {"Kandy": {...}} -> [{"location": "Kandy", ...}]
+        plans = [dict(v, location=k) if isinstance(v, dict) else v for k, v in plans.items()]
+    return {"locations": [_normalize_location_plan(p) for p in plans]}
+
+
+def _normalize_combined(data: Dict[str, Any]) -> Dict[str, Any]:
+    advice = data.get("advice") or data.get("advice_text") or ""
+    if isinstance(advice, (list, tuple)):
+        advice = "\n".join(f"- {a}" for a in _as_list(advice))
+    emergency = data.get("emergency") or data.get("emergency_plan") or {}
+    return {
+        "assessment": _normalize_assessment(data.get("assessment") or {}),
+        "advice": str(advice),
+        "emergency": _normalize_emergency(emergency if isinstance(emergency, dict) else {"locations": emergency}),
+    }
+
+
+# ---------- parsing ----------
+def _parse(
+    model: Type[BaseModel], reply: Any, normalize
+) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    data = reply if isinstance(reply, dict) else parse_first_json_object(reply if isinstance(reply, str) else "")
+    if data is None:
+        return None, "no JSON object in reply"
+    try:
+        return _dump(_validate(model, normalize(data))), None
+    except ValidationError as e:
+        return None, f"{model.__name__} validation failed: {e}"
+
+
+def parse_assessment(reply: Any) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """(assessment dict, None) or (None, error)."""
+    return _parse(RiskAssessment, reply, _normalize_assessment)
+
+
+def parse_emergency_plan(reply: Any) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """({"locations": [...]}, None) or (None, error)."""
+    return _parse(EmergencyPlan, reply, _normalize_emergency)
+
+
+def parse_combined(reply: Any) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """({"assessment", "advice", "emergency"}, None) or (None, error)."""
+    return _parse(CombinedReport, reply, _normalize_combined)
@@ -0,0 +1,161 @@
+"""
+scoring.py
+
+Vectorized deterministic risk scoring.
+
+Contains:
+- RiskScorer: compiles the keyword sets once, turns trips into feature rows and scores
+  whole batches with one NumPy matrix product.
+- default_scorer(): the shared scorer built from RISK_WEIGHTS_PATH (risk_weights.json).
+
+Features (one column each, in FEATURES order):
+- severe_weather:   number of locations whose weather text has a severe word
+- emergency_signal: number of locations whose emergency text mentions accident/closure/evacuation
+- ground_transport: 1 if the trip is by bus/train/motorbike/car/tuk-tuk
+- air_transport:    1 if the trip is by flight/plane
+
+score = clip(base + features @ weights, min_score, max_score)
+
+Notes:
+- With the shipped weights this is exactly the old utils.compute_risk_score heuristic
+  (which now delegates here).
+- features_batch() once, then score_features() with different weights, re-scores
+  thousands of stored assessments in a few milliseconds.
+"""
+
+import json
+import os
+import re
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+RISK_WEIGHTS_PATH = os.getenv(
+    "RISK_WEIGHTS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "risk_weights.json")
+)
+FEATURES = ("severe_weather", "emergency_signal", "ground_transport", "air_transport")
+
+DEFAULT_CONFIG: Dict[str, Any] = {
+    "base": 20,
+    "min_score": 0,
+    "max_score": 100,
+    "weights": {"severe_weather": 30, "emergency_signal": 25, "ground_transport": 10, "air_transport": 5},
+    "severe_words": ["storm", "heavy rain", "flood", "cyclone", "hurricane", "severe", "snow"],
+    "emergency_words": ["accident", "closure", "evacuat"],
+    "ground_transport": ["bus", "train", "motorbike", "car", "tuk-tuk"],
+    "air_transport": ["flight", "plane"],
+}
+
+# (weather_data, emergency_data, transport) as passed to compute_risk_score
+Trip = Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]], Optional[str]]
+
+
+def load_config(path: Optional[str] = None) -> Dict[str, Any]:
+    """DEFAULT_CONFIG overlaid with the JSON file at `path` (missing file -> defaults)."""
+    config = json.loads(json.dumps(DEFAULT_CONFIG))
+    path = path or RISK_WEIGHTS_PATH
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            loaded = json.load(f)
+    except FileNotFoundError:
+        return config
+    except (OSError, ValueError) as e:
+        print(f"risk weights: could not read {path}: {e}; using defaults")
+        return config
+    weights = dict(config["weights"], **(loaded.pop("weights", None) or {}))
+    config.update(loaded)
+    config["weights"] = weights
+    return config
+
+
+def _keyword_regex(words: Iterable[str]) -> "re.Pattern[str]":
+    # substring match, like the original `w in raw.lower()` checks; longest first
+    alternatives = sorted({w.lower() for w in words if w}, key=len, reverse=True)
+    if not alternatives:
+        return re.compile(r"(?!)")
+    return re.compile("|".join(re.escape(w) for w in alternatives))
+
+
+def _raw_texts(data: Optional[Dict[str, Any]]) -> List[str]:
+    out = []
+    for entry in (data or {}).values():
+        raw = entry.get("raw", "") if isinstance(entry, dict) else ""
+        out.append(str(raw).lower())
+    return out
+
+
+class RiskScorer:
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        config = config or load_config()
+        self.config = config
+        self.base = float(config["base"])
+        self.min_score = float(config["min_score"])
+        self.max_score = float(config["max_score"])
+        self.weights = np.array([float(config["weights"].get(f, 0)) for f in FEATURES])
+        self._severe = _keyword_regex(config["severe_words"])
+        self._emergency = _keyword_regex(config["emergency_words"])
+        self._ground = frozenset(config["ground_transport"])
+        self._air = frozenset(config["air_transport"])
+
+    @classmethod
+    def from_file(cls, path: str) -> "RiskScorer":
+        return cls(load_config(path))
+
+    # ---------- features ----------
+    def features(self, weather_data, emergency_data, transport) -> np.ndarray:
+        return self.features_batch([(weather_data, emergency_data, transport)])[0]
+
+    def features_batch(self, trips: Sequence[Trip]) -> np.ndarray:
+        """(n_trips, len(FEATURES)) matrix."""
+        severe, emergency = self._severe.search, self._emergency.search
+        ground, air = self._ground, self._air
+        rows = [
+            (
+                sum(1 for t in _raw_texts(weather_data) if severe(t)),
+                sum(1 for t in _raw_texts(emergency_data) if emergency(t)),
+                transport in ground,
+                transport in air,
+            )
+            for weather_data, emergency_data, transport in trips
+        ]
+        return np.array(rows, dtype=float).reshape(len(rows), len(FEATURES))
+
+    # ---------- scoring ----------
+    def score_features(self, X: np.ndarray, weights: Optional[np.ndarray] = None) -> np.ndarray:
+        w = self.weights if weights is None else np.asarray(weights, dtype=float)
+        scores = np.clip(self.base + np.asarray(X, dtype=float) @ w, self.min_score, self.max_score)
+        return np.rint(scores).astype(int)
+
+    def score_batch(self, trips: Sequence[Trip]) -> np.ndarray:
+        return self.score_features(self.features_batch(trips))
+
+    def score(self, weather_data, emergency_data, transport) -> int:
+        return int(self.score_batch([(weather_data, emergency_data, transport)])[0])
+
+    def contributions(self, X: np.ndarray) -> np.ndarray:
+        """Per-feature points (before clamping), same shape as X."""
+        return np.asarray(X, dtype=float) * self.weights
+
+    def explain(self, weather_data, emergency_data, transport) -> Dict[str, Any]:
+        x = self.features(weather_data, emergency_data, transport)
+        points = self.contributions(x)
+        return {
+            "score": int(self.score_features(x[None, :])[0]),
+            "base": self.base,
+            "features": {f: float(v) for f, v in zip(FEATURES, x)},
+            "contributions": {f: float(v) for f, v in zip(FEATURES, points)},
+        }
+
+
+_default: Optional[RiskScorer] = None
+_default_lock = threading.Lock()
+
+
+def default_scorer() -> RiskScorer:
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = RiskScorer()
+    return _default
@@ -0,0 +1,211 @@
+"""
+service.py
+
+HTTP API over the agent pipeline (FastAPI + uvicorn).
+
+Endpoints:
+- GET  /health           readiness() from warmup (503 until warmed up)
+- POST /assess           {"text"}        -> risk assessment
+- POST /advise           {"assessment"}  -> advisory
+- POST /emergency        {"assessment"}  -> emergency plan
+- POST /trip             {"text"}        -> {"assessment", "advisory", "emergency"}
+- POST /trip/stream      {"text"}        -> server-sent events, one per stage:
+      assessment_early, assessment, advisory_delta*, advisory, emergency, done
+      (or a single "error" event if the risk assessment fails)
+- GET  /assessments      ?location=&risk_level=&days=&limit= -> recent recorded trips
+- GET  /assessments/summary  ?location=&days= -> counts per risk level and location
+- GET  /assessments/{id} one recorded trip with its retrieval snapshots
+
+/trip and /trip/stream also take "mode" ("agents" | "combined") or "tier"; the
+"primary" tier defaults to the single-call combined mode (orchestrator.resolve_mode).
+
+Run:
+    uvicorn service:app --host 0.0.0.0 --port 8000 --workers 4
+
+Notes:
+- Handlers never block the event loop: the agents' LLM calls run on the shared async
+  OpenAI client (llm_client.py), and /trip/stream relays orchestrator.astream_trip()
+  from that loop (client.aiterate), so an open stream holds no thread. Blocking work
+  (warm-up, history queries) uses a bounded thread pool (SERVICE_MAX_WORKERS); the
+  agents push retrieval / NER onto worker threads themselves.
+- Finished trips are recorded in the assessment history (store.py); the history
+  endpoints return 404 when ASSESSMENT_STORE_ENABLED=0.
+- Models and agents are warmed up once per worker process at startup.
+- The Streamlit app becomes a thin client of this service when TRIP_SAFETY_API_URL is
+  set (see service_client.py).
+"""
+
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
+
+from llm_client import get_llm_client
+from orchestrator import astream_trip, record_trip, resolve_mode
+from security import sanitize_user_text
+from store import AssessmentStore, get_assessment_store
+from warmup import get_agent, readiness, warmup
+
+SERVICE_MAX_WORKERS = int(os.getenv("SERVICE_MAX_WORKERS", "64"))
+
+_executor = ThreadPoolExecutor(max_workers=SERVICE_MAX_WORKERS, thread_name_prefix="service")
+
+
+class TripRequest(BaseModel):
+    text: str = Field(..., min_length=1, max_length=4000)
+    mode: Optional[str] = None
+    tier: Optional[str] = None
+
+    def resolved_mode(self) -> str:
+        try:
+            return resolve_mode(self.mode, self.tier)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+
+
+class AssessmentRequest(BaseModel):
+    assessment: Dict[str, Any]
+
+
+async def _run(fn: Callable, *args) -> Any:
+    return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+
+
+async def _agent(coro) -> Any:
+    """Await an agent coroutine on the shared LLM loop (llm_client) without holding a thread."""
+    return await asyncio.wrap_future(get_llm_client().submit(coro))
+
+
+def _jsonable(payload: Any) -> Any:
+    if isinstance(payload, Exception):
+        return {"error": str(payload)}
+    if isinstance(payload, dict):
+        payload = dict(payload)
+        payload.pop("original_assessment", None)
+    return payload
+
+
+def _sse(event: str, payload: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(_jsonable(payload), ensure_ascii=False, default=str)}\n\n"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await _run(warmup)
+    yield
+    _executor.shutdown(wait=False, cancel_futures=True)
+
+
+app = FastAPI(title="Trip Safety AI", lifespan=lifespan)
+
+
+@app.get("/health")
+async def health():
+    state = readiness()
+    return JSONResponse(state, status_code=200 if state["warmed"] else 503)
+
+
+@app.post("/assess")
+async def assess(req: TripRequest):
+    return _jsonable(await _agent(get_agent("risk").ahandle(sanitize_user_text(req.text))))
+
+
+@app.post("/advise")
+async def advise(req: AssessmentRequest):
+    return _jsonable(await _agent(get_agent("advisory").ahandle(req.assessment)))
+
+
+@app.post("/emergency")
+async def emergency(req: AssessmentRequest):
+    return _jsonable(await _agent(get_agent("emergency").ahandle(req.assessment)))
+
+
+@app.post("/trip")
+async def trip(req: TripRequest):
+    text = sanitize_user_text(req.text)
+    if req.resolved_mode() == "combined":
+        try:
+            result = await _agent(get_agent("combined").ahandle(text))
+        except Exception as e:
+            raise HTTPException(status_code=502, detail=f"assessment failed: {e}")
+        record_trip(text, "combined", result)
+        return {name: _jsonable(result[name]) for name in ("assessment", "advisory", "emergency")}
+    try:
+        assessment = await _agent(get_agent("risk").ahandle(text))
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"risk assessment failed: {e}")
+    advisory, emergency_plan = await asyncio.gather(
+        _agent(get_agent("advisory").ahandle(assessment)),
+        _agent(get_agent("emergency").ahandle(assessment)),
+        return_exceptions=True,
+    )
+    record_trip(text, "agents", {"assessment": assessment, "advisory": advisory, "emergency": emergency_plan})
+    return {
+        "assessment": _jsonable(assessment),
+        "advisory": _jsonable(advisory),
+        "emergency": _jsonable(emergency_plan),
+    }
+
+
+@app.post("/trip/stream")
+async def trip_stream(req: TripRequest):
+    text = sanitize_user_text(req.text)
+    mode = req.resolved_mode()
+
+    async def events() -> AsyncIterator[str]:
+        try:
+            async for name, payload in get_llm_client().aiterate(astream_trip(text, mode)):
+                yield _sse(name, payload)
+        except Exception as e:
+            yield _sse("error", e)
+            return
+        yield _sse("done", {})
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ---------- history ----------
+def _history_store() -> AssessmentStore:
+    store = get_assessment_store()
+    if store is None:
+        raise HTTPException(status_code=404, detail="assessment history is disabled")
+    return store
+
+
+def _since(days: Optional[float]) -> Optional[float]:
+    return time.time() - days * 86400 if days else None
+
+
+@app.get("/assessments")
+async def assessments(
+    location: Optional[str] = None,
+    risk_level: Optional[str] = None,
+    days: Optional[float] = Query(None, gt=0),
+    limit: int = Query(20, ge=1, le=500),
+):
+    store = _history_store()
+    return {"assessments": await _run(store.recent, location, risk_level, _since(days), None, limit)}
+
+
+@app.get("/assessments/summary")
+async def assessments_summary(location: Optional[str] = None, days: Optional[float] = Query(None, gt=0)):
+    store = _history_store()
+    return await _run(store.summary, _since(days), location)
+
+
+@app.get("/assessments/{assessment_id}")
+async def assessment_detail(assessment_id: str):
+    record = await _run(_history_store().get, assessment_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="no such assessment")
+    return record
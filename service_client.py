@@ -0,0 +1,116 @@
+"""
+service_client.py
+
+Thin client for the HTTP service (service.py), used by the Streamlit app when
+TRIP_SAFETY_API_URL is set.
+
+Contains:
+- ServiceClient: one pooled keep-alive requests.Session per process.
+  - stream_trip(text): the /trip/stream SSE events as the same (name, payload) tuples
+    orchestrator.stream_trip() yields, so callers don't care which side runs the agents.
+  - assess / advise / emergency / trip: the plain JSON endpoints.
+  - recent_assessments / assessment_summary: the assessment history (GET /assessments).
+- get_service_client(): the shared client, or None when TRIP_SAFETY_API_URL is unset.
+"""
+
+import json
+import os
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+TRIP_SAFETY_API_URL = os.getenv("TRIP_SAFETY_API_URL", "").rstrip("/")
+SERVICE_TIMEOUT_S = float(os.getenv("SERVICE_TIMEOUT_S", "120"))
+
+
+class ServiceError(RuntimeError):
+    pass
+
+
+class ServiceClient:
+    def __init__(self, base_url: str, timeout: float = SERVICE_TIMEOUT_S, pool_size: int = 16):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _post(self, path: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        resp = self.session.post(self.base_url + path, json=body, timeout=self.timeout)
+        if resp.status_code >= 400:
+            raise ServiceError(f"{path} failed ({resp.status_code}): {resp.text[:200]}")
+        return resp.json()
+
+    def _get(self, path: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        params = {k: v for k, v in params.items() if v is not None}
+        resp = self.session.get(self.base_url + path, params=params, timeout=self.timeout)
+        if resp.status_code >= 400:
+            raise ServiceError(f"{path} failed ({resp.status_code}): {resp.text[:200]}")
+        return resp.json()
+
+    def assess(self, text: str) -> Dict[str, Any]:
+        return self._post("/assess", {"text": text})
+
+    def advise(self, assessment: Dict[str, Any]) -> Dict[str, Any]:
+        return self._post("/advise", {"assessment": assessment})
+
+    def emergency(self, assessment: Dict[str, Any]) -> Dict[str, Any]:
+        return self._post("/emergency", {"assessment": assessment})
+
+    def trip(self, text: str, mode: Optional[str] = None, tier: Optional[str] = None) -> Dict[str, Any]:
+        return self._post("/trip", {"text": text, "mode": mode, "tier": tier})
+
+    def recent_assessments(
+        self,
+        location: Optional[str] = None,
+        risk_level: Optional[str] = None,
+        days: Optional[float] = None,
+        limit: int = 20,
+    ) -> List[Dict[str, Any]]:
+        params = {"location": location, "risk_level": risk_level, "days": days, "limit": limit}
+        return self._get("/assessments", params)["assessments"]
+
+    def assessment_summary(self, location: Optional[str] = None, days: Optional[float] = None) -> Dict[str, Any]:
+        return self._get("/assessments/summary", {"location": location, "days": days})
+
+    def stream_trip(self, text: str, mode: Optional[str] = None, tier: Optional[str] = None) -> Iterator[Tuple[str, Any]]:
+        """
+        Yields (event, payload) like orchestrator.stream_trip. A failed risk assessment
+        raises ServiceError; failed follow-ups arrive as ServiceError instances.
+        """
+        with self.session.post(
+            self.base_url + "/trip/stream", json={"text": text, "mode": mode, "tier": tier},
+            stream=True, timeout=self.timeout,
+        ) as resp:
+            if resp.status_code >= 400:
+                raise ServiceError(f"/trip/stream failed ({resp.status_code}): {resp.text[:200]}")
+            event, data = None, []
+            for line in resp.iter_lines(decode_unicode=True):
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:"):
+                    data.append(line[5:].strip())
+                elif not line and event:
+                    payload = json.loads("\n".join(data)) if data else None
+                    if event == "done":
+                        return
+                    if event == "error":
+                        raise ServiceError((payload or {}).get("error", "assessment failed"))
+                    if event in ("advisory", "emergency") and isinstance(payload, dict) and set(payload) == {"error"}:
+                        payload = ServiceError(payload["error"])
+                    yield event, payload
+                    event, data = None, []
+
+
+_client: Optional[ServiceClient] = None
+
+
+def get_service_client() -> Optional[ServiceClient]:
+    global _client
+    if not TRIP_SAFETY_API_URL:
+        return None
+    if _client is None:
+        _client = ServiceClient(TRIP_SAFETY_API_URL)
+    return _client
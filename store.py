@@ -0,0 +1,391 @@
+"""
+store.py
+
+Persistent history of finished assessments (SQLite, WAL).
+
+Contains:
+- AssessmentStore:
+  - record(user_text, assessment, advisory, emergency, mode): queues one finished trip
+    and returns its id at once; a background writer thread inserts queued records in
+    batched transactions.
+  - recent(location, risk_level, since, until, limit): newest first, filtered through the
+    indexes ("recent assessments for Kandy").
+  - get(id): one assessment with its per-location retrieval snapshots and agent outputs.
+  - summary(since, location): counts per risk level and per-location averages.
+  - flush(): wait until everything queued is on disk.
+- get_assessment_store(): the shared store, or None when ASSESSMENT_STORE_ENABLED=0.
+- `python store.py recent|show|summary`: small CLI.
+
+Tables:
+- assessments: one row per trip (entities, scores, risk level, summary, agent outputs as
+  JSON); indexed by created_at, day and (risk_level, created_at).
+- assessment_locations: one row per trip location with the weather / emergency snapshot
+  it was assessed on; indexed by (location_key, created_at). location_key is
+  tools.location_key, so "Kandy" and "kandy city" find the same history (filters are
+  typed input, so they also resolve typos: "Kandyy").
+
+Notes:
+- record() never blocks the request path: it enqueues a deep copy of the trip (the
+  caller keeps using, and may mutate, the dicts it passed in; a copy is about half the
+  cost of serializing them), serialization happens on the writer thread, and a full
+  queue (ASSESSMENT_STORE_QUEUE_MAX) drops the record and counts it instead of waiting.
+- Reads use their own connection; with WAL they don't wait for the writer.
+"""
+
+import argparse
+import atexit
+import copy
+import json
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from tools import location_key
+
+ASSESSMENT_DB_PATH = os.getenv("ASSESSMENT_DB_PATH", os.path.join(".cache", "assessments.sqlite3"))
+ASSESSMENT_STORE_ENABLED = os.getenv("ASSESSMENT_STORE_ENABLED", "1") == "1"
+ASSESSMENT_STORE_BATCH = int(os.getenv("ASSESSMENT_STORE_BATCH", "200"))
+ASSESSMENT_STORE_FLUSH_S = float(os.getenv("ASSESSMENT_STORE_FLUSH_S", "0.5"))
+ASSESSMENT_STORE_QUEUE_MAX = int(os.getenv("ASSESSMENT_STORE_QUEUE_MAX", "10000"))
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS assessments ("
+    " id TEXT PRIMARY KEY, created_at REAL NOT NULL, day TEXT NOT NULL, mode TEXT,"
+    " user_text TEXT NOT NULL, locations TEXT NOT NULL, time TEXT, transport TEXT,"
+    " risk_score INTEGER, risk_score_final INTEGER, risk_level TEXT, summary TEXT,"
+    " parse_error TEXT, assessment TEXT NOT NULL, advisory TEXT, emergency TEXT);"
+    "CREATE INDEX IF NOT EXISTS assessments_created ON assessments(created_at);"
+    "CREATE INDEX IF NOT EXISTS assessments_day ON assessments(day);"
+    "CREATE INDEX IF NOT EXISTS assessments_level ON assessments(risk_level, created_at);"
+    "CREATE TABLE IF NOT EXISTS assessment_locations ("
+    " assessment_id TEXT NOT NULL, position INTEGER NOT NULL, location TEXT NOT NULL,"
+    " location_key TEXT NOT NULL, created_at REAL NOT NULL, weather TEXT, emergency TEXT,"
+    " PRIMARY KEY (assessment_id, position));"
+    "CREATE INDEX IF NOT EXISTS assessment_locations_key ON assessment_locations(location_key, created_at);"
+)
+# list columns (no JSON blobs) for history views
+SUMMARY_COLUMNS = (
+    "id, created_at, day, mode, user_text, locations, time, transport, risk_score,"
+    " risk_score_final, risk_level, summary, parse_error"
+)
+
+
+def _dumps(value: Any) -> Optional[str]:
+    return None if value is None else json.dumps(value, ensure_ascii=False, default=str)
+
+
+def _jsonable(result: Any) -> Any:
+    if isinstance(result, Exception):
+        return {"error": str(result)}
+    if isinstance(result, dict):
+        result = dict(result)
+        result.pop("original_assessment", None)
+    return result
+
+
+def _rows(record: Tuple) -> Tuple[Tuple, List[Tuple]]:
+    """(assessments row, assessment_locations rows) for one queued record."""
+    rec_id, created_at, mode, user_text, assessment, advisory, emergency = record
+    weather_data = assessment.get("weather_data") or {}
+    emergency_data = assessment.get("emergency_data") or {}
+    locations = list(assessment.get("locations") or list(weather_data))
+    core = {k: v for k, v in assessment.items() if k not in ("weather_data", "emergency_data")}
+    row = (
+        rec_id, created_at, datetime.fromtimestamp(created_at).strftime("%Y-%m-%d"), mode, user_text,
+        _dumps(locations), assessment.get("time"), assessment.get("transport_mode"),
+        assessment.get("risk_score"), assessment.get("risk_score_final"), assessment.get("risk_level"),
+        assessment.get("summary"), assessment.get("parse_error"),
+        _dumps(core), _dumps(advisory), _dumps(emergency),
+    )
+    # snapshots are keyed by the locations retrieval ran for (the planner's)
+    snapshot_locations = list(dict.fromkeys(list(weather_data) + list(emergency_data))) or locations
+    loc_rows = [
+        (rec_id, i, loc, location_key(loc), created_at, _dumps(weather_data.get(loc)), _dumps(emergency_data.get(loc)))
+        for i, loc in enumerate(snapshot_locations)
+    ]
+    return row, loc_rows
+
+
+def _decode(row: sqlite3.Row) -> Dict[str, Any]:
+    out = dict(row)
+    for key in ("locations", "assessment", "advisory", "emergency"):
+        if out.get(key) is not None:
+            out[key] = json.loads(out[key])
+    return out
+
+
+class AssessmentStore:
+    def __init__(
+        self,
+        path: str = ASSESSMENT_DB_PATH,
+        batch_size: int = ASSESSMENT_STORE_BATCH,
+        flush_interval: float = ASSESSMENT_STORE_FLUSH_S,
+        max_queue: int = ASSESSMENT_STORE_QUEUE_MAX,
+    ):
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+        self._queue: "queue.Queue[Optional[Tuple]]" = queue.Queue(max_queue)
+        self._stats = {"queued": 0, "written": 0, "batches": 0, "dropped": 0, "errors": 0}
+        self._writer = threading.Thread(target=self._run, name="assessment-store", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # ---------- writes ----------
+    def record(
+        self,
+        user_text: str,
+        assessment: Dict[str, Any],
+        advisory: Any = None,
+        emergency: Any = None,
+        mode: Optional[str] = None,
+    ) -> Optional[str]:
+        """Queue a finished trip; returns its id, or None if it was dropped (queue full)."""
+        rec_id = uuid.uuid4().hex
+        try:
+            # a snapshot, not the live dicts: they are still shared with the caller
+            record = copy.deepcopy(
+                (rec_id, time.time(), mode, user_text, assessment, _jsonable(advisory), _jsonable(emergency))
+            )
+        except Exception as e:
+            print("assessment store: record failed:", e)
+            with self._lock:
+                self._stats["errors"] += 1
+            return None
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self._stats["dropped"] += 1
+            return None
+        with self._lock:
+            self._stats["queued"] += 1
+        return rec_id
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until every queued record is written (or `timeout` passes)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Stop the writer after what is queued; gives up after `timeout` (records still queued are lost)."""
+        deadline = time.monotonic() + timeout
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            print("assessment store: close timed out with", self._queue.qsize(), "records queued")
+            return
+        self._writer.join(timeout=max(0.0, deadline - time.monotonic()))
+
+    def _run(self) -> None:
+        conn = self._connect()
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while item is not None and len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(item)
+            records = [r for r in batch if r is not None]
+            if records:
+                self._write(conn, records)
+            for _ in batch:
+                self._queue.task_done()
+            if len(records) < len(batch):
+                conn.close()
+                return
+
+    def _write(self, conn: sqlite3.Connection, records: List[Tuple]) -> None:
+        try:
+            rows, loc_rows = [], []
+            for record in records:
+                row, locs = _rows(record)
+                rows.append(row)
+                loc_rows.extend(locs)
+            with conn:
+                conn.executemany(f"INSERT OR REPLACE INTO assessments VALUES ({', '.join('?' * 16)})", rows)
+                conn.executemany("INSERT OR REPLACE INTO assessment_locations VALUES (?, ?, ?, ?, ?, ?, ?)", loc_rows)
+        except Exception as e:
+            print("assessment store: write failed:", e)
+            with self._lock:
+                self._stats["errors"] += 1
+            return
+        with self._lock:
+            self._stats["written"] += len(records)
+            self._stats["batches"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats, pending=self._queue.qsize())
+
+    # ---------- reads ----------
+    def recent(
+        self,
+        location: Optional[str] = None,
+        risk_level: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        limit: int = 20,
+    ) -> List[Dict[str, Any]]:
+        """Newest first; no JSON blobs (use get() for the full record)."""
+        where, params = [], []
+        if location:
+            # walk the (location_key, created_at) index newest first
+            query = (
+                f"SELECT {', '.join('a.' + c.strip() for c in SUMMARY_COLUMNS.split(','))}"
+                " FROM assessment_locations l JOIN assessments a ON a.id = l.assessment_id"
+            )
+            where.append("l.location_key = ?")
+            params.append(location_key(location, fuzzy=True))
+            order = "l.created_at"
+        else:
+            query = f"SELECT {SUMMARY_COLUMNS} FROM assessments a"
+            order = "a.created_at"
+        if risk_level:
+            where.append("a.risk_level = ?")
+            params.append(risk_level.strip().title())
+        if since is not None:
+            where.append(f"{order} >= ?")
+            params.append(since)
+        if until is not None:
+            where.append(f"{order} < ?")
+            params.append(until)
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += f" ORDER BY {order} DESC LIMIT ?"
+        with self._lock:
+            rows = self._conn.execute(query, params + [limit]).fetchall()
+        return [_decode(r) for r in rows]
+
+    def get(self, assessment_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM assessments WHERE id = ?", (assessment_id,)).fetchone()
+            locs = self._conn.execute(
+                "SELECT location, weather, emergency FROM assessment_locations WHERE assessment_id = ? ORDER BY position",
+                (assessment_id,),
+            ).fetchall()
+        if row is None:
+            return None
+        out = _decode(row)
+        out["assessment"]["weather_data"] = {r["location"]: json.loads(r["weather"] or "null") for r in locs}
+        out["assessment"]["emergency_data"] = {r["location"]: json.loads(r["emergency"] or "null") for r in locs}
+        return out
+
+    def summary(self, since: Optional[float] = None, location: Optional[str] = None, top: int = 10) -> Dict[str, Any]:
+        """{"total", "by_level": {level: {"count", "avg_score"}}, "locations": [{"location", "count", "avg_score"}]}."""
+        where, params = ["1"], []
+        if since is not None:
+            where.append("a.created_at >= ?")
+            params.append(since)
+        if location:
+            where.append("a.id IN (SELECT assessment_id FROM assessment_locations WHERE location_key = ?)")
+            params.append(location_key(location, fuzzy=True))
+        clause = " WHERE " + " AND ".join(where)
+        with self._lock:
+            levels = self._conn.execute(
+                "SELECT a.risk_level AS level, COUNT(*) AS n, AVG(a.risk_score_final) AS avg_score"
+                " FROM assessments a" + clause + " GROUP BY a.risk_level",
+                params,
+            ).fetchall()
+            locations = self._conn.execute(
+                "SELECT MIN(l.location) AS location, COUNT(*) AS n, AVG(a.risk_score_final) AS avg_score"
+                " FROM assessment_locations l JOIN assessments a ON a.id = l.assessment_id"
+                + clause + " GROUP BY l.location_key ORDER BY n DESC LIMIT ?",
+                params + [top],
+            ).fetchall()
+        by_level = {
+            (r["level"] or "Unknown"): {"count": r["n"], "avg_score": round(r["avg_score"], 1) if r["avg_score"] is not None else None}
+            for r in levels
+        }
+        return {
+            "total": sum(v["count"] for v in by_level.values()),
+            "by_level": by_level,
+            "locations": [
+                {"location": r["location"], "count": r["n"],
+                 "avg_score": round(r["avg_score"], 1) if r["avg_score"] is not None else None}
+                for r in locations
+            ],
+        }
+
+
+_store: Optional[AssessmentStore] = None
+_store_lock = threading.Lock()
+
+
+def get_assessment_store() -> Optional[AssessmentStore]:
+    global _store
+    if not ASSESSMENT_STORE_ENABLED:
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                try:
+                    _store = AssessmentStore()
+                    atexit.register(_store.close)
+                except (OSError, sqlite3.Error) as e:
+                    print("assessment store unavailable:", e)
+                    return None
+    return _store
+
+
+# ---------- CLI ----------
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Query the assessment history.")
+    ap.add_argument("--db", default=ASSESSMENT_DB_PATH)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    recent = sub.add_parser("recent", help="newest assessments")
+    recent.add_argument("--location")
+    recent.add_argument("--risk-level")
+    recent.add_argument("--days", type=float, help="only the last N days")
+    recent.add_argument("--limit", type=int, default=20)
+    show = sub.add_parser("show", help="one assessment with its snapshots")
+    show.add_argument("id")
+    summary = sub.add_parser("summary", help="counts per risk level and location")
+    summary.add_argument("--location")
+    summary.add_argument("--days", type=float)
+    args = ap.parse_args(argv)
+
+    store = AssessmentStore(args.db)
+    since = time.time() - args.days * 86400 if getattr(args, "days", None) else None
+    if args.cmd == "recent":
+        out: Any = store.recent(args.location, args.risk_level, since=since, limit=args.limit)
+    elif args.cmd == "show":
+        out = store.get(args.id)
+        if out is None:
+            print(f"no assessment {args.id}", file=sys.stderr)
+            return 1
+    else:
+        out = store.summary(since=since, location=args.location)
+    print(json.dumps(out, indent=2, ensure_ascii=False, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
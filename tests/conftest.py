@@ -0,0 +1,44 @@
+"""
+Shared pytest setup.
+
+Tests run against the local stub servers in benchmarks/stub_servers.py (no network,
+no API keys). Everything that would persist state (Serper cache, assessment history,
+gazetteer index) is pointed at a throwaway directory before the app modules import.
+"""
+
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_TMP = tempfile.mkdtemp(prefix="trip-safety-tests-")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("SERPER_API_KEY", "test")
+os.environ["SERPER_CACHE_PATH"] = ""
+os.environ["GAZETTEER_INDEX_DIR"] = os.path.join(_TMP, "gazetteer")
+os.environ["ASSESSMENT_DB_PATH"] = os.path.join(_TMP, "assessments.sqlite3")
+os.environ["MONITOR_DB_PATH"] = os.path.join(_TMP, "monitor.sqlite3")
+os.environ.setdefault("ASSESSMENT_STORE_ENABLED", "0")
+
+# one stub of each API for the whole session, started before the app modules read
+# SERPER_SEARCH_URL / OPENAI_BASE_URL at import
+from benchmarks.stub_servers import OpenAIStub, SerperStub  # noqa: E402
+
+import pytest  # noqa: E402
+
+_SERPER = SerperStub(latency_ms=20, jitter_ms=0).start()
+_LLM = OpenAIStub(latency_ms=60, jitter_ms=0, ttft_ms=10, chunk_chars=24).start()
+os.environ["SERPER_SEARCH_URL"] = _SERPER.url
+os.environ["OPENAI_BASE_URL"] = _LLM.base_url
+
+
+@pytest.fixture(scope="session")
+def serper_stub():
+    return _SERPER
+
+
+@pytest.fixture(scope="session")
+def llm_stub():
+    return _LLM
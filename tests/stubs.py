@@ -0,0 +1,64 @@
+"""Test helpers on top of benchmarks/stub_servers.py."""
+
+import threading
+import time
+
+from benchmarks.stub_servers import OpenAIStub
+
+
+class TrackingOpenAIStub(OpenAIStub):
+    """
+    OpenAIStub that records how many requests are on the wire at once and can make
+    chosen requests slow (`slow(n)` -> the next n requests take `slow_ms` longer).
+    """
+
+    def __init__(self, latency_ms: float = 50.0, ttft_ms: float = 10.0, slow_ms: float = 0.0):
+        super().__init__(latency_ms=latency_ms, jitter_ms=0.0, ttft_ms=ttft_ms)
+        self.slow_ms = slow_ms
+        self.active = 0
+        self.max_active = 0
+        self._slow_left = 0
+
+    def slow(self, n: int) -> None:
+        with self._lock:
+            self._slow_left = n
+
+    def _delay(self, ms=None) -> None:
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            extra = self.slow_ms if self._slow_left > 0 else 0.0
+            self._slow_left = max(0, self._slow_left - 1)
+        try:
+            super()._delay(ms)
+            if extra:
+                time.sleep(extra / 1000)
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+def start_llm_stub(monkeypatch, **kwargs) -> TrackingOpenAIStub:
+    stub = TrackingOpenAIStub(**kwargs).start()
+    monkeypatch.setenv("OPENAI_BASE_URL", stub.base_url)
+    return stub
+
+
+class Threads:
+    """Run `fn(*args)` on several threads and collect results in order."""
+
+    def __init__(self, fn, args_list):
+        self.results = [None] * len(args_list)
+        self._threads = [
+            threading.Thread(target=self._run, args=(i, fn, args)) for i, args in enumerate(args_list)
+        ]
+
+    def _run(self, i, fn, args):
+        self.results[i] = fn(*args)
+
+    def join(self):
+        for t in self._threads:
+            t.start()
+        for t in self._threads:
+            t.join()
+        return self.results
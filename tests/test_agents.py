@@ -0,0 +1,73 @@
+import asyncio
+import time
+
+import agents
+from llm_client import get_llm_client
+
+
+def test_semantic_cache_lookup_does_not_block_the_llm_loop(llm_stub, monkeypatch):
+    # a slow embedding call (the semantic fallback) must not stall other calls on the loop
+    monkeypatch.setattr(agents._llm_cache, "embed", lambda text: time.sleep(0.3) or [1.0, 0.0])
+    agent = agents.AdvisoryAgent()
+    # build the AsyncOpenAI client first (warm-up does this in the app); its one-off
+    # construction is not what this test measures
+    get_llm_client().start()
+
+    async def probe():
+        lags = []
+
+        async def ticker():
+            for _ in range(30):
+                t = time.perf_counter()
+                await asyncio.sleep(0.01)
+                lags.append(time.perf_counter() - t)
+
+        tick = asyncio.ensure_future(ticker())
+        text = await agent._acall_llm("advice for Kandy", cache_fields={"probe": time.time()})
+        await tick
+        return text, max(lags)
+
+    text, worst_lag = get_llm_client().run(probe())
+    assert text
+    assert worst_lag < 0.15
+
+
+def test_assessment_arrives_before_the_stream_ends(llm_stub):
+    # the stub reply is a JSON block followed by a prose summary: the assessment is
+    # handed over as soon as the JSON closes, the summary is filled in at the end
+    early = []
+    agent = agents.RiskAssessmentAgent()
+    text = f"Bus from Colombo to Kandy tomorrow (ref {time.time_ns()})"
+    final = get_llm_client().run(agent.ahandle(text, on_assessment=lambda a: early.append((time.perf_counter(), a))))
+    done = time.perf_counter()
+
+    assert len(early) == 1
+    at, assessment = early[0]
+    assert at < done
+    assert assessment["risk_level"] == final["risk_level"] == "Medium"
+    assert not assessment.get("summary")
+    assert final["summary"].startswith("The trip carries a moderate risk")
+
+
+def test_identical_llm_calls_hit_the_cache(llm_stub):
+    agent = agents.AdvisoryAgent()
+    fields = {"probe": time.time_ns()}
+    before = llm_stub.requests
+    first = get_llm_client().run(agent._acall_llm("advice for Kandy", cache_fields=fields))
+    second = get_llm_client().run(agent._acall_llm("advice for Kandy", cache_fields=fields))
+    assert first == second
+    assert llm_stub.requests - before == 1
+
+
+def test_batch_prefetch_runs_ner_once_per_trip(llm_stub, serper_stub, monkeypatch):
+    import batch
+
+    calls = []
+    extract = agents.extract_entities
+    monkeypatch.setattr(agents, "extract_entities", lambda text: calls.append(text) or extract(text))
+    trips = [{"id": str(i), "text": f"Train from Colombo to Kandy (ref {time.time_ns()})"} for i in range(2)]
+    batch.prefetch_locations(trips, max_workers=2, deadline=10)
+    for trip in trips:
+        assert agents.RiskAssessmentAgent().handle(trip["text"])["risk_level"]
+    # the agent reuses the entities the prefetch extracted
+    assert calls == []
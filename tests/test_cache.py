@@ -0,0 +1,120 @@
+import time
+
+import pytest
+
+import tools
+from cache import LLMResponseCache, TwoTierCache
+from stubs import Threads
+
+
+@pytest.fixture
+def counted():
+    calls = []
+
+    def fetch(value="result", delay=0.0):
+        def run():
+            calls.append(value)
+            time.sleep(delay)
+            return {"raw": value}
+        return run
+
+    fetch.calls = calls
+    return fetch
+
+
+def _cache(**kw):
+    return TwoTierCache(ttls={"default": 60}, stale_grace={"default": 60}, **kw)
+
+
+# ---------- Serper cache (TwoTierCache) ----------
+def test_second_lookup_is_a_hit(counted):
+    cache = _cache()
+    assert cache.get_or_fetch("weather in kandy", "default", counted()) == {"raw": "result"}
+    assert cache.get_or_fetch("weather in kandy", "default", counted()) == {"raw": "result"}
+    assert counted.calls == ["result"]
+    stats = cache.stats()
+    assert (stats["misses"], stats["hits"]) == (1, 1)
+
+
+def test_failed_responses_are_not_cached():
+    cache = _cache(should_cache=lambda resp: "error" not in resp)
+    calls = []
+
+    def failing():
+        calls.append(1)
+        return {"error": "HTTP 500"}
+
+    cache.get_or_fetch("q", "default", failing)
+    cache.get_or_fetch("q", "default", failing)
+    assert len(calls) == 2
+    assert cache.stats()["fetch_errors"] == 2
+
+
+def test_concurrent_misses_share_one_fetch(counted):
+    cache = _cache()
+    threads = Threads(lambda: cache.get_or_fetch("q", "default", counted(delay=0.2)), [()] * 5)
+    assert threads.join() == [{"raw": "result"}] * 5
+    assert counted.calls == ["result"]
+    stats = cache.stats()
+    assert (stats["misses"], stats["coalesced"]) == (1, 4)
+
+
+def test_stale_entry_is_served_while_it_refreshes(counted):
+    cache = TwoTierCache(ttls={"default": 0}, stale_grace={"default": 60})
+    cache.get_or_fetch("q", "default", counted("old"))
+    assert cache.get_or_fetch("q", "default", counted("new", delay=0.1)) == {"raw": "old"}
+    deadline = time.time() + 2
+    while cache.memory.get("q")[0] != {"raw": "new"} and time.time() < deadline:
+        time.sleep(0.01)
+    assert cache.memory.get("q")[0] == {"raw": "new"}
+    assert cache.stats()["stale_hits"] == 1
+
+
+def test_fetch_serper_goes_to_the_network_once(serper_stub):
+    query = f"weather in Kandy next 24 hours #{time.time_ns()}"
+    before = serper_stub.requests
+    threads = Threads(tools.fetch_serper, [(query, "weather")] * 4)
+    first = threads.join()
+    assert tools.fetch_serper(" ".join(query.upper().split()), "weather") == first[0]
+    assert serper_stub.requests - before == 1
+
+
+# ---------- LLM response cache ----------
+def test_llm_cache_hit_miss_and_expiry():
+    cache = LLMResponseCache(default_ttl=60)
+    fields = {"locations": ["Kandy"], "time": "tomorrow"}
+    assert cache.get("risk", fields) is None
+    cache.put("risk", fields, "reply", prompt_tokens=100, completion_tokens=20)
+    # same fields in another order hit; another agent or other fields miss
+    assert cache.get("risk", {"time": "tomorrow", "locations": ["Kandy"]}) == "reply"
+    assert cache.get("advisory", fields) is None
+    assert cache.get("risk", dict(fields, time="today")) is None
+    cache.put("risk", {"x": 1}, "short-lived", ttl=0)
+    assert cache.get("risk", {"x": 1}) is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["saved_tokens"]) == (1, 4, 120)
+
+
+def test_disabled_llm_cache_never_hits():
+    cache = LLMResponseCache(enabled=False)
+    cache.put("risk", {"a": 1}, "reply")
+    assert cache.get("risk", {"a": 1}) is None
+
+
+def test_disk_tier_drops_dead_entries(tmp_path):
+    path = str(tmp_path / "serper.sqlite3")
+    ttls, grace = {"gone": 0, "kept": 60}, {"gone": 0, "kept": 60}
+    cache = TwoTierCache(ttls, grace, path=path, purge_every=3)
+    for i in range(3):
+        cache.get_or_fetch(f"old {i}", "gone", lambda: {"raw": "x"})
+    cache.get_or_fetch("fresh", "kept", lambda: {"raw": "y"})
+    deadline = time.time() + 2
+    while cache.stats()["purged"] < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    assert cache.stats()["purged"] >= 2  # every 3rd write purges in the background
+
+    # whatever is still dead on disk goes when the cache is opened again
+    cache.disk.set("dead", ({"raw": "z"}, 0.0, 0.0))
+    reopened = TwoTierCache(ttls, grace, path=path)
+    assert reopened.disk.get("dead") is None
+    assert reopened.disk.get("fresh") is not None
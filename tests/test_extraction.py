@@ -0,0 +1,60 @@
+from datetime import date, timedelta
+
+import pytest
+
+from nlp import extract_time, extract_transport_mode
+
+
+def _at(hhmm: str, days: int = 0) -> str:
+    return f"{date.today() + timedelta(days=days)}T{hhmm}:00"
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "I will take that 5 buses",
+        "flat 4 in Colombo",
+        "Going to Kandy by 2 trains",
+        "around 5 people on the bus",
+        "meet at 13pm",
+    ],
+)
+def test_no_clock_false_positives(text):
+    assert extract_time(text) is None
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("tomorrow at 8:30am", _at("08:30", 1)),
+        ("leaving at 9pm", _at("21:00")),
+        ("back by 9 p.m.", _at("21:00")),
+        ("around 10:15", _at("10:15")),
+        ("@ 9", _at("09:00")),
+        ("at 7 tonight", _at("19:00")),
+        ("tomorrow evening at 6", _at("18:00", 1)),
+        ("at 7am tonight", _at("07:00")),
+        ("bus at 12 am", _at("00:00")),
+    ],
+)
+def test_clock_times(text, expected):
+    assert extract_time(text) == expected
+
+
+def test_relative_phrase_without_clock():
+    assert extract_time("Heading out Tonight") == "Tonight"
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("by tuk  tuk to Galle", "tuk-tuk"),
+        ("Tuk\ttuk at 5 am", "tuk-tuk"),
+        ("three   wheeler ride", "tuk-tuk"),
+        ("taking the coach", "bus"),
+        ("we care about business", None),
+        ("flight then a taxi", "flight"),
+    ],
+)
+def test_transport_modes(text, expected):
+    assert extract_transport_mode(text) == expected
@@ -0,0 +1,183 @@
+import asyncio
+import time
+
+import pytest
+
+from llm_client import AsyncLLMClient, LLMError
+from tests.stubs import Threads, start_llm_stub
+
+MESSAGES = [{"role": "system", "content": "You are the Advisory Agent."}, {"role": "user", "content": "Kandy"}]
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    s = start_llm_stub(monkeypatch, latency_ms=50, slow_ms=600)
+    yield s
+    s.stop()
+
+
+def _complete(client):
+    resp = client.run(client.complete(MESSAGES, model="stub", max_tokens=50))
+    return resp.choices[0].message.content
+
+
+def test_concurrency_limit_holds_with_hedging(stub):
+    client = AsyncLLMClient(max_concurrency=2, hedge_after=0.05, tpm=0)
+    stub.slow(100)  # every request outlives the hedge delay
+    results = Threads(_complete, [(client,)] * 4).join()
+    assert all(results)
+    assert stub.max_active <= 2
+    # both slots were always busy, so no hedge could go out
+    assert client.metrics()["hedges"] == 0
+    assert client.metrics()["max_in_flight"] <= 2
+
+
+def test_hedge_takes_a_free_slot_and_wins(stub):
+    client = AsyncLLMClient(max_concurrency=2, hedge_after=0.1, tpm=0)
+    stub.slow(1)  # only the first request is slow; the hedge is not
+    assert _complete(client)
+    m = client.metrics()
+    assert m["hedges"] == 1 and m["hedge_wins"] == 1
+    assert m["max_in_flight"] == 2
+    assert m["in_flight"] == 0
+    # every slot came back: two concurrent calls still run side by side
+    # (first let the cancelled slow request finish sleeping on the server)
+    time.sleep(0.7)
+    stub.max_active = 0
+    Threads(_complete, [(client,)] * 2).join()
+    assert stub.max_active == 2
+
+
+def test_streams_are_hedged_on_time_to_first_token(stub):
+    client = AsyncLLMClient(max_concurrency=2, hedge_after=0.1, tpm=0)
+    stub.slow(1)
+
+    async def collect():
+        return [c async for c in client.stream(MESSAGES, model="stub", max_tokens=50)]
+
+    chunks = client.run(collect())
+    assert any(c.choices and c.choices[0].delta.content for c in chunks)
+    assert client.metrics()["hedge_wins"] == 1
+    assert client.metrics()["in_flight"] == 0
+
+
+def test_failed_call_refunds_tpm_and_charges_once(monkeypatch):
+    monkeypatch.setenv("OPENAI_BASE_URL", "http://127.0.0.1:1/v1")
+    client = AsyncLLMClient(max_retries=2, timeout=1, tpm=60000, backoff_base=0.01, hedge=False)
+    charged = []
+    reserve = client._bucket.reserve
+
+    def spy(tokens):
+        charged.append(tokens)
+        return reserve(tokens)
+
+    client._bucket.reserve = spy
+    with pytest.raises(LLMError):
+        client.run(client.complete(MESSAGES, model="stub", max_tokens=1000))
+    assert len(charged) == 1  # three attempts, one charge
+    assert client._bucket.reserve(0) == 0.0
+    assert client._bucket._tokens == pytest.approx(60000, abs=50)
+    assert client.metrics()["retries"] == 2
+
+
+def test_submit_from_loop_thread_is_rejected(stub):
+    client = AsyncLLMClient(tpm=0)
+
+    async def nested():
+        coro = asyncio.sleep(0)
+        client.submit(coro)
+
+    with pytest.raises(RuntimeError):
+        client.run(nested())
+
+
+def test_hedge_counts_against_the_limit_for_later_callers(stub):
+    # cap 2: call A hedges (2 on the wire); call B arriving afterwards must wait
+    client = AsyncLLMClient(max_concurrency=2, hedge_after=0.05, tpm=0)
+    stub.slow(100)
+
+    def late(delay):
+        time.sleep(delay)
+        return _complete(client)
+
+    results = Threads(late, [(0.0,), (0.2,)]).join()
+    assert all(results)
+    assert client.metrics()["hedges"] >= 1
+    assert stub.max_active <= 2
+    assert client.metrics()["max_in_flight"] <= 2
+
+
+def _tokens(client):
+    client._bucket.reserve(0)  # refill to now
+    return client._bucket._tokens
+
+
+def test_stream_closed_early_refunds_the_unused_budget(stub):
+    client = AsyncLLMClient(tpm=6000, hedge=False)
+
+    async def first_chunk():
+        stream = client.stream(MESSAGES, model="stub", max_tokens=3000)
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                break
+        await stream.aclose()
+
+    client.run(first_chunk())
+    # only the prompt and one chunk stay charged, not the 3000 max_tokens
+    assert _tokens(client) > 6000 - 200
+
+
+def test_cancelled_call_refunds_and_waits_for_budget_without_a_slot(stub):
+    client = AsyncLLMClient(max_concurrency=1, tpm=6000, hedge=False)
+    stub.slow(1)
+
+    async def cancelled():
+        task = asyncio.ensure_future(client.complete(MESSAGES, model="stub", max_tokens=3000))
+        await asyncio.sleep(0.2)  # request on the wire (slow)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    client.run(cancelled())
+    assert _tokens(client) > 6000 - 50
+
+    async def over_budget():
+        # budget spent: the call waits for tokens, holding no concurrency slot meanwhile
+        client._bucket.reserve(6000)
+        task = asyncio.ensure_future(client.complete(MESSAGES, model="stub", max_tokens=100))
+        await asyncio.sleep(0.1)
+        state = client.metrics()["in_flight"], client._semaphore().locked(), client.metrics()["tpm_waits"]
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return state
+
+    assert client.run(over_budget()) == (0, False, 1)
+
+
+def test_rejected_response_format_is_not_sent_again(stub):
+    import httpx
+    import openai
+
+    client = AsyncLLMClient(tpm=0, hedge=False)
+    sent = []
+
+    class Completions:
+        async def create(self, **kwargs):
+            sent.append("response_format" in kwargs)
+            if "response_format" in kwargs:
+                request = httpx.Request("POST", stub.base_url + "/chat/completions")
+                raise openai.BadRequestError("response_format unsupported", response=httpx.Response(400, request=request), body=None)
+            return await real.chat.completions.create(**kwargs)
+
+    async def build():
+        return client._get_client()
+
+    real = client.run(build())
+    fake = type("Client", (), {"base_url": real.base_url, "chat": type("Chat", (), {"completions": Completions()})()})()
+    client._get_client = lambda: fake
+    fmt = {"type": "json_object"}
+    for _ in range(3):
+        assert client.run(client.complete(MESSAGES, response_format=fmt, model="stub", max_tokens=50)).choices
+    # one rejected structured attempt, then plain text only
+    assert sent == [True, False, False, False]
+    assert client.metrics()["structured_disabled"] == 1
+
@@ -0,0 +1,55 @@
+from types import SimpleNamespace
+
+import pytest
+
+import nlp
+import planner
+from gazetteer import get_gazetteer
+from tools import location_key
+
+
+def _doc(*ents):
+    return SimpleNamespace(ents=[SimpleNamespace(text=text, label_=label) for text, label in ents])
+
+
+@pytest.fixture(scope="module")
+def gaz():
+    g = get_gazetteer()
+    assert g is not None
+    return g
+
+
+@pytest.mark.parametrize("name", ["Colombia", "Mali", "Jaffa", "Kandi"])
+def test_ner_entities_are_not_fuzzy_matched(name):
+    assert nlp._locations_from_doc(_doc((name, "GPE")), f"Trip to {name}") == [name]
+
+
+def test_ner_entities_resolve_exact_names_and_aliases():
+    doc = _doc(("kandy city", "GPE"), ("Kandy", "GPE"), ("Trinco", "GPE"))
+    assert nlp._locations_from_doc(doc, "") == ["Kandy", "Trincomalee"]
+
+
+def test_fuzzy_only_on_request(gaz):
+    assert gaz.resolve("Kandyy") is None
+    assert gaz.resolve("Kandyy", fuzzy=True).name == "Kandy"
+    assert location_key("Kandyy") != "lk-kandy"
+    assert location_key("Kandyy", fuzzy=True) == "lk-kandy"
+
+
+def test_planner_keeps_unknown_places(gaz):
+    plan = planner.plan_retrieval(["Colombia", "Colombo"])
+    assert plan.locations == ["Colombia", "Colombo"]
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("Male traveller, Please check the route", []),
+        ("Fort closed? Going to Kandy tomorrow", ["Kandy"]),
+        ("Flying from Colombo to Male tomorrow", ["Colombo", "Malé"]),
+        ("Please check Kandy city weather", ["Kandy"]),
+        ("Walk around Galle Fort at noon", ["Galle"]),
+    ],
+)
+def test_find_in_text(gaz, text, expected):
+    assert [p.name for p in gaz.find_in_text(text)] == expected
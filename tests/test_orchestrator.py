@@ -0,0 +1,27 @@
+import time
+
+from orchestrator import stream_trip
+
+
+def test_stream_trip_event_order():
+    names = [name for name, _ in stream_trip(f"Bus from Colombo to Kandy tomorrow (ref {time.time_ns()})", "agents")]
+    assert names[:2] == ["assessment_early", "assessment"]
+    followups = names[2:]
+    assert sorted(n for n in followups if n != "advisory_delta") == ["advisory", "emergency"]
+    assert "advisory_delta" in followups
+    assert followups.index("advisory_delta") < followups.index("advisory")
+
+
+def test_combined_mode_yields_the_same_results():
+    events = dict(stream_trip(f"Train to Galle tonight (ref {time.time_ns()})", "combined"))
+    assert set(events) == {"assessment", "advisory", "emergency"}
+    assert events["assessment"]["risk_level"]
+
+
+def test_reading_stops_after_the_assessment():
+    events = stream_trip(f"Bus to Kandy (ref {time.time_ns()})", "agents")
+    for name, payload in events:
+        if name == "assessment":
+            break
+    events.close()
+    assert payload["locations"]
@@ -0,0 +1,29 @@
+from cache import LLMResponseCache, StageCache
+from prompts import combined_prompt, risk_prompt
+
+WEATHER = {"Kandy": {"weather": {"organic": [{"title": "Kandy weather", "snippet": "Heavy rain"}]}}}
+EMERGENCY = {"Kandy": {"emergency": {"organic": []}}}
+
+
+def _risk(text):
+    return risk_prompt(text, ["Kandy"], "tomorrow", "bus", WEATHER, EMERGENCY)
+
+
+def test_trip_text_is_part_of_the_cache_key():
+    plain = _risk("Bus to Kandy tomorrow")
+    toddler = _risk("Bus to Kandy tomorrow with a toddler")
+    assert plain.fields != toddler.fields
+    assert LLMResponseCache.make_key("risk", plain.fields) != LLMResponseCache.make_key("risk", toddler.fields)
+    assert StageCache.make_key("assessment", plain.fields) != StageCache.make_key("assessment", toddler.fields)
+
+
+def test_whitespace_does_not_change_the_key():
+    assert _risk("Bus to  Kandy\ttomorrow ").fields == _risk("Bus to Kandy tomorrow").fields
+
+
+def test_prompt_text_is_covered_by_fields():
+    prompt = _risk("Bus to Kandy tomorrow with a toddler")
+    assert "with a toddler" in prompt.text
+    assert "User:" not in prompt.text
+    combined = combined_prompt("Bus to Kandy tomorrow with a toddler", ["Kandy"], "tomorrow", "bus", WEATHER, EMERGENCY)
+    assert combined.fields["request"] == "Bus to Kandy tomorrow with a toddler"
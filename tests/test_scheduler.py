@@ -0,0 +1,79 @@
+import time
+from datetime import date, datetime, time as dt_time, timedelta
+
+import pytest
+
+import scheduler
+from scheduler import MonitorScheduler, TripStore
+
+
+@pytest.fixture
+def monitor(tmp_path, monkeypatch):
+    searches = []
+
+    def fake_lookup(kind, query):
+        searches.append((kind, query))
+        return {"raw": "Clear skies, no incidents", "source_query": query}
+
+    monkeypatch.setattr(scheduler, "fetch_lookup", fake_lookup)
+    m = MonitorScheduler(store=TripStore(str(tmp_path / "monitor.sqlite3")), serper_rps=1000)
+    m.searches = searches
+    return m
+
+
+def test_spellings_of_one_place_share_searches_across_trips(monitor):
+    monitor.store.add_trips([
+        {"id": "a", "user_text": "Bus to Kandy", "locations": ["Kandy"], "transport": "bus", "time": None,
+         "depart_at": time.time() + 3600},
+        {"id": "b", "user_text": "Car to kandy city", "locations": ["kandy city"], "transport": "car", "time": None,
+         "depart_at": time.time() + 3600},
+    ])
+    cycle = monitor.run_cycle()
+    assert cycle["scored"] == 2
+    assert cycle["locations"] == 1
+    assert sorted(kind for kind, _ in monitor.searches) == ["emergency", "weather"]
+
+
+def test_relative_day_is_monitored_until_the_end_of_that_day():
+    tomorrow_end = datetime.combine(date.today() + timedelta(days=2), dt_time()).timestamp()
+    assert scheduler._parse_departure("tomorrow") == tomorrow_end
+    assert scheduler._parse_departure("Tonight") == datetime.combine(date.today() + timedelta(days=1), dt_time()).timestamp()
+    assert scheduler._parse_departure("someday") is None
+
+
+def test_trips_without_a_time_expire(monitor):
+    monitor.store.add_trips([
+        {"id": "old", "user_text": "Kandy", "locations": ["Kandy"], "depart_at": None},
+    ])
+    assert monitor.store.deactivate_departed(time.time(), max_age_s=3600) == 0
+    assert monitor.store.deactivate_departed(time.time() + 7200, max_age_s=3600) == 1
+    assert monitor.store.active_trips() == []
+
+
+def test_serper_outage_keeps_the_previous_score(tmp_path, monkeypatch):
+    import socket
+
+    import tools
+
+    monkeypatch.setattr(tools._serper_cache, "enabled", False)
+    monkeypatch.setattr(tools._serper_client, "max_retries", 0)
+    m = MonitorScheduler(store=TripStore(str(tmp_path / "monitor.sqlite3")), serper_rps=1000)
+    m.store.add_trips([
+        {"id": "a", "user_text": "Bus to Kandy", "locations": ["Kandy"], "transport": "bus", "time": None,
+         "depart_at": time.time() + 3600},
+    ])
+    m.run_cycle()
+    (baseline,) = [t["last_score"] for t in m.store.active_trips()]
+    assert baseline is not None
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        dead = f"http://127.0.0.1:{s.getsockname()[1]}/search"
+    monkeypatch.setattr(tools._serper_client, "url", dead)
+    reassessed = []
+    monkeypatch.setattr(m, "_reassess", lambda trip, score: reassessed.append(score))
+    cycle = m.run_cycle()
+
+    assert (cycle["scored"], cycle["lookups_failed"]) == (0, cycle["lookups"])
+    assert [t["last_score"] for t in m.store.active_trips()] == [baseline]
+    assert reassessed == []
@@ -0,0 +1,73 @@
+import asyncio
+import json
+import threading
+
+from fastapi.testclient import TestClient
+
+import service
+from llm_client import get_llm_client
+
+
+def _events(body: str):
+    out = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        out.append((lines["event"], json.loads(lines["data"])))
+    return out
+
+
+def test_trip_stream_runs_without_pool_threads(monkeypatch):
+    submitted = []
+    real_submit = service._executor.submit
+    monkeypatch.setattr(service._executor, "submit", lambda *a, **kw: submitted.append(a) or real_submit(*a, **kw))
+
+    resp = TestClient(service.app).post("/trip/stream", json={"text": "Bus from Colombo to Kandy tomorrow", "mode": "agents"})
+    assert resp.status_code == 200
+    names = [name for name, _ in _events(resp.text)]
+    assert names[0] in ("assessment_early", "assessment")
+    assert names.index("assessment") < names.index("advisory")
+    assert {"advisory", "emergency"} <= set(names)
+    assert names[-1] == "done"
+    assert submitted == []
+
+
+def test_aiterate_cancels_the_generator_when_the_consumer_stops():
+    client = get_llm_client()
+    closed = threading.Event()
+
+    async def numbers():
+        try:
+            for i in range(100):
+                yield i
+                await asyncio.sleep(0.01)
+        finally:
+            closed.set()
+
+    async def consume():
+        got = []
+        stream = client.aiterate(numbers())
+        async for i in stream:
+            got.append(i)
+            if len(got) == 3:
+                break
+        await stream.aclose()
+        return got
+
+    assert asyncio.run(consume()) == [0, 1, 2]
+    assert closed.wait(2)
+
+
+def test_aiterate_reraises_generator_errors():
+    async def broken():
+        yield 1
+        raise ValueError("boom")
+
+    async def consume():
+        got = []
+        try:
+            async for i in get_llm_client().aiterate(broken()):
+                got.append(i)
+        except ValueError as e:
+            return got, str(e)
+
+    assert asyncio.run(consume()) == ([1], "boom")
@@ -0,0 +1,32 @@
+import time
+
+from cache import StageCache
+
+
+def test_stage_entries_expire_with_ttl():
+    memo = StageCache(default_ttl=0.05)
+    calls = []
+    run = lambda: memo.run("assessment", {"x": 1}, lambda: calls.append(1) or {"score": 1})
+    assert run() == ({"score": 1}, False)
+    assert run() == ({"score": 1}, True)
+    time.sleep(0.06)
+    assert run() == ({"score": 1}, False)
+    assert len(calls) == 2
+    assert memo.stats()["assessment"] == {"hits": 1, "misses": 2, "hit_ratio": 0.333}
+
+
+def test_per_put_ttl_and_copies():
+    memo = StageCache()
+    value = {"a": [1]}
+    memo.put("score", "k", value, ttl=0)
+    assert memo.get("score", "k") == (False, None)
+    memo.put("score", "k", value)
+    value["a"].append(2)
+    found, got = memo.get("score", "k")
+    assert found and got == {"a": [1]}
+
+
+def test_disabled_memo_always_recomputes():
+    memo = StageCache(enabled=False)
+    assert memo.run("extract", "t", lambda: 1) == (1, False)
+    assert memo.run("extract", "t", lambda: 1) == (1, False)
@@ -0,0 +1,39 @@
+import time
+
+from store import AssessmentStore
+
+
+def _assessment():
+    return {
+        "locations": ["Kandy"], "time": "tomorrow", "transport_mode": "bus",
+        "risk_score": 40, "risk_score_final": 42, "risk_level": "Medium", "summary": "Some rain.",
+        "weather_data": {"Kandy": {"raw": "Rain", "source_query": "weather in Kandy"}},
+        "emergency_data": {"Kandy": {"raw": "", "source_query": "emergency services in Kandy"}},
+    }
+
+
+def test_record_snapshots_the_assessment(tmp_path):
+    store = AssessmentStore(str(tmp_path / "a.sqlite3"))
+    assessment = _assessment()
+    rec_id = store.record("Bus to Kandy tomorrow", assessment, {"advice_text": "Take an umbrella"}, None, mode="agents")
+    # the caller (UI / stream consumer) keeps using and changing the same dict
+    assessment["risk_level"] = "High"
+    assessment["weather_data"]["Kandy"]["raw"] = "Flooding"
+    assert store.flush(5)
+
+    saved = store.get(rec_id)
+    assert saved["risk_level"] == "Medium"
+    assert saved["assessment"]["weather_data"]["Kandy"]["raw"] == "Rain"
+    assert store.recent("kandy city")[0]["id"] == rec_id
+    store.close()
+
+
+def test_close_does_not_hang_on_a_full_queue(tmp_path):
+    store = AssessmentStore(str(tmp_path / "a.sqlite3"), max_queue=1)
+    store.close()  # writer gone; nothing drains the queue any more
+    assert store.record("Bus to Kandy", _assessment()) is not None
+    assert store.record("Bus to Kandy", _assessment()) is None
+    t = time.monotonic()
+    store.close(timeout=0.2)
+    assert time.monotonic() - t < 1
+    assert store.stats()["dropped"] == 1
@@ -0,0 +1,11 @@
+from ui_components import _gauge_figure
+
+
+def test_gauge_figures_are_not_shared_between_renders():
+    first = _gauge_figure(55, "Medium")
+    first.update_layout(height=999)
+    first.data[0].value = 1
+    second = _gauge_figure(55, "Medium")
+    assert second is not first
+    assert second.layout.height == 230
+    assert second.data[0].value == 55
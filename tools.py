@@ -4,32 +4,232 @@ tools.py
 Wrapper for:
 - fetch_weather_for_location: uses SERPER (or any external IR) to get weather text.
 - fetch_emergency_info_for_location: uses SERPER to get local emergency intel.
+- run_lookups: runs distinct (kind, query) searches at once on a bounded thread pool,
+  with a total deadline and partial results.
+- fetch_locations_concurrently: the weather + emergency lookups for many locations.
+- location_key: stable per-place key (gazetteer id or normalized name), used to fetch
+  each place once however it was spelled.
 
 Notes:
 - Replace the search URLs as needed for your Serper client.
-- Keep network calls small and cache responses in production.
+- All Serper traffic goes through one shared SerperClient: a pooled keep-alive session,
+  a cap on in-flight requests, jittered exponential backoff on 429/5xx/connection errors
+  (honouring Retry-After) and per-call timing metrics (serper_client_metrics()).
+- Keep network calls small. fetch_serper goes through a two-tier cache (memory LRU +
+  SQLite at SERPER_CACHE_PATH) with per-kind TTLs; see serper_cache_stats().
 """
 
 import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from email.utils import parsedate_to_datetime
+
 import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
+
+import tracing
+from cache import TwoTierCache
+from gazetteer import get_gazetteer, normalize_name
 load_dotenv()
 
 SERPER_API_KEY = os.getenv("SERPER_API_KEY")
-SERPER_SEARCH_URL = "https://google.serper.dev/search"  # example Serper endpoint (adjust if different)
+SERPER_SEARCH_URL = os.getenv("SERPER_SEARCH_URL", "https://google.serper.dev/search")  # example Serper endpoint (adjust if different)
 HEADERS = {"X-API-KEY": SERPER_API_KEY} if SERPER_API_KEY else {}
 
-def fetch_serper(query: str) -> Dict[str, Any]:
+# Retrieval stage limits (override via env)
+RETRIEVAL_MAX_WORKERS = int(os.getenv("RETRIEVAL_MAX_WORKERS", "8"))
+RETRIEVAL_DEADLINE_S = float(os.getenv("RETRIEVAL_DEADLINE_S", "12"))
+
+# ---------- HTTP client ----------
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After is either delay-seconds or an HTTP-date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class SerperClient:
+    """
+    Shared Serper client.
+
+    - one requests.Session with a keep-alive pool of `pool_size` connections
+    - at most `max_in_flight` concurrent requests (callers block for a slot)
+    - up to `max_retries` retries on 429/5xx/timeouts with full-jitter exponential
+      backoff; a Retry-After header overrides the computed delay (capped at `max_wait`)
+    """
+
+    def __init__(
+        self,
+        url: str,
+        headers: Dict[str, str],
+        pool_size: int = 16,
+        max_in_flight: int = 8,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_cap: float = 8.0,
+        max_wait: float = 30.0,
+        timeout: float = 10.0,
+    ):
+        self.url = url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.max_wait = max_wait
+
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self._latencies_ms = deque(maxlen=512)
+        self._metrics = {"calls": 0, "requests": 0, "retries": 0, "errors": 0, "throttled": 0, "status": {}}
+
+    def _backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        if retry_after is not None:
+            return min(retry_after, self.max_wait)
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    def _record(self, status: Any, elapsed_ms: float) -> None:
+        with self._lock:
+            self._metrics["requests"] += 1
+            key = str(status)
+            self._metrics["status"][key] = self._metrics["status"].get(key, 0) + 1
+            self._latencies_ms.append(elapsed_ms)
+
+    def search(self, query: str) -> Dict[str, Any]:
+        with self._lock:
+            self._metrics["calls"] += 1
+        error = "no attempt made"
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            with self._slots:
+                start = time.perf_counter()
+                try:
+                    resp = self.session.post(self.url, json={"q": query}, timeout=self.timeout)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    self._record(type(e).__name__, (time.perf_counter() - start) * 1000)
+                    error = str(e)
+                    resp = None
+                except Exception as e:
+                    self._record(type(e).__name__, (time.perf_counter() - start) * 1000)
+                    error = str(e)
+                    break
+                else:
+                    self._record(resp.status_code, (time.perf_counter() - start) * 1000)
+
+            if resp is not None:
+                if resp.status_code < 400:
+                    try:
+                        return resp.json()
+                    except ValueError as e:
+                        error = f"invalid JSON from Serper: {e}"
+                        break
+                error = f"HTTP {resp.status_code}"
+                if resp.status_code not in RETRYABLE_STATUSES:
+                    break
+                if resp.status_code == 429:
+                    with self._lock:
+                        self._metrics["throttled"] += 1
+                retry_after = _parse_retry_after(resp.headers.get("Retry-After"))
+
+            if attempt < self.max_retries:
+                with self._lock:
+                    self._metrics["retries"] += 1
+                time.sleep(self._backoff(attempt, retry_after))
+
+        with self._lock:
+            self._metrics["errors"] += 1
+        return {"error": error, "query": query}
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._metrics, status=dict(self._metrics["status"]))
+            lat = sorted(self._latencies_ms)
+        if lat:
+            out["latency_ms"] = {
+                "last": round(self._latencies_ms[-1], 1),
+                "p50": round(lat[len(lat) // 2], 1),
+                "p95": round(lat[min(len(lat) - 1, int(len(lat) * 0.95))], 1),
+                "max": round(lat[-1], 1),
+            }
+        return out
+
+_serper_client = SerperClient(
+    SERPER_SEARCH_URL,
+    HEADERS,
+    pool_size=int(os.getenv("SERPER_POOL_SIZE", "16")),
+    max_in_flight=int(os.getenv("SERPER_MAX_IN_FLIGHT", "8")),
+    max_retries=int(os.getenv("SERPER_MAX_RETRIES", "3")),
+)
+
+def get_serper_client() -> SerperClient:
+    return _serper_client
+
+def serper_client_metrics() -> Dict[str, Any]:
+    return _serper_client.metrics()
+
+# ---------- Response cache ----------
+# Weather goes stale quickly; helplines and emergency numbers barely change.
+SERPER_CACHE_TTLS = {
+    "weather": float(os.getenv("SERPER_TTL_WEATHER_S", "900")),
+    "emergency": float(os.getenv("SERPER_TTL_EMERGENCY_S", "43200")),
+    "default": 3600.0,
+}
+# How long past its TTL an entry may still be served while it is refreshed.
+SERPER_CACHE_STALE_GRACE = {
+    "weather": 900.0,
+    "emergency": 43200.0,
+    "default": 3600.0,
+}
+SERPER_CACHE_PATH = os.getenv("SERPER_CACHE_PATH", os.path.join(".cache", "serper_cache.sqlite3"))
+
+_serper_cache = TwoTierCache(
+    ttls=SERPER_CACHE_TTLS,
+    stale_grace=SERPER_CACHE_STALE_GRACE,
+    path=SERPER_CACHE_PATH or None,
+    maxsize=int(os.getenv("SERPER_CACHE_MAXSIZE", "512")),
+    should_cache=lambda resp: isinstance(resp, dict) and "error" not in resp,
+    enabled=os.getenv("SERPER_CACHE_ENABLED", "1") == "1",
+)
+
+def _cache_key(query: str) -> str:
+    return " ".join(query.lower().split())
+
+def serper_cache_stats() -> Dict[str, Any]:
+    return _serper_cache.stats()
+
+def _fetch_serper_uncached(query: str) -> Dict[str, Any]:
+    with tracing.span("serper.http", query=query) as sp:
+        resp = _serper_client.search(query)
+        if "error" in resp:
+            sp.set(error=resp["error"])
+        return resp
+
+def fetch_serper(query: str, kind: str = "default") -> Dict[str, Any]:
     """
     Minimal Serper query. Adapt according to the official Serper client.
+    `kind` ("weather" / "emergency" / "default") selects the cache TTL.
     """
-    try:
-        payload = {"q": query}
-        resp = requests.post(SERPER_SEARCH_URL, json=payload, headers=HEADERS, timeout=10)
-        return resp.json()
-    except Exception as e:
-        return {"error": str(e), "query": query}
+    # a child "serper.http" span under this one means the cache missed
+    with tracing.span("serper.fetch", query=query, kind=kind):
+        return _serper_cache.get_or_fetch(_cache_key(query), kind, lambda: _fetch_serper_uncached(query))
 
 def extract_top_text_from_serper(resp: Dict[str, Any]) -> str:
     # Best-effort extraction depending on Serper response structure
@@ -41,15 +241,118 @@ def extract_top_text_from_serper(resp: Dict[str, Any]) -> str:
     # fallback
     return str(resp)[:1000]
 
-def fetch_weather_for_location(location: str) -> Dict[str, Any]:
-    q = f"weather in {location} next 24 hours"
-    resp = fetch_serper(q)
+def _place(location: str, fuzzy: bool = False):
+    gaz = get_gazetteer()
+    return gaz.resolve(location, fuzzy=fuzzy) if gaz is not None and location else None
+
+def location_key(location: str, fuzzy: bool = False) -> str:
+    """
+    Stable key for a location: the gazetteer place id when known ("Kandy" and "kandy
+    city" -> "lk-kandy"), otherwise the normalized name. fuzzy=True also maps typos
+    ("Kandyy") and is meant for typed input such as history filters, not NER output.
+    """
+    place = _place(location, fuzzy)
+    return place.id if place else normalize_name(location) or str(location or "").strip().lower()
+
+def _query_name(location: str) -> str:
+    # known places are searched by their canonical "Name, Country" label
+    place = _place(location)
+    return place.label if place else location
+
+# search templates per lookup kind; "combined" asks for both intents in one search
+QUERY_TEMPLATES = {
+    "weather": "weather in {} next 24 hours",
+    "emergency": "emergency services in {} helpline, recent incidents, road closures",
+    "combined": "weather forecast and emergency alerts in {} helpline, road closures",
+}
+# Serper cache TTL bucket per lookup kind (combined results are only as fresh as the weather)
+LOOKUP_CACHE_KIND = {"weather": "weather", "emergency": "emergency", "combined": "weather"}
+
+def weather_query(location: str) -> str:
+    return QUERY_TEMPLATES["weather"].format(_query_name(location))
+
+def emergency_query(location: str) -> str:
+    return QUERY_TEMPLATES["emergency"].format(_query_name(location))
+
+def fetch_lookup(kind: str, query: str) -> Dict[str, Any]:
+    """
+    {"raw", "source_query"} for one search. A failed search comes back like a timed-out
+    one, {"raw": "", "source_query", "error"}: never the error response's text, which
+    echoes the query and would be scored as intel.
+    """
+    resp = fetch_serper(query, kind=LOOKUP_CACHE_KIND.get(kind, "default"))
+    if isinstance(resp, dict) and "error" in resp:
+        return {"raw": "", "source_query": query, "error": str(resp["error"])}
     text = extract_top_text_from_serper(resp)
     # simple parse: return the raw text plus a placeholder structured object
-    return {"raw": text, "source_query": q}
+    return {"raw": text, "source_query": query}
+
+def fetch_weather_for_location(location: str) -> Dict[str, Any]:
+    return fetch_lookup("weather", weather_query(location))
 
 def fetch_emergency_info_for_location(location: str) -> Dict[str, Any]:
-    q = f"emergency services in {location} helpline, recent incidents, road closures"
-    resp = fetch_serper(q)
-    text = extract_top_text_from_serper(resp)
-    return {"raw": text, "source_query": q}
+    return fetch_lookup("emergency", emergency_query(location))
+
+def run_lookups(
+    lookups: List[Tuple[str, str]],
+    max_workers: Optional[int] = None,
+    deadline: Optional[float] = None,
+) -> Dict[Tuple[str, str], Dict[str, Any]]:
+    """
+    Run distinct (kind, query) searches at once; returns {(kind, query): result}.
+
+    - max_workers bounds how many Serper calls are in flight (default RETRIEVAL_MAX_WORKERS).
+    - deadline is the budget in seconds for the whole stage (default RETRIEVAL_DEADLINE_S).
+
+    Searches still running when the deadline passes are abandoned and reported as
+    {"raw": "", "source_query": q, "error": "timeout"}, so every lookup gets a result and
+    callers can carry on with partial data.
+    """
+    max_workers = max_workers or RETRIEVAL_MAX_WORKERS
+    deadline = RETRIEVAL_DEADLINE_S if deadline is None else deadline
+    lookups = list(dict.fromkeys(lookups))
+    results: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    if not lookups:
+        return results
+
+    # No `with` block for the pool: leaving it would wait for stragglers and defeat the deadline.
+    pool = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(lookups))), thread_name_prefix="retrieval")
+    with tracing.span("retrieval", lookups=len(lookups)) as stage:
+        try:
+            futures = {tracing.submit(pool, fetch_lookup, kind, q): (kind, q) for kind, q in lookups}
+            wait(futures, timeout=deadline)
+            timeouts = 0
+            for fut, (kind, q) in futures.items():
+                if not fut.done():
+                    results[(kind, q)] = {"raw": "", "source_query": q, "error": "timeout"}
+                    timeouts += 1
+                    continue
+                try:
+                    results[(kind, q)] = fut.result()
+                except Exception as e:
+                    results[(kind, q)] = {"raw": "", "source_query": q, "error": str(e)}
+            stage.set(timeouts=timeouts)
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+    return results
+
+def fetch_locations_concurrently(
+    locations: List[str],
+    max_workers: Optional[int] = None,
+    deadline: Optional[float] = None,
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Weather and emergency lookups for every location at once (see run_lookups for the
+    concurrency limit, deadline and timeout entries). Returns (weather_data,
+    emergency_data), one entry per location in the caller's order.
+
+    Spellings of the same place (same location_key) are fetched once and share the result.
+    For per-trip retrieval with entity collapsing and shared queries see planner.py.
+    """
+    weather = {loc: ("weather", weather_query(loc)) for loc in locations}
+    emergency = {loc: ("emergency", emergency_query(loc)) for loc in locations}
+    results = run_lookups(list(weather.values()) + list(emergency.values()), max_workers, deadline)
+    return (
+        {loc: results[weather[loc]] for loc in locations},
+        {loc: results[emergency[loc]] for loc in locations},
+    )
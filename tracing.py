@@ -0,0 +1,205 @@
+"""
+tracing.py
+
+Lightweight per-run tracing for the assessment pipeline.
+
+Contains:
+- start_trace(name): context manager that opens a trace (and its root span) for one run.
+- span(name, **attrs): context manager for a child span of whatever span is current.
+- start_span(name, **attrs) / Span.end(): manual spans, for generators and callbacks
+  where a `with` block can't wrap the work.
+- submit(executor, fn, *args): executor.submit that carries the current trace into the
+  worker thread.
+- last_trace(): the most recently finished trace (for the developer panel).
+
+Notes:
+- Outside a trace every helper is a cheap no-op, so instrumented code runs unchanged
+  from scripts, batch jobs and tests.
+- Finished traces are appended to TRACE_EXPORT_PATH (if set) as one OTLP/JSON
+  `resourceSpans` document per line.
+"""
+
+import contextvars
+import json
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "")
+SERVICE_NAME = "trip-safety-ai"
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("trace", default=None)
+_current_span: contextvars.ContextVar = contextvars.ContextVar("span", default=None)
+_last_trace = None
+_last_lock = threading.Lock()
+
+
+class Span:
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], attrs: Dict[str, Any]):
+        self.trace = trace
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attrs = dict(attrs)
+        self.status = "ok"
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+
+    def set(self, **attrs: Any) -> "Span":
+        self.attrs.update(attrs)
+        return self
+
+    def end(self, error: Optional[BaseException] = None) -> None:
+        if self.end_ns is not None:
+            return
+        if error is not None:
+            self.status = "error"
+            self.attrs["error"] = f"{type(error).__name__}: {error}"
+        self.end_ns = time.time_ns()
+        self.trace._add(self)
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ms": round((self.start_ns - self.trace.start_ns) / 1e6, 2),
+            "duration_ms": round(self.duration_ms, 2),
+            "status": self.status,
+            "attrs": self.attrs,
+        }
+
+
+class _NoopSpan:
+    """Returned when no trace is active."""
+
+    def set(self, **attrs: Any) -> "_NoopSpan":
+        return self
+
+    def end(self, error: Optional[BaseException] = None) -> None:
+        pass
+
+
+class Trace:
+    def __init__(self, name: str):
+        self.name = name
+        self.trace_id = secrets.token_hex(16)
+        self.start_ns = time.time_ns()
+        self._spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def _add(self, s: Span) -> None:
+        with self._lock:
+            self._spans.append(s)
+
+    @property
+    def spans(self) -> List[Span]:
+        with self._lock:
+            return sorted(self._spans, key=lambda s: s.start_ns)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"name": self.name, "trace_id": self.trace_id, "spans": [s.to_dict() for s in self.spans]}
+
+    def to_otlp(self) -> Dict[str, Any]:
+        def value(v: Any) -> Dict[str, Any]:
+            if isinstance(v, bool):
+                return {"boolValue": v}
+            if isinstance(v, int):
+                return {"intValue": str(v)}
+            if isinstance(v, float):
+                return {"doubleValue": v}
+            return {"stringValue": v if isinstance(v, str) else json.dumps(v, default=str)}
+
+        spans = []
+        for s in self.spans:
+            spans.append({
+                "traceId": self.trace_id,
+                "spanId": s.span_id,
+                "parentSpanId": s.parent_id or "",
+                "name": s.name,
+                "kind": 1,
+                "startTimeUnixNano": str(s.start_ns),
+                "endTimeUnixNano": str(s.end_ns),
+                "attributes": [{"key": k, "value": value(v)} for k, v in s.attrs.items()],
+                "status": {"code": 2 if s.status == "error" else 1},
+            })
+        return {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": "tracing"}, "spans": spans}],
+        }]}
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def start_span(name: str, **attrs: Any):
+    """Open a span under the current one without making it current. Call .end() yourself."""
+    trace = _current_trace.get()
+    if trace is None:
+        return _NoopSpan()
+    parent = _current_span.get()
+    return Span(trace, name, parent.span_id if parent is not None else None, attrs)
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Any]:
+    s = start_span(name, **attrs)
+    if isinstance(s, _NoopSpan):
+        yield s
+        return
+    token = _current_span.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.end(error=e)
+        raise
+    finally:
+        _current_span.reset(token)
+        s.end()
+
+
+@contextmanager
+def start_trace(name: str, **attrs: Any) -> Iterator[Trace]:
+    global _last_trace
+    trace = Trace(name)
+    trace_token = _current_trace.set(trace)
+    try:
+        with span(name, **attrs):
+            yield trace
+    finally:
+        _current_trace.reset(trace_token)
+        with _last_lock:
+            _last_trace = trace
+        if TRACE_EXPORT_PATH:
+            export(trace, TRACE_EXPORT_PATH)
+
+
+def submit(executor, fn, *args, **kwargs):
+    """executor.submit(fn, ...) with the caller's trace/span context carried over."""
+    ctx = contextvars.copy_context()
+    return executor.submit(ctx.run, fn, *args, **kwargs)
+
+
+def last_trace() -> Optional[Trace]:
+    with _last_lock:
+        return _last_trace
+
+
+def export(trace: Trace, path: str) -> None:
+    try:
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(trace.to_otlp()) + "\n")
+    except OSError as e:
+        print("trace export failed:", e)
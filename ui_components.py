@@ -1,5 +1,10 @@
 # ui_components.py
 # Reusable Streamlit widgets for a clean, visual UI.
+# Static CSS and Plotly figure specs are built once per process; widgets that users
+# interact with on the results page run as fragments (only they rerun on a click).
+
+import hashlib
+from functools import lru_cache
 
 import streamlit as st
 import plotly.graph_objects as go
@@ -7,40 +12,39 @@ import plotly.graph_objects as go
 # ---------- Theme ----------
 RISK_COLORS = {"Low": "#2ecc71", "Medium": "#f1c40f", "High": "#e74c3c"}
 
+NAV_CSS = """
+<style>
+[data-testid="stSidebar"] {
+    background-color: #2196f3;
+}
+[data-testid="stSidebar"] [data-testid="stMarkdown"] {
+    color: white !important;
+}
+section[data-testid="stSidebar"] button[kind="secondary"] {
+    background-color: transparent;
+    color: white;
+    border: 1px solid rgba(255, 255, 255, 0.2);
+}
+section[data-testid="stSidebar"] button[kind="secondary"]:hover {
+    background-color: rgba(255, 255, 255, 0.1);
+    border: 1px solid rgba(255, 255, 255, 0.3);
+}
+section[data-testid="stSidebar"] button[kind="primary"] {
+    background-color: white;
+    color: #2196f3;
+}
+section[data-testid="stSidebar"] button[kind="primary"]:hover {
+    background-color: #f0f0f0;
+}
+</style>
+"""
+
 def navigation_bar():
     if 'page' not in st.session_state:
         st.session_state.page = "home"
-    
-    st.markdown(
-        """
-        <style>
-        [data-testid="stSidebar"] {
-            background-color: #2196f3;
-        }
-        [data-testid="stSidebar"] [data-testid="stMarkdown"] {
-            color: white !important;
-        }
-        section[data-testid="stSidebar"] button[kind="secondary"] {
-            background-color: transparent;
-            color: white;
-            border: 1px solid rgba(255, 255, 255, 0.2);
-        }
-        section[data-testid="stSidebar"] button[kind="secondary"]:hover {
-            background-color: rgba(255, 255, 255, 0.1);
-            border: 1px solid rgba(255, 255, 255, 0.3);
-        }
-        section[data-testid="stSidebar"] button[kind="primary"] {
-            background-color: white;
-            color: #2196f3;
-        }
-        section[data-testid="stSidebar"] button[kind="primary"]:hover {
-            background-color: #f0f0f0;
-        }
-        </style>
-        """,
-        unsafe_allow_html=True
-    )
-        
+
+    st.markdown(NAV_CSS, unsafe_allow_html=True)
+
     with st.sidebar:
         st.markdown("### Navigation")
         nav_items = {
@@ -87,7 +91,9 @@ def metric_cards(score:int, level:str, transport:str, time_text:str):
     c4.metric("When", time_text or "—")
 
 # ---------- Risk Gauge ----------
-def risk_gauge(score:int, level:str):
+@lru_cache(maxsize=512)
+def _gauge_spec(score:int, level:str):
+    # built (and validated) once per (score, level); callers only get copies
     color = RISK_COLORS.get(level, "#95a5a6")
     fig = go.Figure(go.Indicator(
         mode="gauge+number",
@@ -104,7 +110,15 @@ def risk_gauge(score:int, level:str):
         }
     ))
     fig.update_layout(height=230, margin=dict(l=10, r=10, t=10, b=10))
-    st.plotly_chart(fig, use_container_width=True, config={"displayModeBar": False})
+    return fig.to_dict()
+
+def _gauge_figure(score:int, level:str):
+    # a fresh Figure per render (it copies the spec); the spec is already validated, so
+    # skip plotly's re-validation, which costs more than building the gauge from scratch
+    return go.Figure(_gauge_spec(score, level), _validate=False)
+
+def risk_gauge(score:int, level:str):
+    st.plotly_chart(_gauge_figure(int(score or 0), level), use_container_width=True, config={"displayModeBar": False})
 
 # ---------- Icons ----------
 ICON_MAP = {
@@ -129,13 +143,16 @@ def reasons_list(reasons:list[str]):
         st.markdown(f"- {icon_for(r)} {r}")
 
 # ---------- Actions Checklist ----------
-def actions_checklist(actions:list[str]):
+@st.fragment
+def actions_checklist(actions:list[str], key_prefix:str="action"):
+    # a fragment: ticking a box reruns only this checklist, not the page (or any agent)
     st.subheader("Recommended actions")
     if not actions:
         st.write("—")
         return
-    for a in actions:
-        st.checkbox(a, value=False, key=f"action_{hash(a)}")
+    for i, a in enumerate(actions):
+        digest = hashlib.md5(a.encode("utf-8")).hexdigest()[:8]
+        st.checkbox(a, value=False, key=f"{key_prefix}_{i}_{digest}")
 
 # ---------- Emergency Cards ----------
 def emergency_cards(emergency_data):
@@ -154,7 +171,7 @@ def emergency_cards(emergency_data):
             location = plan.get("location", "Unknown Location")
             contacts = plan.get("emergency_contacts", {})
             steps = plan.get("next_steps", [])
-            checklist = plan.get("3-min_response_checklist", [])
+            checklist = plan.get("response_checklist") or plan.get("3-min_response_checklist", [])
 
             with st.container(border=True):
                 st.markdown(f"### 📍 {location}")
@@ -197,3 +214,31 @@ def raw_blocks(summary:dict=None, weather:dict=None, emergency:dict=None):
         st.json(weather or {})
     with st.expander("Raw emergency sources"):
         st.json(emergency or {})
+
+# ---------- Timing Waterfall ----------
+def trace_waterfall(trace: dict):
+    """Per-stage waterfall for one traced run (tracing.Trace.to_dict())."""
+    spans = (trace or {}).get("spans") or []
+    if not spans:
+        st.caption("No timing data yet — run an assessment.")
+        return
+    spans = spans[::-1]  # plotly draws the first bar at the bottom
+    labels = [f"{s['name']} · {s['attrs'].get('agent') or s['attrs'].get('kind') or ''}".rstrip(" ·") for s in spans]
+    fig = go.Figure(go.Bar(
+        y=labels,
+        x=[s["duration_ms"] for s in spans],
+        base=[s["start_ms"] for s in spans],
+        orientation="h",
+        marker_color=["#e74c3c" if s["status"] == "error" else "#2196f3" for s in spans],
+        hovertext=[", ".join(f"{k}={v}" for k, v in s["attrs"].items()) for s in spans],
+    ))
+    fig.update_layout(
+        height=max(160, 22 * len(spans)),
+        margin=dict(l=10, r=10, t=10, b=10),
+        xaxis_title="ms",
+        showlegend=False,
+    )
+    st.plotly_chart(fig, use_container_width=True, config={"displayModeBar": False})
+    total = max(s["start_ms"] + s["duration_ms"] for s in spans)
+    tokens = sum(s["attrs"].get("prompt_tokens", 0) + s["attrs"].get("completion_tokens", 0) for s in spans)
+    st.caption(f"Total {total:.0f} ms · {tokens} LLM tokens")
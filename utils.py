@@ -1,40 +1,26 @@
 """
 utils.py
 
-Helper functions: risk scoring, summarization, etc.
+Helper functions: risk scoring, summarization, JSON scanning, rate limiting, etc.
 """
 
 from typing import Dict, Any
+import json
 import re
 import math
+import threading
+import time
+
+from scoring import default_scorer
 
 def compute_risk_score(weather_data: Dict[str, Any], emergency_data: Dict[str, Any], transport: str) -> int:
     """
     Very simple deterministic heuristic score (0-100).
     In your final report, explain that this is a heuristic and can be replaced with ML.
+    Weights and keywords live in risk_weights.json; see scoring.RiskScorer for batches
+    and per-feature contributions.
     """
-    base = 20
-    # if weather suggests severe words
-    severe_words = ["storm", "heavy rain", "flood", "cyclone", "hurricane", "severe", "snow"]
-    for loc, wd in (weather_data or {}).items():
-        raw = str(wd.get("raw", "")).lower()
-        for w in severe_words:
-            if w in raw:
-                base += 30
-                break
-    # emergency data mentions 'closure'/'accident' add points
-    for loc, ed in (emergency_data or {}).items():
-        raw = str(ed.get("raw", "")).lower()
-        if "accident" in raw or "closure" in raw or "evacuat" in raw:
-            base += 25
-    # transport risk
-    if transport in ("bus", "train", "motorbike", "car"):
-        base += 10
-    if transport in ("flight", "plane"):
-        base += 5
-    # clamp
-    score = max(0, min(100, base))
-    return score
+    return default_scorer().score(weather_data, emergency_data, transport)
 
 def summarize_text(text: str, max_sentences:int = 2) -> str:
     if not text:
@@ -42,3 +28,117 @@ def summarize_text(text: str, max_sentences:int = 2) -> str:
     sents = re.split(r'(?<=[.!?])\s+', text.strip())
     return " ".join(sents[:max_sentences]).strip()
 
+
+class JsonObjectScanner:
+    """
+    Incrementally finds the first complete top-level JSON object in streamed text.
+
+    feed() chunks as they arrive; it returns the parsed dict as soon as the closing
+    brace of a valid object is seen (None until then). Braces inside strings are
+    ignored, and a balanced block that isn't valid JSON is skipped.
+    """
+
+    def __init__(self):
+        self.result = None
+        self._reset()
+
+    def _reset(self):
+        self._buf = []
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+
+    def feed(self, chunk: str):
+        if self.result is not None:
+            return None
+        for ch in chunk:
+            if self._depth == 0:
+                if ch == "{":
+                    self._buf.append(ch)
+                    self._depth = 1
+                continue
+            self._buf.append(ch)
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif ch == "\\":
+                    self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+            elif ch == '"':
+                self._in_str = True
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        obj = json.loads("".join(self._buf))
+                    except ValueError:
+                        self._reset()
+                        continue
+                    if isinstance(obj, dict):
+                        self.result = obj
+                        return obj
+                    self._reset()
+        return None
+
+def parse_first_json_object(text: str):
+    """First valid top-level JSON object in `text`, or None."""
+    scanner = JsonObjectScanner()
+    scanner.feed(text or "")
+    return scanner.result
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, bursts up to `capacity`.
+    acquire() blocks until enough tokens are available (or `timeout` passes).
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens: float = 1.0, timeout: float = None) -> bool:
+        tokens = min(tokens, self.capacity)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait_s = (tokens - self._tokens) / self.rate if self.rate > 0 else math.inf
+            if deadline is not None:
+                wait_s = min(wait_s, deadline - time.monotonic())
+                if wait_s <= 0:
+                    return False
+            time.sleep(wait_s)
+
+    def reserve(self, tokens: float) -> float:
+        """
+        Non-blocking acquire for async callers: takes `tokens` now (the balance may go
+        negative) and returns how many seconds to wait before using them.
+        """
+        tokens = min(tokens, self.capacity)
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate if self.rate > 0 else math.inf
+
+    def release(self, tokens: float) -> None:
+        """Give back tokens reserved but not used (e.g. an over-estimated LLM call)."""
+        if tokens > 0:
+            with self._lock:
+                self._tokens = min(self.capacity, self._tokens + tokens)
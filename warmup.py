@@ -0,0 +1,140 @@
+"""
+warmup.py
+
+Process-wide startup: loads the spaCy model (or starts the NER worker pool when
+NER_WORKERS > 0), the gazetteer index, the agents and the HTTP clients once per
+process and keeps them in a shared registry.
+
+Contains:
+- warmup(): idempotent, thread-safe; returns readiness().
+- get_agent(name): shared "risk" / "advisory" / "emergency" / "combined" agent instances.
+- readiness(): {"ready", "timings_ms", "errors", ...} health signal with cold-start timings.
+
+Usage (build/deploy time):
+    python warmup.py --download   # install the spaCy model if missing, then warm up
+
+Notes:
+- Nothing here downloads at request time; --download is for the build step only.
+- In Streamlit, wrap warmup() in st.cache_resource so reruns/sessions share one registry.
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import nlp
+from gazetteer import get_gazetteer
+from ner_service import NER_WORKERS, get_ner_service
+from agents import AgentBase, RiskAssessmentAgent, AdvisoryAgent, EmergencyAgent, CombinedAgent
+from llm_client import get_llm_client
+from tools import get_serper_client
+
+_lock = threading.Lock()
+_agents: Dict[str, AgentBase] = {}
+_state: Dict[str, Any] = {
+    "ready": False,
+    "warmed": False,
+    "timings_ms": {},
+    "errors": {},
+    "cold_start_ms": None,
+}
+
+
+def _step(name: str, fn) -> None:
+    start = time.perf_counter()
+    try:
+        fn()
+    except Exception as e:
+        _state["errors"][name] = str(e)
+    _state["timings_ms"][name] = round((time.perf_counter() - start) * 1000, 1)
+
+
+def _load_spacy() -> None:
+    if nlp._lazy_load_spacy() is None:
+        raise RuntimeError(nlp.spacy_load_error())
+
+
+def _load_gazetteer() -> None:
+    # builds the mmap'd index on first start (or when the TSV changed)
+    if get_gazetteer() is None:
+        raise RuntimeError("gazetteer unavailable (see GAZETTEER_PATH)")
+
+
+def _start_ner_workers() -> None:
+    service = get_ner_service()
+    if service is not None:
+        service.warm()
+
+
+def _build_agents() -> None:
+    _agents["risk"] = RiskAssessmentAgent()
+    _agents["advisory"] = AdvisoryAgent()
+    _agents["emergency"] = EmergencyAgent()
+    _agents["combined"] = CombinedAgent()
+
+
+def _init_clients() -> None:
+    get_serper_client()
+    # start the LLM event loop and client now instead of on the first LLM call
+    get_llm_client().start()
+
+
+def warmup() -> Dict[str, Any]:
+    with _lock:
+        if not _state["warmed"]:
+            start = time.perf_counter()
+            if NER_WORKERS > 0:
+                # the model lives in the NER worker processes only
+                _step("ner_workers", _start_ner_workers)
+            else:
+                _step("spacy", _load_spacy)
+            _step("gazetteer", _load_gazetteer)
+            _step("agents", _build_agents)
+            _step("clients", _init_clients)
+            _state["cold_start_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            _state["warmed"] = True
+            _state["ready"] = not _state["errors"]
+            print("warmup:", json.dumps(_state))
+    return readiness()
+
+
+def get_agent(name: str) -> AgentBase:
+    if name not in _agents:
+        warmup()
+    return _agents[name]
+
+
+def readiness() -> Dict[str, Any]:
+    out = dict(_state)
+    out["timings_ms"] = dict(_state["timings_ms"])
+    out["errors"] = dict(_state["errors"])
+    return out
+
+
+def download_model(model: Optional[str] = None) -> None:
+    """Build-time only: install the spaCy model if it isn't importable yet."""
+    import spacy
+    model = model or nlp.SPACY_MODEL
+    try:
+        spacy.load(model)
+    except OSError:
+        from spacy.cli import download
+        download(model)
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Warm up (and optionally install) runtime resources.")
+    ap.add_argument("--download", action="store_true", help="install the spaCy model if missing")
+    args = ap.parse_args(argv)
+    if args.download:
+        download_model()
+    state = warmup()
+    print(json.dumps(state, indent=2))
+    return 0 if state["ready"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())